@@ -0,0 +1,98 @@
+r'''Generation time, cache load time, and accuracy of generated equations of
+motion.
+
+The equations of motion of the double pendulum and the sliding block pendulum
+are generated from their Lagrangians, both with a cold cache and with a warm
+one, and compared with the hand derived ones in ``DoublePendulum2DSim`` and
+``SlidingBlockPendulum``. It fails if any acceleration is off by more than the
+tolerance. Needs sympy::
+
+    python benchmarks/bench_codegen.py
+'''
+import argparse
+import sys
+import tempfile
+import time
+
+import numpy as np
+import sympy
+import physics_sims
+from physics_sims import codegen
+
+def double_pendulum_lagrangian():
+    theta0, theta1, omega0, omega1 = sympy.symbols('theta0 theta1 omega0 omega1')
+    m0, m1, R0, R1, g = sympy.symbols('m0 m1 R0 R1 g')
+    x0, y0 = R0 * sympy.sin(theta0), -R0 * sympy.cos(theta0)
+    x1, y1 = x0 + R1 * sympy.sin(theta1), y0 - R1 * sympy.cos(theta1)
+    T = sum(
+        m / 2 * ((sympy.diff(x, theta0) * omega0 + sympy.diff(x, theta1) * omega1)**2
+                 + (sympy.diff(y, theta0) * omega0 + sympy.diff(y, theta1) * omega1)**2)
+        for m, x, y in [(m0, x0, y0), (m1, x1, y1)])
+    V = g * (m0 * y0 + m1 * y1)
+    return T - V, [theta0, theta1], [omega0, omega1], [m0, m1, R0, R1, g]
+
+def sliding_block_lagrangian():
+    x, th, xd, thd = sympy.symbols('x th xd thd')
+    m1, m2, R, g = sympy.symbols('m1 m2 R g')
+    T = m1 / 2 * xd**2 + m2 / 2 * (xd**2 + 2 * R * xd * thd * sympy.cos(th) + R**2 * thd**2)
+    V = -m2 * g * R * sympy.cos(th)
+    return T - V, [x, th], [xd, thd], [m1, m2, R, g]
+
+def generate(lagrangian, solve):
+    # Time generating the function with a cold cache, and loading it again
+    # from the warm cache
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        codegen.lagrangian_acceleration(*lagrangian, solve=solve, cache_dir=cache_dir)
+        cold = time.perf_counter() - start
+
+        codegen._loaded.clear()
+        start = time.perf_counter()
+        function = codegen.lagrangian_acceleration(*lagrangian, solve=solve, cache_dir=cache_dir)
+        warm = time.perf_counter() - start
+    return function, cold, warm
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--ensemble', type=int, default=100_000)
+    parser.add_argument('--tolerance', type=float, default=1e-9,
+                        help='largest difference allowed from the hand derived accelerations')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    q = rng.uniform(-np.pi, np.pi, (args.ensemble, 2))
+    q_dot = rng.uniform(-2, 2, (args.ensemble, 2))
+
+    double = physics_sims.DoublePendulum2DSim(theta=q, omega=q_dot, m=(1, 1.5), R=(2, 1), dtype=np.float64)
+    block = physics_sims.SlidingBlockPendulum()
+    cases = [
+        ('double pendulum', double_pendulum_lagrangian(), (1.0, 1.5, 2.0, 1.0, double.g),
+         lambda: double.calc_alpha(q, q_dot)),
+        ('sliding block', sliding_block_lagrangian(), (block.m1, block.m2, block.R, block.g),
+         lambda: np.stack([block.calc_xdd(q[:, 1], q_dot[:, 1]), block.calc_thdd(q[:, 1], q_dot[:, 1])], axis=-1)),
+    ]
+
+    failed = False
+    for name, lagrangian, params, hand in cases:
+        start = time.perf_counter()
+        expected = hand()
+        hand_seconds = time.perf_counter() - start
+
+        for solve in ['symbolic', 'numeric']:
+            function, cold, warm = generate(lagrangian, solve)
+            start = time.perf_counter()
+            result = function(0, q, q_dot, *params)
+            seconds = time.perf_counter() - start
+
+            error = np.max(np.abs(result - expected))
+            print(
+                f'{name:16} {solve:9} generate {1e3 * cold:7.1f} ms  cached {1e3 * warm:5.1f} ms  '
+                f'evaluate {1e3 * seconds:6.1f} ms (hand derived {1e3 * hand_seconds:.1f} ms)  error {error:.2e}')
+            failed |= error > args.tolerance
+
+    if failed:
+        print(f'FAIL: a generated acceleration is off by more than {args.tolerance:g}')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+r'''Accuracy gain and speed cost of compensated summation in the integrators.
+
+An ensemble of harmonic oscillators is stepped for many steps with each of
+``velocity_verlet``, ``verlet_symplectic``, and ``runge_kutta_4th_order``, in
+float32, in float32 with compensated summation, and in float64. For each run,
+the time per step, the drift of the energy by the end, and the largest
+difference in position from the float64 run of the same integrator are
+reported. Since the runs only differ in rounding, that difference is the
+rounding error of the low precision run. It fails if compensation doesn't
+reduce the rounding error of float32 by at least the given factor::
+
+    python benchmarks/bench_compensated.py
+'''
+import argparse
+import sys
+import time
+
+import numpy as np
+from physics_sims import integrators
+
+# Spring constant over mass of every oscillator
+OMEGA_SQUARED = 4.0
+
+def calc_acceleration(t, x, v):
+    return -OMEGA_SQUARED * x
+
+def calc_q_dot(p):
+    return p
+
+def calc_p_dot(q):
+    return -OMEGA_SQUARED * q
+
+def run(integrator, dtype, compensated, ensemble, steps, time_delta):
+    r'''Step the ensemble, giving the final positions and time, the largest
+    energy drift at the end, and the time per step.
+    '''
+    # Start every run from the same float32 values, so the runs only differ
+    # in the rounding of their steps
+    x = np.linspace(0.5, 1.5, ensemble).astype(np.float32).astype(dtype)
+    v = np.zeros(ensemble, dtype=dtype)
+    a = calc_acceleration(0, x, v)
+    t = dtype(0)
+    compensation = (0, 0, 0) if compensated else None
+    energy0 = energy(x, v)
+
+    start = time.perf_counter()
+    for step in range(steps):
+        if integrator == 'velocity_verlet':
+            result = integrators.velocity_verlet(
+                time_delta, t, x, v, a, calc_acceleration, compensation=compensation)
+            t, x, v, a = result[:4]
+        elif integrator == 'verlet_symplectic':
+            result = integrators.verlet_symplectic(
+                time_delta, t, x, v, calc_q_dot, calc_p_dot, compensation=compensation)
+            t, x, v = result[:3]
+        else:
+            result = integrators.runge_kutta_4th_order(
+                time_delta, t, x, v, calc_acceleration, compensation=compensation)
+            t, x, v = result[:3]
+        if compensated:
+            compensation = result[-1]
+    seconds = (time.perf_counter() - start) / steps
+
+    drift = np.max(np.abs(energy(x, v) - energy0))
+    return x, float(t), drift, seconds
+
+def energy(x, v):
+    x = x.astype(np.float64)
+    v = v.astype(np.float64)
+    return 0.5 * v**2 + 0.5 * OMEGA_SQUARED * x**2
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--ensemble', type=int, default=10_000)
+    parser.add_argument('--steps', type=int, default=50_000)
+    parser.add_argument('--time-delta', type=float, default=1e-3)
+    parser.add_argument('--min-gain', type=float, default=10,
+                        help='smallest factor that compensation must reduce the float32 rounding error by')
+    args = parser.parse_args()
+    # Likewise, a time step that float32 can hold exactly
+    time_delta = float(np.float32(args.time_delta))
+
+    failed = False
+    for integrator in ['velocity_verlet', 'verlet_symplectic', 'runge_kutta_4th_order']:
+        reference, *_ = run(integrator, np.float64, False, args.ensemble, args.steps, time_delta)
+        errors = {}
+        for name, dtype, compensated in [
+                ('float32', np.float32, False),
+                ('float32 compensated', np.float32, True),
+                ('float64', np.float64, False)]:
+            x, t, drift, seconds = run(integrator, dtype, compensated, args.ensemble, args.steps, time_delta)
+            errors[name] = np.max(np.abs(x.astype(np.float64) - reference))
+            print(
+                f'{integrator:22} {name:20} {1e6 * seconds:8.1f} us/step  t {t:<12.7g} '
+                f'energy drift {drift:.2e}  rounding error {errors[name]:.2e}')
+
+        gain = errors['float32'] / max(errors['float32 compensated'], np.finfo(np.float64).tiny)
+        print(f'{integrator:22} compensation reduces the float32 rounding error {gain:.0f}x')
+        failed |= gain < args.min_gain
+
+    if failed:
+        print(f'FAIL: compensation reduced the float32 rounding error by less than {args.min_gain:g}x')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+r'''Frame time of ``SimRunner.draw_dots``.
+
+The time to draw 100,000 dots onto a frame is measured with one color for
+all of them and with a color for each, through ``SimRunner.render_headless``::
+
+    python benchmarks/bench_dots.py
+
+It fails if either takes longer than a frame at 60 FPS.
+'''
+import argparse
+import sys
+import time
+
+import numpy as np
+import physics_sims
+
+# Longest time in seconds that drawing the dots can take
+BUDGET = 1 / 60
+
+class Dots(physics_sims.Sim):
+    # Sim that only draws dots, timing each call to `draw_dots`
+    def __init__(self, positions, colors):
+        self.positions = positions
+        self.colors = colors
+        self.times = []
+
+    def update(self, sim_runner, dt):
+        pass
+
+    def state(self):
+        return None
+
+    def draw(self, sim_runner):
+        start = time.perf_counter()
+        sim_runner.draw_dots(self.positions, self.colors)
+        self.times.append(time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--dots', type=int, default=100_000)
+    parser.add_argument('--frames', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    positions = rng.uniform(-5, 5, (args.dots, 2))
+
+    failed = False
+    for name, colors in [
+            ('one color', None),
+            ('per-dot colors', rng.integers(0, 256, (args.dots, 3)))]:
+        sim = Dots(positions, colors)
+        physics_sims.SimRunner().render_headless(sim, (args.frames - 1) / 60, fps=60)
+        seconds = min(sim.times)
+        print(f'{name:15} {args.dots} dots: {1e3 * seconds:.1f} ms/frame')
+        failed |= seconds > BUDGET
+
+    if failed:
+        print(f'FAIL: drawing the dots took longer than {1e3 * BUDGET:.1f} ms')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+r'''Time of importing ``physics_sims``.
+
+Worker processes of sweeps import the package every time they start, so the
+import has to stay cheap. This times ``python -c "import physics_sims"``
+against an empty interpreter start, and lists any heavy modules that the
+import loaded::
+
+    python benchmarks/bench_import.py
+
+``tests/test_import.py`` fails if the import takes longer than its cap, or
+loads pygame or numpy.
+'''
+import argparse
+import subprocess
+import sys
+import time
+
+def best_time(code, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    heavy_modules = subprocess.run(
+        [sys.executable, '-c',
+         'import sys, physics_sims; print(*sorted({"pygame", "numpy"} & set(sys.modules)))'],
+        check=True, capture_output=True, text=True).stdout.split()
+
+    import_ms = 1e3 * (best_time('import physics_sims', args.repeat) - best_time('pass', args.repeat))
+    print(f'import physics_sims: {import_ms:.1f} ms')
+    print(f'heavy modules loaded: {", ".join(heavy_modules) or "none"}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+r'''Memory allocated per step by the functional integrators and by the
+allocation free integrator classes.
+
+An ensemble of harmonic oscillators is stepped with ``velocity_verlet``,
+``verlet_symplectic``, and ``runge_kutta_4th_order``, and with the
+``VelocityVerlet``, ``VerletSymplectic``, and ``RK4`` classes, whose callbacks
+write into ``out``. For each, the time per step, the number of arrays
+allocated in a step, and the most memory allocated during a step are
+reported, along with the number of state sized arrays that the memory amounts
+to. It fails if any of the classes allocates arrays while stepping::
+
+    python benchmarks/bench_integrators.py
+'''
+import argparse
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from physics_sims import integrators
+
+OMEGA_SQUARED = 4.0
+
+def calc_acceleration(t, x, v):
+    return -OMEGA_SQUARED * x
+
+def calc_acceleration_out(t, x, v, out):
+    return np.multiply(x, -OMEGA_SQUARED, out=out)
+
+def calc_q_dot(p):
+    return p
+
+def calc_q_dot_out(p, out):
+    return np.copyto(out, p)
+
+def calc_p_dot(q):
+    return -OMEGA_SQUARED * q
+
+def calc_p_dot_out(q, out):
+    return np.multiply(q, -OMEGA_SQUARED, out=out)
+
+class CountingArray(np.ndarray):
+    # Array that counts the ufunc calls on it that allocate their result,
+    # rather than writing it into `out`. Results are counting arrays too, so
+    # everything computed from the state is counted.
+    count = 0
+
+    def __array_ufunc__(self, ufunc, method, *inputs, out=None, **kwargs):
+        inputs = [x.view(np.ndarray) if isinstance(x, CountingArray) else x for x in inputs]
+        if out is not None:
+            kwargs['out'] = tuple(x.view(np.ndarray) if isinstance(x, CountingArray) else x for x in out)
+            getattr(ufunc, method)(*inputs, **kwargs)
+            return out[0] if len(out) == 1 else out
+
+        CountingArray.count += ufunc.nout
+        result = getattr(ufunc, method)(*inputs, **kwargs)
+        if ufunc.nout > 1:
+            return tuple(x.view(CountingArray) for x in result)
+        return result.view(CountingArray) if isinstance(result, np.ndarray) else result
+
+def make_steppers(shape, dtype):
+    # Map each case to a function that takes one step of the state
+    # `[t, x, v, a]`
+    velocity_verlet = integrators.VelocityVerlet(shape, dtype)
+    verlet_symplectic = integrators.VerletSymplectic(shape, dtype)
+    rk4 = integrators.RK4(shape, dtype)
+
+    def step_velocity_verlet(dt, state):
+        state[:] = integrators.velocity_verlet(dt, *state, calc_acceleration)
+
+    def step_verlet_symplectic(dt, state):
+        state[:3] = integrators.verlet_symplectic(dt, *state[:3], calc_q_dot, calc_p_dot)
+
+    def step_rk4(dt, state):
+        state[:3] = integrators.runge_kutta_4th_order(dt, *state[:3], calc_acceleration)
+
+    def step_velocity_verlet_class(dt, state):
+        state[0] = velocity_verlet.step(dt, *state, calc_acceleration_out)
+
+    def step_verlet_symplectic_class(dt, state):
+        state[0] = verlet_symplectic.step(dt, *state[:3], calc_q_dot_out, calc_p_dot_out)
+
+    def step_rk4_class(dt, state):
+        state[0] = rk4.step(dt, *state[:3], calc_acceleration_out)
+
+    return [
+        ('velocity_verlet', step_velocity_verlet),
+        ('VelocityVerlet', step_velocity_verlet_class),
+        ('verlet_symplectic', step_verlet_symplectic),
+        ('VerletSymplectic', step_verlet_symplectic_class),
+        ('runge_kutta_4th_order', step_rk4),
+        ('RK4', step_rk4_class),
+    ]
+
+def measure(step, state, steps, time_delta):
+    r'''Time the steps, and find the number of arrays allocated per step, and
+    the most memory allocated during any one of them, in bytes.
+    '''
+    # Warm up, so that anything allocated on first use isn't counted
+    step(time_delta, state)
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        step(time_delta, state)
+    seconds = (time.perf_counter() - start) / steps
+
+    tracemalloc.start()
+    allocated = 0
+    for _ in range(steps):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        step(time_delta, state)
+        _, peak = tracemalloc.get_traced_memory()
+        allocated = max(allocated, peak - before)
+    tracemalloc.stop()
+
+    # Count the allocations on a separate run, since counting slows the steps
+    counting = [x.view(CountingArray) if isinstance(x, np.ndarray) else x for x in state]
+    CountingArray.count = 0
+    for _ in range(steps):
+        step(time_delta, counting)
+    return seconds, CountingArray.count / steps, allocated
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--ensemble', type=int, default=1_000_000)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--dtype', default='float32', choices=['float32', 'float64'])
+    args = parser.parse_args()
+
+    dtype = np.dtype(args.dtype)
+    shape = (args.ensemble,)
+    state_nbytes = args.ensemble * dtype.itemsize
+
+    failed = False
+    for name, step in make_steppers(shape, dtype):
+        x = np.linspace(0.5, 1.5, args.ensemble).astype(dtype)
+        v = np.zeros(shape, dtype=dtype)
+        state = [0.0, x, v, calc_acceleration(0, x, v)]
+        seconds, arrays, allocated = measure(step, state, args.steps, 1e-3)
+        print(
+            f'{name:22} {1e3 * seconds:8.2f} ms/step  allocates {arrays:4.1f} arrays/step, '
+            f'peak {allocated:>11,} bytes/step ({allocated / state_nbytes:.1f} state arrays)')
+        # Anything less than a state array is Python objects, like the time
+        if name[0].isupper() and (arrays > 0 or allocated >= state_nbytes):
+            failed = True
+
+    if failed:
+        print('FAIL: an integrator class allocated arrays while stepping')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
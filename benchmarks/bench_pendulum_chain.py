@@ -0,0 +1,38 @@
+r'''Step rate of ``PendulumChain2DSim``.
+
+The step rate is measured for ensembles of chains with 10 and 50 links::
+
+    python benchmarks/bench_pendulum_chain.py
+
+The check that a two link chain matches ``DoublePendulum2DSim`` is in
+``tests/test_pendulum_chain.py``.
+'''
+import argparse
+import time
+
+import numpy as np
+import physics_sims
+
+def step_rate(sim, steps, time_delta):
+    sim_runner = physics_sims.SimRunner()
+    sim.advance(sim_runner, 1, time_delta)
+    start = time.perf_counter()
+    sim.advance(sim_runner, steps, time_delta)
+    return (time.perf_counter() - start) / steps
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--steps', type=int, default=10)
+    args = parser.parse_args()
+
+    for num_links, ensemble in [(10, 10_000), (50, 1_000)]:
+        sim = physics_sims.PendulumChain2DSim(
+            theta=np.random.default_rng(0).uniform(-1, 1, (ensemble, num_links)),
+            R=1 / num_links, dtype=np.float64)
+        seconds = step_rate(sim, args.steps, 1e-3)
+        print(
+            f'{num_links:3} links x {ensemble} chains: {1e3 * seconds:.1f} ms/step, '
+            f'{ensemble / seconds:.3g} chain steps/s')
+
+if __name__ == '__main__':
+    main()
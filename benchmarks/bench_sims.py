@@ -0,0 +1,234 @@
+r'''Throughput and work-precision benchmarks for the sims.
+
+Every sim registered in ``physics_sims.SIMS`` is run headless under each integrator
+that applies to it, in float32 and float64, at each of a few time steps. For
+each run, the time per step, the peak memory, and the largest drift of the
+total energy over the run are recorded. Sims with a closed form solution
+also record the largest error of any field against it. Runs of the same sim and integrator at
+different time steps give work-precision data.
+
+Run the benchmarks and save the results::
+
+    python benchmarks/bench_sims.py --out results.json
+
+Compare against the stored baseline, failing if any case got slower by more
+than the threshold, or has no entry in the baseline::
+
+    python benchmarks/bench_sims.py --compare benchmarks/baseline.json
+
+Timings depend on the machine, so the baseline should be regenerated with
+``--out benchmarks/baseline.json`` when moving to a different one, and
+whenever cases are added.
+'''
+import argparse
+import inspect
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import physics_sims
+from physics_sims import integrators
+
+# The integrator that each sim steps with. Sims that take a `scheme` are run
+# under each of the symplectic schemes instead.
+INTEGRATORS = {
+    physics_sims.ConstantForce1DSim: 'velocity_verlet',
+    physics_sims.Oscillator1DSim: 'velocity_verlet',
+    physics_sims.Pendulum2DSim: 'velocity_verlet',
+    physics_sims.TwoParticleSpring1DSim: 'velocity_verlet',
+    physics_sims.ConstantForceSR1DSim: 'runge_kutta_4th_order',
+    physics_sims.DoublePendulum2DSim: 'runge_kutta_4th_order',
+    physics_sims.PendulumChain2DSim: 'runge_kutta_4th_order',
+    physics_sims.Oscillator1DSRSim: 'runge_kutta_4th_order',
+    physics_sims.Oscillator1DSRBoostSim: 'runge_kutta_4th_order',
+    physics_sims.ScalarFieldSimple1DSim: 'runge_kutta_4th_order',
+    physics_sims.SlidingBlockPendulum: 'runge_kutta_4th_order',
+    physics_sims.SpringLatticeSim: 'velocity_verlet',
+}
+
+# Sims that need more than their default arguments, mapped to functions that
+# make a small example of them
+FACTORIES = {
+    physics_sims.SpringLatticeSim: lambda **kwargs: physics_sims.SpringLatticeSim.chain(
+        64, v=np.sin(np.arange(64))[:, None], **kwargs),
+    # Heavy enough that the run stays well clear of the singularity at
+    # `m + k x = 0`, which the default mass reaches before t = 5
+    physics_sims.ScalarFieldSimple1DSim: lambda **kwargs: physics_sims.ScalarFieldSimple1DSim(m=2.5, **kwargs),
+}
+
+SCHEMES = {
+    'verlet_symplectic': integrators.VERLET,
+    'yoshida_4th_order': integrators.YOSHIDA_4TH_ORDER,
+    'omelyan': integrators.OMELYAN,
+}
+
+DTYPES = {'float32': np.float32, 'float64': np.float64}
+
+def sim_classes():
+    return [physics_sims.get_sim(name) for name in sorted(physics_sims.SIMS)]
+
+def cases():
+    # Yields `(sim name, integrator name, dtype name, sim factory)`
+    for cls in sim_classes():
+        integrator_kwargs = {}
+        takes_scheme = 'scheme' in inspect.signature(cls).parameters
+        if cls in INTEGRATORS or not takes_scheme:
+            integrator_kwargs[INTEGRATORS.get(cls, 'unknown')] = {}
+        if takes_scheme:
+            integrator_kwargs.update({name: {'scheme': scheme} for name, scheme in SCHEMES.items()})
+        make = FACTORIES.get(cls, cls)
+
+        for integrator_name, kwargs in integrator_kwargs.items():
+            for dtype_name, dtype in DTYPES.items():
+                yield (
+                    cls.__name__, integrator_name, dtype_name,
+                    lambda make=make, kwargs=kwargs, dtype=dtype: make(**kwargs, dtype=dtype))
+
+def run_case(make_sim, run_time, time_delta, record_every, repeat):
+    sim_runner = physics_sims.SimRunner()
+    num_steps = int(round(run_time / time_delta))
+
+    seconds = float('inf')
+    for _ in range(repeat):
+        sim = make_sim()
+        start = time.perf_counter()
+        states = sim_runner.run_headless(
+            sim, run_time, time_delta=time_delta, record_every=record_every)
+        seconds = min(seconds, time.perf_counter() - start)
+
+    # Memory is measured in a separate run, since tracing slows it down
+    tracemalloc.start()
+    sim_runner.run_headless(make_sim(), run_time, time_delta=time_delta, record_every=record_every)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # The total energy is the last field of every sim's state
+    energy = states[:, -1].astype(np.float64)
+    energy_drift = float(np.max(np.abs(energy - energy[0])))
+
+    # The time field is left out, since it holds the same steps either way
+    solution_error = None
+    if make_sim().solution(np.zeros(0)) is not None:
+        reference = sim_runner.run_headless(
+            make_sim(), run_time, time_delta=time_delta, record_every=record_every, analytic=True)
+        solution_error = float(np.max(physics_sims.max_error(states, reference)[1:]))
+
+    return {
+        'state_dtype': str(states.dtype),
+        'steps': num_steps,
+        'seconds': seconds,
+        'ns_per_step': 1e9 * seconds / num_steps,
+        'steps_per_sec': num_steps / seconds,
+        'peak_memory_bytes': peak_memory,
+        'energy_drift': energy_drift,
+        'relative_energy_drift': energy_drift / abs(energy[0]) if energy[0] != 0 else None,
+        'solution_error': solution_error,
+    }
+
+def run_benchmarks(args):
+    physics_sims.set_backend(args.backend)
+    results = []
+
+    for sim_name, integrator_name, dtype_name, make_sim in cases():
+        if args.filter and args.filter not in sim_name:
+            continue
+
+        # Compile and warm up caches before timing
+        physics_sims.SimRunner().run_headless(
+            make_sim(), 10 * args.time_deltas[0], time_delta=args.time_deltas[0])
+
+        for time_delta in args.time_deltas:
+            result = {
+                'sim': sim_name,
+                'integrator': integrator_name,
+                'dtype': dtype_name,
+                'time_delta': time_delta,
+            }
+            result.update(run_case(make_sim, args.run_time, time_delta, args.record_every, args.repeat))
+            results.append(result)
+            print(
+                f'{sim_name:28} {integrator_name:22} {dtype_name:8} dt={time_delta:<8g} '
+                f'{result["ns_per_step"]:10.0f} ns/step  energy drift {result["energy_drift"]:.3g}'
+                + ('' if result['solution_error'] is None else f'  error {result["solution_error"]:.3g}'),
+                flush=True)
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'backend': args.backend,
+            'run_time': args.run_time,
+            'record_every': args.record_every,
+        },
+        'results': results,
+    }
+
+def case_key(result):
+    return (result['sim'], result['integrator'], result['dtype'], result['time_delta'])
+
+def compare(current, baseline, threshold):
+    r'''Find the cases that got slower than the baseline by more than
+    ``threshold``, as a fraction of the baseline time per step, and the
+    cases that the baseline has no entry for.
+
+    Returns:
+        Tuple of the list of ``(case key, baseline ns/step, current ns/step)``
+        of each regression, and the list of case keys missing from the
+        baseline
+    '''
+    baseline_results = {case_key(result): result for result in baseline['results']}
+    regressions = []
+    missing = []
+
+    for result in current['results']:
+        key = case_key(result)
+        if key not in baseline_results:
+            missing.append(key)
+            continue
+        before = baseline_results[key]['ns_per_step']
+        after = result['ns_per_step']
+        if after > before * (1 + threshold):
+            regressions.append((key, before, after))
+
+    return regressions, missing
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--out', help='path of a JSON file to save the results in')
+    parser.add_argument('--compare', metavar='BASELINE', help='path of a JSON baseline to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fraction by which a case can be slower than the baseline before it is flagged')
+    parser.add_argument('--run-time', type=float, default=10.0)
+    parser.add_argument('--time-deltas', type=float, nargs='+', default=[1e-2, 1e-3])
+    parser.add_argument('--record-every', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--backend', default='numpy', choices=['numpy', 'numba'])
+    parser.add_argument('--filter', help='only run sims whose name contains this')
+    args = parser.parse_args()
+
+    current = run_benchmarks(args)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions, missing = compare(current, baseline, args.threshold)
+        for key, before, after in regressions:
+            print(f'REGRESSION {" ".join(map(str, key))}: {before:.0f} -> {after:.0f} ns/step')
+        # A case without a baseline could regress unnoticed, so the baseline
+        # has to be regenerated whenever cases are added
+        for key in missing:
+            print(f'MISSING {" ".join(map(str, key))}: not in the baseline')
+        if regressions or missing:
+            sys.exit(1)
+        print('no regressions')
+
+if __name__ == '__main__':
+    main()
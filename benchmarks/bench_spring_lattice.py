@@ -0,0 +1,39 @@
+r'''Step rate of ``SpringLatticeSim``.
+
+The step rate is measured for a chain and a square mesh of about a million
+particles each::
+
+    python benchmarks/bench_spring_lattice.py
+
+The check of the normal mode frequencies of a periodic chain against the
+phonon dispersion relation is in ``tests/test_spring_lattice.py``.
+'''
+import argparse
+import time
+
+import numpy as np
+import physics_sims
+
+def step_rate(sim, steps, time_delta):
+    sim_runner = physics_sims.SimRunner()
+    # Allocate the scratch arrays before timing
+    sim.advance(sim_runner, 2, time_delta)
+    start = time.perf_counter()
+    sim.advance(sim_runner, steps, time_delta)
+    return (time.perf_counter() - start) / steps
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--particles', type=int, default=1_000_000)
+    parser.add_argument('--steps', type=int, default=20)
+    args = parser.parse_args()
+
+    side = int(round(np.sqrt(args.particles)))
+    for name, sim in [
+            ('chain', physics_sims.SpringLatticeSim.chain(args.particles)),
+            ('mesh', physics_sims.SpringLatticeSim.mesh((side, side)))]:
+        seconds = step_rate(sim, args.steps, 0.01)
+        print(f'{name:6} {sim.x.shape[0]} particles: {1e3 * seconds:.1f} ms/step, {1 / seconds:.1f} steps/s')
+
+if __name__ == '__main__':
+    main()
@@ -251,13 +251,7 @@ class InteractiveEinsteinianSim(physics_sims.Sim):
             B,
             (self.objects_X - np.array([self.t, self.x])).T,
         ).T
-        for object_X in objects_X_prime:
-            pygame.draw.circle(
-                sim_runner._screen,
-                (150, 90, 40),
-                sim_runner.convert_to_draw_position([object_X[1], object_X[0]]),
-                5
-            )
+        sim_runner.draw_dots(objects_X_prime[:, [1, 0]], (150, 90, 40))
 
         # Player
         pygame.draw.circle(
@@ -1,16 +1,66 @@
+import importlib
+
 from .sim import Sim
-from .sim_runner import SimRunner
-from .constant_force import ConstantForce1DSim
-from .constant_force_sr import ConstantForceSR1DSim
-from .double_pendulum_2d import DoublePendulum2DSim
-from .oscillator_1d import Oscillator1DSim
-from .oscillator_1d_phase import Oscillator1DPhaseSim
-from .oscillator_1d_sr import Oscillator1DSRSim
-from .oscillator_1d_sr_phase import Oscillator1DSRPhaseSim
-from .oscillator_1d_sr_boost import Oscillator1DSRBoostSim
-from .pendulum_2d import Pendulum2DSim
-from .pendulum_2d_phase import Pendulum2DPhaseSim
-from .two_particle_spring_1d import TwoParticleSpring1DSim
-from .two_particle_spring_1d_phase import TwoParticleSpring1DPhaseSim
 
-from . import integrators
\ No newline at end of file
+# Sims in this package, mapped to the modules that define them. Like the rest
+# of the package, they are only imported when they are first used, so that
+# importing the package stays fast.
+SIMS = {
+    'ConstantForce1DSim': 'constant_force',
+    'ConstantForceSR1DSim': 'constant_force_sr',
+    'DoublePendulum2DSim': 'double_pendulum_2d',
+    'Oscillator1DSim': 'oscillator_1d',
+    'Oscillator1DPhaseSim': 'oscillator_1d_phase',
+    'Oscillator1DSRSim': 'oscillator_1d_sr',
+    'Oscillator1DSRPhaseSim': 'oscillator_1d_sr_phase',
+    'Oscillator1DSRBoostSim': 'oscillator_1d_sr_boost',
+    'Pendulum2DSim': 'pendulum_2d',
+    'Pendulum2DPhaseSim': 'pendulum_2d_phase',
+    'PendulumChain2DSim': 'pendulum_chain_2d',
+    'ScalarFieldSimple1DSim': 'scalar_field_simple',
+    'SlidingBlockPendulum': 'sliding_block_pendulum',
+    'TwoParticleSpring1DSim': 'two_particle_spring_1d',
+    'TwoParticleSpring1DPhaseSim': 'two_particle_spring_1d_phase',
+    'SpringLatticeSim': 'spring_lattice',
+}
+
+# Everything else that the package exports, mapped to the modules that
+# define it
+_EXPORTS = {
+    'Diagnostics': 'diagnostics',
+    'double_pendulum_chaos_map': 'chaos_maps',
+    'Event': 'events',
+    'find_events': 'events',
+    'save_checkpoint': 'checkpoint',
+    'load_checkpoint': 'checkpoint',
+    'SimRunner': 'sim_runner',
+    'Trajectory': 'trajectory',
+    'final_state': 'sim_runner',
+    'max_energy_drift': 'sim_runner',
+    'max_error': 'sim_runner',
+    'period': 'sim_runner',
+    'set_backend': 'backend',
+    'get_backend': 'backend',
+    **SIMS,
+}
+
+_SUBMODULES = ('integrators', 'backend', 'codegen')
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module(f'.{name}', __name__)
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS) | set(_SUBMODULES))
+
+def get_sim(name):
+    r'''Get a sim class by its name in :data:`SIMS`.'''
+    if name not in SIMS:
+        raise ValueError(f'expected one of {sorted(SIMS)}, but got {name!r}')
+    return getattr(importlib.import_module(f'.{SIMS[name]}', __name__), name)
@@ -0,0 +1,93 @@
+r'''Backends for the multi-step integrators.
+
+With the ``'numpy'`` backend, which is the default, the multi-step integrators
+in :mod:`physics_sims.integrators` step in Python. With the ``'numba'``
+backend, the integrator loop and the sim's acceleration function are compiled
+with numba, if it is installed.
+
+Only float64 scalar states are stepped by compiled loops, since those are the
+states where Python's overhead dominates. They give results that are bit for
+bit the same as the ``'numpy'`` backend. Everything else falls back to the
+``'numpy'`` backend. That includes every sim whose state is made of arrays,
+like :class:`DoublePendulum2DSim`, :class:`PendulumChain2DSim`,
+:class:`SpringLatticeSim`, the two particle spring sims, and
+:class:`SlidingBlockPendulum`, even when they have a single member. Compiling them
+would mean rewriting their acceleration functions in the subset of NumPy that
+numba supports, and numba's ``sin`` and ``cos`` of arrays don't round the same
+way as NumPy's, so the backends would no longer match.
+'''
+import warnings
+
+_BACKENDS = ('numpy', 'numba')
+_backend = 'numpy'
+
+# Functions that can be compiled, and the compiled versions of the ones that
+# have been used so far
+_kernels = []
+_compiled = {}
+
+def set_backend(name):
+    r'''Set the backend used by the multi-step integrators.
+
+    If ``'numba'`` is requested but numba is not installed, a warning is
+    given and the ``'numpy'`` backend is kept.
+
+    Args:
+        name: ``'numpy'`` or ``'numba'``
+    '''
+    global _backend
+
+    if name not in _BACKENDS:
+        raise ValueError(f'expected backend to be one of {_BACKENDS}, but got {name!r}')
+
+    if name == 'numba' and _backend != 'numba':
+        try:
+            import numba.extending
+        except ImportError:
+            warnings.warn("numba is not installed, so the 'numpy' backend is used instead")
+            return
+
+        for function in _kernels:
+            numba.extending.register_jitable(function)
+
+    _backend = name
+
+def get_backend():
+    r'''Get the name of the backend used by the multi-step integrators.'''
+    return _backend
+
+def kernel(function):
+    r'''Mark a function as one that the ``'numba'`` backend can compile.
+
+    The function is returned unchanged, so it can still be called from
+    Python. It can also be called from other kernels. Kernels have to stick
+    to the subset of Python and NumPy that numba supports.
+    '''
+    _kernels.append(function)
+    if _backend == 'numba':
+        import numba.extending
+        numba.extending.register_jitable(function)
+    return function
+
+def compiled(function):
+    r'''Get the compiled version of a kernel.'''
+    if function not in _compiled:
+        import numba
+        # NumPy's error model gives inf and nan rather than raising, like the
+        # 'numpy' backend does
+        _compiled[function] = numba.njit(function, error_model='numpy')
+    return _compiled[function]
+
+class bind:
+    r'''A kernel with some of its trailing arguments filled in.
+
+    Calling ``bind(function, *params)(*args)`` calls
+    ``function(*args, *params)``. Unlike a lambda, the multi-step integrators
+    can look inside it to compile ``function`` and pass ``params`` to it.
+    '''
+    def __init__(self, function, *params):
+        self.function = function
+        self.params = params
+
+    def __call__(self, *args):
+        return self.function(*args, *self.params)
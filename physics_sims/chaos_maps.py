@@ -0,0 +1,131 @@
+r'''Maps of how chaotic the double pendulum is over a grid of initial angles.
+
+Every cell of the grid is a double pendulum released from rest at one pair of
+angles ``(theta0, theta1)``. All the cells of a tile are stepped at once as a
+single batched :class:`DoublePendulum2DSim`, and tiles are spread over a pool
+of worker processes.
+
+For each cell, the map holds the time that either link first flips over the
+top, and the finite-time Lyapunov exponent, which is the average rate that
+nearby trajectories separate at.
+'''
+import multiprocessing
+import os
+
+import numpy as np
+
+from physics_sims.double_pendulum_2d import DoublePendulum2DSim
+
+# Fields of each cell of a map
+MAP_DTYPE = np.dtype([('flip_time', np.float64), ('lyapunov', np.float64)])
+
+# Size of the imaginary perturbation that carries the tangent vector
+_STEP = 1e-20
+
+def double_pendulum_chaos_map(theta0, theta1, run_time, *, time_delta=0.01, renormalize_every=10,
+                              m=(1, 1), R=(2, 2), g=9.80, out=None, tile_size=4096, workers=None):
+    r'''Compute the flip time and finite-time Lyapunov exponent of a double
+    pendulum released from rest at every pair of initial angles.
+
+    The tangent vector that the Lyapunov exponent is measured from is
+    integrated along with each trajectory by complex step differentiation.
+    The angles and angular velocities are stepped as complex numbers, with
+    the tangent vector held in a tiny imaginary part. Since the equations of
+    motion in :meth:`DoublePendulum2DSim.calc_alpha` are analytic, the
+    imaginary part evolves under the linearized equations of motion, to
+    within rounding, and with no finite difference error. Every
+    ``renormalize_every`` steps, the growth of the tangent vector is added to
+    the exponent, and the vector is scaled back to unit length, so it never
+    overflows.
+
+    Args:
+        theta0: 1D array of initial angles of the first link
+        theta1: 1D array of initial angles of the second link
+        run_time: Amount of simulation time to run each cell for
+        time_delta: Size of each time step
+        renormalize_every: Number of steps between renormalizations of the
+            tangent vector
+        m: Masses of the two links
+        R: Lengths of the two links
+        g: Gravitational acceleration
+        out: If given, path of a ``.npy`` file to write the map into. The
+            workers write their tiles straight into it, so the whole map is
+            never held in memory.
+        tile_size: Number of cells stepped together in one batch
+        workers: Number of worker processes. Defaults to the number of CPUs.
+            If 1, the tiles are done in this process.
+
+    Returns:
+        Array of shape ``(len(theta0), len(theta1))`` with dtype
+        :data:`MAP_DTYPE`. The ``'flip_time'`` of cells that never flip is
+        NaN. If ``out`` is given, this is a memmap of the file.
+    '''
+    theta0 = np.asarray(theta0, dtype=np.float64)
+    theta1 = np.asarray(theta1, dtype=np.float64)
+    shape = (len(theta0), len(theta1))
+    num_cells = shape[0] * shape[1]
+
+    params = (theta0, theta1, run_time, time_delta, renormalize_every, m, R, g, out)
+    tiles = [(params, start, min(start + tile_size, num_cells)) for start in range(0, num_cells, tile_size)]
+
+    if out is not None:
+        # Create the file up front, so the workers only have to open it
+        results = np.lib.format.open_memmap(out, mode='w+', dtype=MAP_DTYPE, shape=shape)
+        del results
+
+    if workers is None:
+        workers = os.cpu_count()
+    if workers == 1:
+        tile_results = list(map(_run_tile, tiles))
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            tile_results = pool.map(_run_tile, tiles)
+
+    if out is not None:
+        return np.load(out, mmap_mode='r+')
+    return np.concatenate(tile_results).reshape(shape)
+
+def _run_tile(tile):
+    # Compute the map for cells `start` to `stop` of the flattened grid. If
+    # the map has a file, the results are written into it rather than
+    # returned.
+    (theta0, theta1, run_time, time_delta, renormalize_every, m, R, g, out), start, stop = tile
+    cells = np.arange(start, stop)
+    theta = np.stack([theta0[cells // len(theta1)], theta1[cells % len(theta1)]], axis=-1)
+
+    # Start the tangent vector off along every direction of phase space
+    # equally
+    tangent = np.full((len(cells), 4), 0.5)
+    sim = DoublePendulum2DSim(
+        theta=theta + 1j * _STEP * tangent[:, :2],
+        omega=np.zeros_like(theta) + 1j * _STEP * tangent[:, 2:],
+        m=m, R=R, g=g, dtype=np.complex128)
+
+    flip_time = np.full(len(cells), np.nan)
+    log_growth = np.zeros(len(cells))
+    num_steps = int(np.ceil(round(run_time / time_delta, 9)))
+
+    for step in range(1, num_steps + 1):
+        sim.update(None, time_delta)
+
+        flipped = np.isnan(flip_time) & np.any(np.abs(sim.theta.real) > np.pi, axis=-1)
+        flip_time[flipped] = step * time_delta
+
+        if step % renormalize_every == 0 or step == num_steps:
+            tangent = np.concatenate([sim.theta.imag, sim.omega.imag], axis=-1) / _STEP
+            norm = np.sqrt((tangent**2).sum(axis=-1))
+            log_growth += np.log(norm)
+            tangent /= norm[:, None]
+            sim.theta = sim.theta.real + 1j * _STEP * tangent[:, :2]
+            sim.omega = sim.omega.real + 1j * _STEP * tangent[:, 2:]
+
+    results = np.empty(len(cells), dtype=MAP_DTYPE)
+    results['flip_time'] = flip_time
+    results['lyapunov'] = log_growth / (num_steps * time_delta)
+
+    if out is None:
+        return results
+
+    results_file = np.load(out, mmap_mode='r+')
+    results_file.reshape(-1)[start:stop] = results
+    results_file.flush()
@@ -0,0 +1,119 @@
+r'''Checkpoint files holding a :meth:`Sim.snapshot` of a sim.
+
+A checkpoint file is laid out as:
+
+* The magic bytes ``b'PSIMCKPT'``
+* The format version, as a little-endian uint32
+* The length of the header, as a little-endian uint32
+* The header, as UTF-8 JSON. It holds the info passed to
+  :func:`save_checkpoint`, and the name, kind, dtype, and shape of each value
+  in the snapshot.
+* The bytes of each value in the snapshot, in the order they are listed in
+  the header, each in C order
+
+Values are stored with their exact dtype, so a sim restored from a checkpoint
+steps bit for bit the same as the sim that the checkpoint was saved from.
+'''
+import json
+import os
+import struct
+
+import numpy as np
+
+_MAGIC = b'PSIMCKPT'
+_VERSION = 1
+_PREFIX = struct.Struct('<8sII')
+
+def save_checkpoint(path, snapshot, **info):
+    r'''Save a snapshot of a sim to a checkpoint file.
+
+    The file is written next to ``path`` and then moved over it, so a run
+    that is killed part way through writing never leaves a broken checkpoint
+    behind.
+
+    Args:
+        path: Path of the file to write
+        snapshot: Dict given by :meth:`Sim.snapshot`
+        **info: Anything else to store in the header, like the number of steps
+            taken. Values must be JSON serializable.
+    '''
+    fields = []
+    arrays = []
+    for name, value in snapshot.items():
+        if value is None:
+            kind = 'none'
+        elif isinstance(value, np.ndarray):
+            kind = 'array'
+        elif isinstance(value, np.generic):
+            kind = 'numpy'
+        elif isinstance(value, (bool, int, float)):
+            kind = type(value).__name__
+        else:
+            raise TypeError(f'cannot save {name!r} of type {type(value).__name__} in a checkpoint')
+
+        if value is not None:
+            array = np.asarray(value)
+            # Store multi-byte values little-endian, whatever the machine is
+            array = array.astype(array.dtype.newbyteorder('<'), copy=False)
+            fields.append({'name': name, 'kind': kind, 'dtype': array.dtype.str, 'shape': array.shape})
+            arrays.append(array)
+        else:
+            fields.append({'name': name, 'kind': kind})
+
+    header = json.dumps({'info': info, 'fields': fields}).encode()
+    tmp_path = f'{path}.tmp'
+
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREFIX.pack(_MAGIC, _VERSION, len(header)))
+        f.write(header)
+        for array in arrays:
+            f.write(array.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path):
+    r'''Load a checkpoint file saved by :func:`save_checkpoint`.
+
+    Returns:
+        ``(snapshot, info)``, where ``snapshot`` can be passed to
+        :meth:`Sim.restore`, and ``info`` is the dict of everything else that
+        was stored in the header
+    '''
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if len(data) < _PREFIX.size:
+        raise ValueError(f'{path!r} is not a checkpoint file')
+    magic, version, header_size = _PREFIX.unpack_from(data)
+    if magic != _MAGIC:
+        raise ValueError(f'{path!r} is not a checkpoint file')
+    if version != _VERSION:
+        raise ValueError(f'expected checkpoint format version {_VERSION}, but {path!r} has version {version}')
+
+    offset = _PREFIX.size + header_size
+    header = json.loads(data[_PREFIX.size:offset])
+    snapshot = {}
+
+    for field in header['fields']:
+        if field['kind'] == 'none':
+            snapshot[field['name']] = None
+            continue
+
+        dtype = np.dtype(field['dtype'])
+        shape = tuple(field['shape'])
+        count = int(np.prod(shape))
+        array = np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape(shape)
+        offset += count * dtype.itemsize
+        array = array.astype(dtype.newbyteorder('='))
+
+        if field['kind'] == 'array':
+            value = array
+        elif field['kind'] == 'numpy':
+            value = array[()]
+        else:
+            value = array.item()
+        snapshot[field['name']] = value
+
+    return snapshot, header['info']
@@ -0,0 +1,255 @@
+r'''Generate equations of motion from a symbolic Lagrangian or Hamiltonian.
+
+The equations of motion are derived with sympy, their common subexpressions
+are pulled out, and they are printed as the source of a vectorized NumPy
+function that plugs into :mod:`physics_sims.integrators`. For instance, the
+double pendulum::
+
+    import sympy
+    from physics_sims import integrators
+    from physics_sims.codegen import lagrangian_acceleration
+
+    theta0, theta1, omega0, omega1 = sympy.symbols('theta0 theta1 omega0 omega1')
+    m0, m1, R0, R1, g = sympy.symbols('m0 m1 R0 R1 g')
+    x0, y0 = R0 * sympy.sin(theta0), -R0 * sympy.cos(theta0)
+    ...
+    L = T - V
+    calc_alpha = lagrangian_acceleration(L, [theta0, theta1], [omega0, omega1], [m0, m1, R0, R1, g])
+
+    t, theta, omega = integrators.runge_kutta_4th_order(
+        dt, t, theta, omega, lambda t, theta, omega: calc_alpha(t, theta, omega, *params))
+
+The generated source is saved in a cache directory, under a hash of the
+expression and the symbols, so the derivation is only ever done once for a
+given system. Later calls, in this process or any other, load the cached
+function, and Python keeps the compiled bytecode next to it. The cache is in
+``~/.cache/physics_sims/codegen``, unless the ``PHYSICS_SIMS_CACHE``
+environment variable gives another directory.
+
+sympy is only needed by this module, and only imported when it is used.
+
+The generated functions take a sim's coordinates as arrays with the
+coordinates along the last axis, and any leading axes as batch axes. They are
+not numba kernels, so sims should wrap them in a lambda rather than
+``backend.bind``.
+'''
+import hashlib
+import importlib.util
+import os
+
+# Bump this when the generated code changes, so old cache entries are not used
+_VERSION = 1
+
+# Functions loaded so far in this process, keyed by cache key
+_loaded = {}
+
+def lagrangian_acceleration(lagrangian, q, q_dot, params=(), *, time=None, solve='symbolic', cache_dir=None):
+    r'''Generate the function that gives the generalized accelerations of a
+    system from its Lagrangian.
+
+    The Euler-Lagrange equations are linear in the accelerations,
+    ``M(q, q_dot) q_ddot = f(q, q_dot)``, with
+    ``M_ij = d^2 L / d q_dot_i d q_dot_j`` and
+    ``f_i = dL/dq_i - sum_j (d^2 L / d q_dot_i d q_j) q_dot_j - d^2 L / d q_dot_i dt``.
+
+    Args:
+        lagrangian: sympy expression of the Lagrangian
+        q: Sequence of sympy symbols of the generalized coordinates
+        q_dot: Sequence of sympy symbols of their rates of change, in the
+            same order
+        params: Sequence of sympy symbols of any other parameters, like
+            masses, which the generated function takes after the state
+        time: sympy symbol of time, if the Lagrangian depends on it
+        solve: If ``'symbolic'``, solve for the accelerations with sympy,
+            which gives the fastest code for a few coordinates. If
+            ``'numeric'``, generate ``M`` and ``f``, and solve with
+            ``np.linalg.solve`` at run time, which keeps the derivation fast
+            for many coordinates.
+        cache_dir: Directory to cache generated functions in
+
+    Returns:
+        Function of the form ``(t, q, q_dot, *params) -> q_ddot``, where
+        ``q``, ``q_dot``, and ``q_ddot`` have the coordinates along their
+        last axis, like the ``calc_acceleration`` argument of the integrators
+    '''
+    if solve not in ('symbolic', 'numeric'):
+        raise ValueError(f"expected solve to be 'symbolic' or 'numeric', but got {solve!r}")
+    sympy = _import_sympy()
+    q, q_dot, params = tuple(q), tuple(q_dot), tuple(params)
+    if len(q) != len(q_dot):
+        raise ValueError(f'expected one rate per coordinate, but got {len(q)} coordinates and {len(q_dot)} rates')
+
+    _check_symbols(lagrangian, q + q_dot + params + (() if time is None else (time,)))
+    key = _cache_key('lagrangian', solve, lagrangian, q, q_dot, params, time)
+
+    def generate():
+        momenta = [sympy.diff(lagrangian, v) for v in q_dot]
+        mass_matrix = sympy.Matrix([[sympy.diff(p, v) for v in q_dot] for p in momenta])
+        force = sympy.Matrix([
+            sympy.diff(lagrangian, q_i)
+            - sum(sympy.diff(p, q_j) * v_j for q_j, v_j in zip(q, q_dot))
+            - (0 if time is None else sympy.diff(p, time))
+            for q_i, p in zip(q, momenta)])
+
+        state = {'q': q, 'q_dot': q_dot}
+        if solve == 'symbolic':
+            return _source(
+                sympy, 'calc_acceleration', ['t', 'q', 'q_dot'], state, params, time,
+                [list(mass_matrix.LUsolve(force))],
+                'return _stack([{0}])')
+        return _source(
+            sympy, 'calc_acceleration', ['t', 'q', 'q_dot'], state, params, time,
+            [list(mass_matrix), list(force)],
+            'return _solve(_stack([{0}]), _stack([{1}]))')
+
+    return _load(key, generate, cache_dir)['calc_acceleration']
+
+def hamiltonian_derivatives(hamiltonian, q, p, params=(), *, cache_dir=None):
+    r'''Generate the functions that give the rates of change of the
+    coordinates and momenta of a system from its Hamiltonian, by Hamilton's
+    equations, ``q_dot = dH/dp`` and ``p_dot = -dH/dq``.
+
+    The Hamiltonian has to be separable, ``H = T(p) + V(q)``, like the ones
+    that the symplectic integrators step.
+
+    Args:
+        hamiltonian: sympy expression of the Hamiltonian
+        q: Sequence of sympy symbols of the generalized coordinates
+        p: Sequence of sympy symbols of their conjugate momenta, in the same
+            order
+        params: Sequence of sympy symbols of any other parameters, like
+            masses, which the generated functions take after the state
+        cache_dir: Directory to cache generated functions in
+
+    Returns:
+        Tuple of functions of the form ``(p, *params) -> q_dot`` and
+        ``(q, *params) -> p_dot``, like the ``calc_q_dot`` and
+        ``calc_p_dot`` arguments of the symplectic integrators
+    '''
+    sympy = _import_sympy()
+    q, p, params = tuple(q), tuple(p), tuple(params)
+    if len(q) != len(p):
+        raise ValueError(f'expected one momentum per coordinate, but got {len(q)} coordinates and {len(p)} momenta')
+
+    _check_symbols(hamiltonian, q + p + params)
+    q_dot = [sympy.diff(hamiltonian, p_i) for p_i in p]
+    p_dot = [-sympy.diff(hamiltonian, q_i) for q_i in q]
+    if any(expr.has(*q) for expr in q_dot) or any(expr.has(*p) for expr in p_dot):
+        raise ValueError('expected a separable Hamiltonian, H = T(p) + V(q)')
+
+    key = _cache_key('hamiltonian', '', hamiltonian, q, p, params, None)
+
+    def generate():
+        return '\n'.join([
+            _source(sympy, 'calc_q_dot', ['p'], {'p': p}, params, None, [q_dot], 'return _stack([{0}])'),
+            _source(sympy, 'calc_p_dot', ['q'], {'q': q}, params, None, [p_dot], 'return _stack([{0}])'),
+        ])
+
+    functions = _load(key, generate, cache_dir)
+    return functions['calc_q_dot'], functions['calc_p_dot']
+
+def _import_sympy():
+    try:
+        import sympy
+    except ImportError as error:
+        raise ImportError('generating equations of motion needs sympy, which is not installed') from error
+    return sympy
+
+def _check_symbols(expr, symbols):
+    unknown = expr.free_symbols - set(symbols)
+    if unknown:
+        raise ValueError(
+            f'expected the expression to only depend on the given symbols, but it also depends on '
+            f'{sorted(map(str, unknown))}')
+
+def _cache_key(kind, variant, expr, *symbols):
+    # Hash everything that the generated source depends on. `srepr` spells
+    # out the whole expression tree, including the assumptions on each
+    # symbol, so it is the same in every process.
+    import sympy
+    text = '\n'.join([str(_VERSION), kind, variant, sympy.srepr(expr)] + [sympy.srepr(s) for s in symbols])
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def _load(key, generate, cache_dir):
+    # Get the namespace of the generated module with the given key. It is
+    # loaded from the cache if it is there, or else generated and saved
+    # there first.
+    if key in _loaded:
+        return _loaded[key]
+
+    if cache_dir is None:
+        cache_dir = os.path.join(
+            os.environ.get('PHYSICS_SIMS_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'physics_sims')),
+            'codegen')
+    path = os.path.join(cache_dir, f'eom_{key}.py')
+
+    if not os.path.exists(path):
+        source = _PRELUDE + '\n' + generate()
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a file of this process's own, and move it into place, so
+        # other processes never load a partly written module
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(source)
+        os.replace(tmp_path, path)
+
+    spec = importlib.util.spec_from_file_location(f'physics_sims_codegen_{key[:16]}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _loaded[key] = vars(module)
+    return _loaded[key]
+
+_PRELUDE = '''\
+# Generated by physics_sims.codegen
+import numpy
+
+def _stack(values):
+    # Stack the outputs along a new last axis. Outputs that don't depend on
+    # the state, like a zero force, are broadcast to the batch shape first.
+    return numpy.stack(numpy.broadcast_arrays(*values), axis=-1)
+
+def _solve(mass_matrix, force):
+    # Solve `M q_ddot = f`, where `mass_matrix` holds the entries of `M` in
+    # row major order along its last axis
+    n = force.shape[-1]
+    mass_matrix = mass_matrix.reshape(mass_matrix.shape[:-1] + (n, n))
+    batch_shape = numpy.broadcast_shapes(mass_matrix.shape[:-2], force.shape[:-1])
+    mass_matrix = numpy.broadcast_to(mass_matrix, batch_shape + (n, n))
+    force = numpy.broadcast_to(force, batch_shape + (n,))
+    return numpy.linalg.solve(mass_matrix, force[..., None])[..., 0]
+'''
+
+def _source(sympy, name, args, state, params, time, groups, body):
+    # Print the source of a function called `name`, which takes the state
+    # arrays named by `args`, followed by the `params`. `state` maps each
+    # state argument to the symbols held along its last axis. `groups` holds
+    # lists of expressions to compute, and `body` is the last line of the
+    # function, with `{0}`, `{1}`, ... in place of the printed expressions of
+    # each group.
+    from sympy.printing.numpy import NumPyPrinter
+
+    # Rename every symbol to a valid identifier, since sympy allows names
+    # that Python doesn't
+    names = {}
+    for arg, symbols in state.items():
+        names.update({symbol: sympy.Symbol(f'{arg}_{i}') for i, symbol in enumerate(symbols)})
+    names.update({symbol: sympy.Symbol(f'param_{i}') for i, symbol in enumerate(params)})
+    if time is not None:
+        names[time] = sympy.Symbol('t')
+
+    outputs = [sympy.sympify(expr).xreplace(names) for group in groups for expr in group]
+    temporaries, outputs = sympy.cse(outputs, symbols=sympy.numbered_symbols('x_'))
+    printer = NumPyPrinter()
+
+    param_args = ''.join(f', param_{i}' for i in range(len(params)))
+    lines = [f'def {name}({", ".join(args)}{param_args}):']
+    for arg, symbols in state.items():
+        lines += [f'    {arg}_{i} = {arg}[..., {i}]' for i in range(len(symbols))]
+    lines += [f'    {symbol} = {printer.doprint(expr)}' for symbol, expr in temporaries]
+
+    printed = []
+    for group in groups:
+        printed.append(', '.join(printer.doprint(expr) for expr in outputs[:len(group)]))
+        outputs = outputs[len(group):]
+    lines.append('    ' + body.format(*printed))
+    return '\n'.join(lines) + '\n'
@@ -1,9 +1,14 @@
 import numpy as np
-from physics_sims import Sim, SimRunner, integrators
+from physics_sims import Sim, SimRunner, integrators, backend
 
+@backend.kernel
 def calc_acceleration(x, k, m):
     return -(k / m)
 
+@backend.kernel
+def calc_acceleration_txv(t, x, v, k, m):
+    return calc_acceleration(x, k, m)
+
 class ConstantForce1DSim(Sim):
     def __init__(self, t=0, x=0, v=0, m=0.25, k=-4, *, dtype=np.float32):
         self.t = t
@@ -11,15 +16,27 @@ class ConstantForce1DSim(Sim):
         self.v = np.array(v, dtype=dtype)
         self.m = np.array(m, dtype=dtype)
         self.k = np.array(k, dtype=dtype)
-        self.a = calc_acceleration(x, k, m)
-
-        self.iters = 0
+        self.x, self.v = (np.array(a) for a in np.broadcast_arrays(self.x, self.v, self.m, self.k)[:2])
+        self.a = calc_acceleration(self.x, self.k, self.m)
 
     def update(self, sim_runner, dt):
         self.t, self.x, self.v, self.a = integrators.velocity_verlet(
             dt, self.t, self.x, self.v, self.a,
             lambda _, x, __: calc_acceleration(x, self.k, self.m))
 
+    def advance(self, sim_runner, n, dt):
+        k, m = integrators.unbox_float64(self.k, self.m)
+        self.t, self.x, self.v, self.a = integrators.velocity_verlet_n(
+            n, dt, self.t, self.x, self.v, self.a,
+            backend.bind(calc_acceleration_txv, k, m))
+
+    def update_adaptive(self, sim_runner, dt, *, rtol, atol):
+        self.t, self.x, self.v, self.a, dt, dt_next = integrators.dormand_prince(
+            dt, self.t, self.x, self.v, self.a,
+            lambda _, x, __: calc_acceleration(x, self.k, self.m),
+            rtol=rtol, atol=atol)
+        return dt, dt_next
+
     def calc_kinetic(self):
         return 0.5 * self.m * self.v**2
 
@@ -29,17 +46,35 @@ class ConstantForce1DSim(Sim):
     def draw(self, sim_runner):
         sim_runner.draw_dot(np.array([self.x, 0]))
 
-        if self.iters % 1_000 == 0:
-            kinetic = self.calc_kinetic()
-            potential = self.calc_potential()
-            print(f'{self.t}: {kinetic + potential}')
-
-        self.iters += 1
-
     def state(self):
         kinetic = self.calc_kinetic()
         potential = self.calc_potential()
         return [self.t, self.x, self.v, kinetic, potential, kinetic+potential]
 
+    def rates(self):
+        return [1, self.v, self.a, None, None, None]
+
+    def solution(self, t):
+        # Uniform acceleration from the current state
+        x0, v0, m, k = (np.asarray(a, dtype=np.float64) for a in (self.x, self.v, self.m, self.k))
+        tau = np.reshape(t, np.shape(t) + (1,) * x0.ndim) - np.float64(self.t)
+        a = calc_acceleration(x0, k, m)
+        x = x0 + v0 * tau + 0.5 * a * tau**2
+        v = v0 + a * tau
+        kinetic = 0.5 * m * v**2
+        potential = k * x
+        return [np.asarray(t, dtype=np.float64), x, v, kinetic, potential, kinetic + potential]
+
+    def observables(self):
+        return {
+            't': lambda: self.t,
+            'kinetic': self.calc_kinetic,
+            'potential': self.calc_potential,
+            'energy': lambda: self.calc_kinetic() + self.calc_potential(),
+        }
+
+    def interpolated(self):
+        return {'t': None, 'x': None, 'v': None}
+
 if __name__ == '__main__':
     SimRunner().run(sim=ConstantForce1DSim())
@@ -0,0 +1,90 @@
+import threading
+
+import numpy as np
+
+class Diagnostics:
+    r'''Samples the observables of a sim into a fixed-size ring buffer.
+
+    A :class:`SimRunner` with diagnostics enabled attaches the sim it runs,
+    and samples the sim's :meth:`Sim.observables` once every ``every`` steps.
+    Once ``capacity`` samples have been taken, each new sample replaces the
+    oldest one, so memory use stays flat however long the run is.
+
+    The samples can be read from any thread while the sim is running.
+
+    Args:
+        capacity: Number of samples to keep
+        every: Number of steps between samples
+    '''
+    def __init__(self, capacity=4096, every=1000):
+        assert capacity >= 1 and every >= 1
+        self.capacity = capacity
+        self.every = every
+        self._lock = threading.Lock()
+        self._observables = {}
+        self._buffers = None
+        self._count = 0
+        self._steps = 0
+
+    def attach(self, sim):
+        r'''Start sampling the observables of ``sim``, dropping any samples
+        taken before, and take the first sample.
+        '''
+        with self._lock:
+            self._observables = dict(sim.observables())
+            self._buffers = None
+            self._count = 0
+            self._steps = 0
+        self.sample()
+
+    def add_steps(self, num_steps):
+        r'''Record that the attached sim took ``num_steps`` steps, sampling
+        it if that brought it to or past the next multiple of ``every``.
+        '''
+        steps = self._steps + num_steps
+        crossed = steps // self.every > self._steps // self.every
+        self._steps = steps
+        if crossed:
+            self.sample()
+
+    def sample(self):
+        r'''Sample the observables of the attached sim now.'''
+        values = {name: np.asarray(observable()) for name, observable in self._observables.items()}
+
+        with self._lock:
+            if self._buffers is None:
+                # The shapes and dtypes of the observables aren't known until
+                # the first sample
+                self._buffers = {'step': np.empty(self.capacity, dtype=np.int64)}
+                for name, value in values.items():
+                    self._buffers[name] = np.empty(
+                        (self.capacity,) + value.shape, dtype=np.result_type(value, np.float64))
+
+            index = self._count % self.capacity
+            self._buffers['step'][index] = self._steps
+            for name, value in values.items():
+                self._buffers[name][index] = value
+            self._count += 1
+
+    def read(self):
+        r'''Get a copy of the samples in the buffer.
+
+        Returns:
+            Dict mapping ``'step'``, the number of steps taken when each
+            sample was taken, and the name of each observable to an array of
+            its samples, oldest first
+        '''
+        with self._lock:
+            if self._buffers is None:
+                return {}
+            num_samples = min(self._count, self.capacity)
+            start = self._count % self.capacity if self._count > self.capacity else 0
+            order = (start + np.arange(num_samples)) % self.capacity
+            return {name: buffer[order] for name, buffer in self._buffers.items()}
+
+    def dump(self, path):
+        r'''Save a copy of the samples in the buffer to an ``.npz`` file.'''
+        np.savez(path, **self.read())
+
+    def __len__(self):
+        return min(self._count, self.capacity)
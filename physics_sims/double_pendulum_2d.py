@@ -2,56 +2,65 @@ import numpy as np
 from physics_sims import Sim, SimRunner, integrators
 
 class DoublePendulum2DSim(Sim):
-    def __init__(self, *, dtype=np.float32):
+    # The last axis of `theta`, `omega`, `m`, and `R` indexes the two links.
+    # Any leading axes are batch axes.
+    def __init__(self, theta=(np.pi/2, np.pi), omega=(0, 0), m=(1, 1), R=(2, 2), g=9.80, *, dtype=np.float32):
         self.t = 0
-        self.theta = np.array([np.pi/2, np.pi], dtype=dtype)
-        self.omega = np.array([0, 0], dtype=dtype)
+        self.theta = np.array(theta, dtype=dtype)
+        self.omega = np.array(omega, dtype=dtype)
 
-        self.m = np.array([1, 1], dtype=dtype)
-        self.R = np.array([2, 2], dtype=dtype)
-        self.g = 9.80
+        self.m = np.array(m, dtype=dtype)
+        self.R = np.array(R, dtype=dtype)
+        self.g = np.array(g, dtype=dtype)
+        self.theta, self.omega = (
+            np.array(a) for a in np.broadcast_arrays(self.theta, self.omega, self.m, self.R, self.g[..., None])[:2])
 
         self.alpha = self.calc_alpha(self.theta, self.omega)
 
-        self.iters = 0
-
     # This is based on my derivation of the Euler-Lagrange equations of the
     # double pendulum.
     #
     # PERF: I did not try to simplify the equations much, so it's
     # very likely that the numerical accuracy can be improved.
     def calc_alpha(self, theta, omega):
+        m_sum = self.m[..., 0] + self.m[..., 1]
+        R_prod = self.R[..., 0] * self.R[..., 1]
+        omega_prod = omega[..., 0] * omega[..., 1]
+
         dL_dtheta0 = (
-            -self.g * self.R[0] * (self.m.sum()) * np.sin(theta[0])
-            - self.m[1] * self.R.prod() * omega.prod() * np.sin(theta[0] - theta[1]))
+            -self.g * self.R[..., 0] * m_sum * np.sin(theta[..., 0])
+            - self.m[..., 1] * R_prod * omega_prod * np.sin(theta[..., 0] - theta[..., 1]))
 
         dL_dtheta1 = (
-            -self.g * self.R[1] * self.m[1] * np.sin(theta[1])
-            + self.m[1] * self.R.prod() * omega.prod() * np.sin(theta[0] - theta[1]))
+            -self.g * self.R[..., 1] * self.m[..., 1] * np.sin(theta[..., 1])
+            + self.m[..., 1] * R_prod * omega_prod * np.sin(theta[..., 0] - theta[..., 1]))
 
-        A = self.m[1] * self.R[1]**2
-        B = self.m[1] * self.R.prod()
-        C = np.cos(theta[0] - theta[1])
-        D = np.sin(theta[0] - theta[1])
-        E = self.m.sum() * self.R[0]**2
+        A = self.m[..., 1] * self.R[..., 1]**2
+        B = self.m[..., 1] * R_prod
+        C = np.cos(theta[..., 0] - theta[..., 1])
+        D = np.sin(theta[..., 0] - theta[..., 1])
+        E = m_sum * self.R[..., 0]**2
 
-        alpha0 = (A * dL_dtheta0 - B * C * dL_dtheta1 + D * (A * B * omega[1] - B**2 * C * omega[0]) * (omega[0] - omega[1])) / (A * E - B**2 * C**2)
+        alpha0 = (A * dL_dtheta0 - B * C * dL_dtheta1 + D * (A * B * omega[..., 1] - B**2 * C * omega[..., 0]) * (omega[..., 0] - omega[..., 1])) / (A * E - B**2 * C**2)
 
         # PERF: This is a good candidate for numerical improvement, to remove
         # dependence on `alpha0`
-        alpha1 = (dL_dtheta1 - B * (alpha0 * C - omega[0] * (omega[0] - omega[1]) * D)) / A
+        alpha1 = (dL_dtheta1 - B * (alpha0 * C - omega[..., 0] * (omega[..., 0] - omega[..., 1]) * D)) / A
 
-        return np.array([alpha0, alpha1], dtype=theta.dtype)
+        return np.stack([alpha0, alpha1], axis=-1).astype(theta.dtype, copy=False)
 
     def calc_energy(self):
+        m_sum = self.m[..., 0] + self.m[..., 1]
+        R_prod = self.R[..., 0] * self.R[..., 1]
+
         kinetic = (
-            0.5 * self.m.sum() * self.R[0]**2 * self.omega[0]**2
-            + 0.5 * self.m[1] * self.R[1]**2 * self.omega[1]**2
-            + self.m[1] * self.R.prod() * self.omega.prod() * np.cos(self.theta[0] - self.theta[1]))
+            0.5 * m_sum * self.R[..., 0]**2 * self.omega[..., 0]**2
+            + 0.5 * self.m[..., 1] * self.R[..., 1]**2 * self.omega[..., 1]**2
+            + self.m[..., 1] * R_prod * self.omega[..., 0] * self.omega[..., 1] * np.cos(self.theta[..., 0] - self.theta[..., 1]))
 
         potential = (
-            -self.g * self.R[0] * self.m.sum() * np.cos(self.theta[0])
-            - self.g * self.R[1] * self.m[1] * np.cos(self.theta[1]))
+            -self.g * self.R[..., 0] * m_sum * np.cos(self.theta[..., 0])
+            - self.g * self.R[..., 1] * self.m[..., 1] * np.cos(self.theta[..., 1]))
 
         return kinetic, potential
 
@@ -59,24 +68,61 @@ class DoublePendulum2DSim(Sim):
         self.t, self.theta, self.omega = integrators.runge_kutta_4th_order(
             dt, self.t, self.theta, self.omega,
             lambda _, theta, omega: self.calc_alpha(theta, omega))
+        # The acceleration carried between adaptive steps is stale now
+        self.alpha = None
+
+    # The state is an array, so the steps are always taken with NumPy, since
+    # the compiled loops only step scalar states
+    def advance(self, sim_runner, n, dt):
+        self.t, self.theta, self.omega = integrators.runge_kutta_4th_order_n(
+            n, dt, self.t, self.theta, self.omega,
+            lambda _, theta, omega: self.calc_alpha(theta, omega))
+        self.alpha = None
 
-    def draw(self, sim_runner):
-        x0 = self.R[0] * np.sin(self.theta[0])
-        y0 = -self.R[0] * np.cos(self.theta[0])
+    def update_adaptive(self, sim_runner, dt, *, rtol, atol):
+        self.t, self.theta, self.omega, self.alpha, dt, dt_next = integrators.dormand_prince(
+            dt, self.t, self.theta, self.omega, self.alpha,
+            lambda _, theta, omega: self.calc_alpha(theta, omega),
+            rtol=rtol, atol=atol)
+        return dt, dt_next
 
-        x1 = x0 + self.R[1] * np.sin(self.theta[1])
-        y1 = y0 - self.R[1] * np.cos(self.theta[1])
+    def state(self):
+        kinetic, potential = self.calc_energy()
+        return [
+            self.t,
+            self.theta[..., 0], self.theta[..., 1],
+            self.omega[..., 0], self.omega[..., 1],
+            kinetic, potential, kinetic + potential]
 
-        sim_runner.draw_dot([0, 0])
-        sim_runner.draw_dot([x0, y0])
-        sim_runner.draw_dot([x1, y1])
+    # Every member of an ensemble is drawn, all hanging from the same pivot
+    def draw(self, sim_runner):
+        x0 = self.R[..., 0] * np.sin(self.theta[..., 0])
+        y0 = -self.R[..., 0] * np.cos(self.theta[..., 0])
 
-        kinetic, potential = self.calc_energy()
-        total = kinetic + potential
-        if self.iters % 1000 == 0:
-            print(f'{self.t} {kinetic} {potential} {total}')
+        x1 = x0 + self.R[..., 1] * np.sin(self.theta[..., 1])
+        y1 = y0 - self.R[..., 1] * np.cos(self.theta[..., 1])
 
-        self.iters += 1
+        sim_runner.draw_dot([0, 0])
+        sim_runner.draw_dots(np.stack([np.stack([x0, y0], axis=-1), np.stack([x1, y1], axis=-1)]))
+
+    def rates(self):
+        alpha = self.calc_alpha(self.theta, self.omega) if self.alpha is None else self.alpha
+        return [
+            1,
+            self.omega[..., 0], self.omega[..., 1],
+            alpha[..., 0], alpha[..., 1],
+            None, None, None]
+
+    def observables(self):
+        return {
+            't': lambda: self.t,
+            'kinetic': lambda: self.calc_energy()[0],
+            'potential': lambda: self.calc_energy()[1],
+            'energy': lambda: sum(self.calc_energy()),
+        }
+
+    def interpolated(self):
+        return {'t': None, 'theta': 2 * np.pi, 'omega': None}
 
 if __name__ == '__main__':
     SimRunner().run(sim=DoublePendulum2DSim(), time_delta=0.01, time_scale=20)
@@ -0,0 +1,132 @@
+import numpy as np
+
+from physics_sims.trajectory import hermite
+
+class Event:
+    r'''Something that happens when a function of a sim's state crosses zero,
+    like a turning point of an oscillator, where its velocity is zero.
+
+    Args:
+        function: Callable of the form ``(*fields) -> value``, called with the
+            fields of ``sim.state()``, each with an extra leading axis of
+            records. For batched sims, each field holds every member of the
+            ensemble, and the value holds one entry per member.
+        direction: If 1, only count crossings from negative to positive. If
+            -1, only count crossings from positive to negative. If 0, count
+            both.
+        terminal: If True, :meth:`SimRunner.run_headless` stops the run once
+            this event has happened, or for ensembles, once it has happened to
+            every member
+    '''
+    def __init__(self, function, *, direction=0, terminal=False):
+        assert direction in (-1, 0, 1)
+        self.function = function
+        self.direction = direction
+        self.terminal = terminal
+
+    def __call__(self, fields):
+        return np.asarray(self.function(*fields), dtype=np.float64)
+
+    def crossed(self, value0, value1):
+        r'''Get whether the event happened between two records where its
+        function had the values ``value0`` and ``value1``. A crossing that
+        lands exactly on a record is counted in the interval before it.
+        '''
+        up = (value0 < 0) & (value1 >= 0)
+        down = (value0 > 0) & (value1 <= 0)
+        if self.direction > 0:
+            return up
+        if self.direction < 0:
+            return down
+        return up | down
+
+def find_events(trajectory, event, *, max_iters=60):
+    r'''Find the times that an event happens in a trajectory.
+
+    Crossings are bracketed by the records that the event's function changes
+    sign between, and located within each bracket by bisection on the dense
+    output of the trajectory, so their times are accurate to far less than a
+    step. Every bracket, across every member of an ensemble, is refined at
+    once. If the function crosses zero more than once between two records,
+    only one of the crossings may be found.
+
+    Args:
+        trajectory: :class:`Trajectory` to search
+        event: :class:`Event` to find
+        max_iters: Most bisection steps to take
+
+    Returns:
+        Array of the event times in increasing order. For batched sims, the
+        array has shape ``batch + (count,)``, holding the times for each
+        member, padded with NaN up to the largest count.
+    '''
+    times = np.asarray(trajectory.t, dtype=np.float64)
+    states = np.asarray(trajectory.states, dtype=np.float64)
+    fields = trajectory.split_fields(states)
+    values = event(fields)
+    batch_shape = values.shape[1:]
+    values = values.reshape(len(times), -1)
+
+    if len(times) < 2:
+        return np.full(batch_shape + (0,), np.nan)
+
+    crossed = event.crossed(values[:-1], values[1:])
+    intervals = np.flatnonzero(crossed.any(axis=1))
+    crossed = crossed[intervals]
+
+    if len(intervals):
+        slopes = trajectory.split_fields(trajectory.slopes)
+        roots = _bisect(
+            event, times, fields, slopes, intervals, values[intervals], batch_shape, max_iters)
+
+    # Gather the roots of each member in order of time
+    counts = crossed.sum(axis=0)
+    result = np.full((values.shape[1], counts.max(initial=0)), np.nan)
+    members, brackets = np.nonzero(crossed.T)
+    if len(members):
+        slots = np.arange(len(members)) - np.repeat(np.cumsum(counts) - counts, counts)
+        result[members, slots] = roots[brackets, members]
+
+    return result.reshape(batch_shape + (result.shape[1],))
+
+def _bisect(event, times, fields, slopes, intervals, values_lo, batch_shape, max_iters):
+    # Bisect the crossings in each of the record `intervals` for every member
+    # of the batch at once. Members that didn't cross in an interval are
+    # refined too, but their results are ignored.
+    num_intervals = len(intervals)
+    lo = np.repeat(times[intervals, None], values_lo.shape[1], axis=1)
+    hi = np.repeat(times[intervals + 1, None], values_lo.shape[1], axis=1)
+    tol = 4 * np.finfo(np.float64).eps * np.maximum(np.abs(lo), np.abs(hi))
+
+    def evaluate(t):
+        # Value of the event function at times `t` of shape
+        # `(intervals, members)`
+        t = t.reshape((num_intervals,) + batch_shape)
+        t0 = times[intervals].reshape((-1,) + (1,) * len(batch_shape))
+        h = (times[intervals + 1] - times[intervals]).reshape(t0.shape)
+        s = (t - t0) / h
+
+        interpolated = []
+        for field, slope in zip(fields, slopes):
+            # Line the field's axes up with the batch axes of `s`
+            shape = (num_intervals,) + (1,) * (len(batch_shape) + 1 - field.ndim) + field.shape[1:]
+            interpolated.append(hermite(
+                field[intervals].reshape(shape), slope[intervals].reshape(shape),
+                field[intervals + 1].reshape(shape), slope[intervals + 1].reshape(shape),
+                h, s))
+        interpolated[0] = t
+        value = event(interpolated)
+        return np.broadcast_to(value, (num_intervals,) + batch_shape).reshape(num_intervals, -1)
+
+    for _ in range(max_iters):
+        if np.all(hi - lo <= tol):
+            break
+        mid = 0.5 * (lo + hi)
+        values_mid = evaluate(mid)
+        # Keep the half whose ends still have opposite signs
+        move_lo = np.sign(values_mid) == np.sign(values_lo)
+        lo = np.where(move_lo, mid, lo)
+        values_lo = np.where(move_lo, values_mid, values_lo)
+        hi = np.where(move_lo, hi, mid)
+
+    return 0.5 * (lo + hi)
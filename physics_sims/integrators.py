@@ -1,4 +1,57 @@
-def velocity_verlet(dt, t, x, v, a, calc_acceleration):
+import numpy as np
+
+from physics_sims import backend
+
+# Counts evaluations of the functions passed to the integrators, while
+# counting is turned on with `count_evaluations`
+_evaluation_counter = None
+
+class _EvaluationCounter:
+    def __init__(self):
+        self.count = 0
+
+def count_evaluations(enabled=True):
+    r'''Turn counting of the evaluations of the functions passed to the
+    integrators, like ``calc_acceleration``, on or off. Turning it on resets
+    the count to zero.
+
+    The count is kept in Python, so it costs nothing while counting is off.
+    '''
+    global _evaluation_counter
+    _evaluation_counter = _EvaluationCounter() if enabled else None
+
+def evaluation_count():
+    r'''Get the number of evaluations counted since counting was turned on,
+    or ``None`` if it is off.
+    '''
+    return None if _evaluation_counter is None else _evaluation_counter.count
+
+def compensated_add(total, error, increment):
+    r'''Add an increment to a running total with Kahan compensated
+    summation.
+    https://en.wikipedia.org/wiki/Kahan_summation_algorithm
+
+    The low order bits of the increment that are rounded off when it is added
+    to a much larger total are kept in ``error``, and added back in on the
+    next call. This keeps the total of many small increments about as
+    accurate as if it were summed at twice the precision, which lets a long
+    float32 run drift about as little as a float64 one, while its state stays
+    in float32.
+
+    Args:
+        total: Running total
+        error: Rounding error carried over from the last call, starting at 0
+        increment: Amount to add
+
+    Returns:
+        (total, error)
+    '''
+    corrected = increment - error
+    total_next = total + corrected
+    error_next = (total_next - total) - corrected
+    return total_next, error_next
+
+def velocity_verlet(dt, t, x, v, a, calc_acceleration, *, compensation=None):
     r'''Velocity Verlet integration
     https://en.wikipedia.org/wiki/Verlet_integration
 
@@ -9,18 +62,36 @@ def velocity_verlet(dt, t, x, v, a, calc_acceleration):
         v: Current velocity
         a: Current acceleration
         calc_acceleration: Callable of the form ``(t, x, v) -> a``
+        compensation: If given, add each step's increments to ``t``, ``x``,
+            and ``v`` with compensated summation, carrying the rounding errors
+            in this ``(t, x, v)`` tuple from one step to the next. Start it at
+            ``(0, 0, 0)``. See :func:`compensated_add`.
 
     Returns:
-        (t, x, v, a)
+        (t, x, v, a), followed by the new compensation tuple if
+        ``compensation`` is given
     '''
+    if compensation is not None:
+        t_error, x_error, v_error = compensation
+        x_next, x_error = compensated_add(x, x_error, v * dt + 0.5 * a * dt**2)
+        t_next, t_error = compensated_add(t, t_error, dt)
+        a_next = calc_acceleration(t_next, x_next, v)
+        v_next, v_error = compensated_add(v, v_error, 0.5 * (a + a_next) * dt)
+        if _evaluation_counter is not None:
+            _evaluation_counter.count += 1
+        return t_next, x_next, v_next, a_next, (t_error, x_error, v_error)
+
     x_next = x + v * dt + 0.5 * a * dt**2
     t_next = t + dt
     a_next = calc_acceleration(t_next, x_next, v)
     v_next = v + 0.5 * (a + a_next) * dt
 
+    if _evaluation_counter is not None:
+        _evaluation_counter.count += 1
+
     return t_next, x_next, v_next, a_next
 
-def verlet_symplectic(dt, t, q, p, calc_q_dot, calc_p_dot):
+def verlet_symplectic(dt, t, q, p, calc_q_dot, calc_p_dot, *, compensation=None):
     r'''Verlet symplectic integrator for phase space.
     https://en.wikipedia.org/wiki/Symplectic_integrator#A_second-order_example
 
@@ -31,18 +102,154 @@ def verlet_symplectic(dt, t, q, p, calc_q_dot, calc_p_dot):
         p: Current momentum coordinate
         calc_q_dot: Callable of the form ``(p) -> q_dot``
         calc_p_dot: Callable of the form ``(q) -> p_dot``
+        compensation: If given, add each step's increments to ``t``, ``q``,
+            and ``p`` with compensated summation, carrying the rounding errors
+            in this ``(t, q, p)`` tuple from one step to the next. Start it at
+            ``(0, 0, 0)``. See :func:`compensated_add`.
 
     Returns:
-        (t, q, p)
+        (t, q, p), followed by the new compensation tuple if
+        ``compensation`` is given
     '''
+    if compensation is not None:
+        t_error, q_error, p_error = compensation
+        q_mid, q_error = compensated_add(q, q_error, 0.5 * calc_q_dot(p) * dt)
+        p_next, p_error = compensated_add(p, p_error, calc_p_dot(q_mid) * dt)
+        q_next, q_error = compensated_add(q_mid, q_error, 0.5 * calc_q_dot(p_next) * dt)
+        t_next, t_error = compensated_add(t, t_error, dt)
+        if _evaluation_counter is not None:
+            _evaluation_counter.count += 3
+        return t_next, q_next, p_next, (t_error, q_error, p_error)
+
     q_mid = q + 0.5 * calc_q_dot(p) * dt
     p_next = p + calc_p_dot(q_mid) * dt
     q_next = q_mid + 0.5 * calc_q_dot(p_next) * dt
     t_next = t + dt
 
+    if _evaluation_counter is not None:
+        _evaluation_counter.count += 3
+
     return t_next, q_next, p_next
 
-def runge_kutta_4th_order(dt, t, x, v, calc_acceleration):
+def symplectic_composition(dt, t, q, p, calc_q_dot, calc_p_dot, scheme, *, compensation=None):
+    r'''Symplectic integrator for phase space built from a sequence of drifts
+    and kicks.
+    https://en.wikipedia.org/wiki/Symplectic_integrator
+
+    The step alternates between drifting the position coordinate with
+    ``calc_q_dot`` and kicking the momentum coordinate with ``calc_p_dot``,
+    starting and ending with a drift. ``VERLET`` gives the same result as
+    :func:`verlet_symplectic`, and the other schemes in this module give
+    higher order methods at the cost of more evaluations per step.
+
+    Args:
+        dt: Amount of time to integrate over
+        t: Current time
+        q: Current position coordinate
+        p: Current momentum coordinate
+        calc_q_dot: Callable of the form ``(p) -> q_dot``
+        calc_p_dot: Callable of the form ``(q) -> p_dot``
+        scheme: Pair of the form ``(drifts, kicks)``, giving the fraction of
+            ``dt`` for each drift and kick. There must be one more drift than
+            kicks.
+        compensation: If given, add each drift and kick with compensated
+            summation, as in :func:`verlet_symplectic`
+
+    Returns:
+        (t, q, p), followed by the new compensation tuple if
+        ``compensation`` is given
+    '''
+    drifts, kicks = scheme
+
+    if compensation is not None:
+        t_error, q_error, p_error = compensation
+        for drift, kick in zip(drifts, kicks):
+            q, q_error = compensated_add(q, q_error, drift * calc_q_dot(p) * dt)
+            p, p_error = compensated_add(p, p_error, kick * calc_p_dot(q) * dt)
+        q, q_error = compensated_add(q, q_error, drifts[-1] * calc_q_dot(p) * dt)
+        t_next, t_error = compensated_add(t, t_error, dt)
+        if _evaluation_counter is not None:
+            _evaluation_counter.count += len(drifts) + len(kicks)
+        return t_next, q, p, (t_error, q_error, p_error)
+
+    for drift, kick in zip(drifts, kicks):
+        q = q + drift * calc_q_dot(p) * dt
+        p = p + kick * calc_p_dot(q) * dt
+    q = q + drifts[-1] * calc_q_dot(p) * dt
+    t_next = t + dt
+
+    if _evaluation_counter is not None:
+        _evaluation_counter.count += len(drifts) + len(kicks)
+
+    return t_next, q, p
+
+def verlet_composition_scheme(weights):
+    r'''Build a scheme for :func:`symplectic_composition` that takes a
+    sequence of :func:`verlet_symplectic` steps, each spanning the given
+    fraction of the time step.
+    https://doi.org/10.1016/0375-9601(90)90092-3
+
+    The half drifts at the end of one Verlet step and the start of the next
+    are merged into one drift.
+
+    Args:
+        weights: Fraction of the time step spanned by each Verlet step
+
+    Returns:
+        (drifts, kicks)
+    '''
+    weights = tuple(weights)
+    drifts = (
+        (0.5 * weights[0],)
+        + tuple(0.5 * (w0 + w1) for w0, w1 in zip(weights[:-1], weights[1:]))
+        + (0.5 * weights[-1],))
+    return drifts, weights
+
+def _symmetric_weights(weights):
+    # Yoshida's weights are given from the outside in, without the middle one,
+    # which makes the weights sum to one
+    weights = tuple(weights)
+    middle = 1 - 2 * sum(weights)
+    return weights + (middle,) + weights[::-1]
+
+# Second order method, the same as `verlet_symplectic`
+VERLET = verlet_composition_scheme([1])
+
+# Fourth order "triple jump" composition. Forest and Ruth derived the same
+# method independently.
+# https://doi.org/10.1016/0375-9601(90)90092-3
+YOSHIDA_4TH_ORDER = verlet_composition_scheme(_symmetric_weights([1 / (2 - 2**(1/3))]))
+FOREST_RUTH = YOSHIDA_4TH_ORDER
+
+# Yoshida's sixth and eighth order compositions, "solution A" in each case
+YOSHIDA_6TH_ORDER = verlet_composition_scheme(_symmetric_weights([
+    0.784513610477560,
+    0.235573213359357,
+    -1.17767998417887,
+]))
+
+YOSHIDA_8TH_ORDER = verlet_composition_scheme(_symmetric_weights([
+    1.04242620869991,
+    1.82020630970714,
+    0.157739928123617,
+    2.44002732616735,
+    -0.00716989419708120,
+    -2.44699182370524,
+    -1.61582374150097,
+]))
+
+# Omelyan, Mryglod, and Folk's fourth order position extended Forest-Ruth like
+# method, which has a much smaller error constant than Forest-Ruth
+# https://doi.org/10.1016/S0010-4655(02)00451-4
+_OMELYAN_XI = 0.1786178958448091
+_OMELYAN_LAMBDA = -0.2123418310626054
+_OMELYAN_CHI = -0.06626458266981849
+OMELYAN = (
+    (_OMELYAN_XI, _OMELYAN_CHI, 1 - 2 * (_OMELYAN_CHI + _OMELYAN_XI), _OMELYAN_CHI, _OMELYAN_XI),
+    (0.5 * (1 - 2 * _OMELYAN_LAMBDA), _OMELYAN_LAMBDA, _OMELYAN_LAMBDA, 0.5 * (1 - 2 * _OMELYAN_LAMBDA)),
+)
+
+def runge_kutta_4th_order(dt, t, x, v, calc_acceleration, *, compensation=None):
     r'''Classic Fourth-order Runge-Kutta integration method
     https://en.wikipedia.org/wiki/List_of_Runge%E2%80%93Kutta_methods
 
@@ -52,9 +259,14 @@ def runge_kutta_4th_order(dt, t, x, v, calc_acceleration):
         x: Current position coordinate
         v: Current velocity
         calc_acceleration: Callable of the form ``(t, x, v) -> a``
+        compensation: If given, add each step's increments to ``t``, ``x``,
+            and ``v`` with compensated summation, carrying the rounding errors
+            in this ``(t, x, v)`` tuple from one step to the next. Start it at
+            ``(0, 0, 0)``. See :func:`compensated_add`.
 
     Returns:
-        (t, x, v)
+        (t, x, v), followed by the new compensation tuple if
+        ``compensation`` is given
     '''
     k1v = dt * calc_acceleration(t, x, v)
     k1x = dt * v
@@ -77,8 +289,706 @@ def runge_kutta_4th_order(dt, t, x, v, calc_acceleration):
         v + k3v)
     k4x = dt * (v + k3v)
 
+    if _evaluation_counter is not None:
+        _evaluation_counter.count += 4
+
+    if compensation is not None:
+        t_error, x_error, v_error = compensation
+        t_next, t_error = compensated_add(t, t_error, dt)
+        x_next, x_error = compensated_add(x, x_error, (k1x + 2.0 * (k2x + k3x) + k4x) / 6.0)
+        v_next, v_error = compensated_add(v, v_error, (k1v + 2.0 * (k2v + k3v) + k4v) / 6.0)
+        return t_next, x_next, v_next, (t_error, x_error, v_error)
+
     t_next = t + dt
     x_next = x + (k1x + 2.0 * (k2x + k3x) + k4x) / 6.0
     v_next = v + (k1v + 2.0 * (k2v + k3v) + k4v) / 6.0
 
-    return t_next, x_next, v_next
\ No newline at end of file
+    return t_next, x_next, v_next
+
+# Butcher tableau of the Dormand-Prince 5(4) method
+_DORMAND_PRINCE_C = (0, 1/5, 3/10, 4/5, 8/9, 1, 1)
+_DORMAND_PRINCE_A = (
+    (1/5,),
+    (3/40, 9/40),
+    (44/45, -56/15, 32/9),
+    (19372/6561, -25360/2187, 64448/6561, -212/729),
+    (9017/3168, -355/33, 46732/5247, 49/176, -5103/18656),
+    (35/384, 0, 500/1113, 125/192, -2187/6784, 11/84),
+)
+# Difference between the 5th and 4th order weights, giving the error estimate
+_DORMAND_PRINCE_E = (71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40)
+
+class StepSizeUnderflowError(RuntimeError):
+    r'''Raised by :func:`dormand_prince` when the step size needed to meet
+    the error tolerance is too small to advance the time, which usually means
+    the solution is running into a singularity.
+    '''
+
+def dormand_prince(dt, t, x, v, a, calc_acceleration, *, rtol=1e-6, atol=1e-9):
+    r'''Dormand-Prince 5(4) adaptive Runge-Kutta integration
+    https://en.wikipedia.org/wiki/Dormand%E2%80%93Prince_method
+
+    Takes one step, retrying with a smaller step size until the estimated
+    local error is within tolerance. The last stage of each step is evaluated
+    at the end of the step, so the acceleration it gives is returned to be
+    passed back in as ``a`` on the next step, saving one evaluation of
+    ``calc_acceleration``.
+
+    For batched states, one step size is used for the whole batch.
+
+    Args:
+        dt: Amount of time to try to integrate over
+        t: Current time
+        x: Current position coordinate
+        v: Current velocity
+        a: Current acceleration, or ``None`` to calculate it
+        calc_acceleration: Callable of the form ``(t, x, v) -> a``
+        rtol: Relative tolerance of the local error
+        atol: Absolute tolerance of the local error
+
+    Returns:
+        (t, x, v, a, dt, dt_next), where ``dt`` is the step size actually taken
+        and ``dt_next`` is the step size to try on the next step
+
+    Raises:
+        StepSizeUnderflowError: If the step size underflows before the
+            error tolerance is met
+    '''
+    if a is None:
+        a = calc_acceleration(t, x, v)
+        if _evaluation_counter is not None:
+            _evaluation_counter.count += 1
+
+    while True:
+        kx = [v]
+        kv = [a]
+
+        for c, weights in zip(_DORMAND_PRINCE_C[1:], _DORMAND_PRINCE_A):
+            x_stage = x + dt * sum(w * k for w, k in zip(weights, kx) if w)
+            v_stage = v + dt * sum(w * k for w, k in zip(weights, kv) if w)
+            kx.append(v_stage)
+            kv.append(calc_acceleration(t + c * dt, x_stage, v_stage))
+
+        if _evaluation_counter is not None:
+            _evaluation_counter.count += len(_DORMAND_PRINCE_A)
+
+        # The last stage is the 5th order solution at the end of the step
+        x_next = x_stage
+        v_next = v_stage
+        a_next = kv[-1]
+
+        x_error = dt * sum(e * k for e, k in zip(_DORMAND_PRINCE_E, kx) if e)
+        v_error = dt * sum(e * k for e, k in zip(_DORMAND_PRINCE_E, kv) if e)
+        x_scale = atol + rtol * np.maximum(np.abs(x), np.abs(x_next))
+        v_scale = atol + rtol * np.maximum(np.abs(v), np.abs(v_next))
+        error = np.sqrt(
+            (np.sum((x_error / x_scale)**2) + np.sum((v_error / v_scale)**2))
+            / (np.size(x_error) + np.size(v_error)))
+
+        if error == 0:
+            factor = 5
+        else:
+            factor = min(5, max(0.2, 0.9 * error**-0.2))
+
+        if error <= 1:
+            return t + dt, x_next, v_next, a_next, dt, dt * factor
+
+        dt = dt * factor
+        if np.all(t + dt == t):
+            raise StepSizeUnderflowError(
+                f'Dormand-Prince step size underflowed at t={t} without '
+                f'meeting the error tolerance')
+
+def velocity_verlet_n(n_steps, dt, t, x, v, a, calc_acceleration, *, stride=None, compensation=None):
+    r'''Take ``n_steps`` steps of :func:`velocity_verlet` in one call.
+
+    Gives the same result as calling :func:`velocity_verlet` in a loop. Float64
+    scalar states are stepped as Python floats, which round the same way as
+    NumPy scalars but are much faster to do arithmetic on. With the
+    ``'numba'`` backend, they are stepped by a compiled loop instead if
+    ``calc_acceleration`` is a :class:`physics_sims.backend.bind`. Large array
+    states are stepped in place by :class:`VelocityVerlet`, on copies of the
+    arrays, so that the steps don't allocate intermediates.
+
+    Args:
+        n_steps: Number of steps to take
+        dt: Amount of time to integrate over in each step
+        t: Current time
+        x: Current position coordinate
+        v: Current velocity
+        a: Current acceleration
+        calc_acceleration: Callable of the form ``(t, x, v) -> a``
+        stride: If given, also record the state once every this many steps
+        compensation: If given, step with compensated summation, as
+            described in :func:`velocity_verlet`
+
+    Returns:
+        (t, x, v, a), followed by the new compensation tuple if
+        ``compensation`` is given, and then the recorded ``(t, x, v)`` arrays
+        if ``stride`` is given
+    '''
+    if n_steps == 1 and stride is None:
+        # Converting to and from Python floats isn't worth it for one step
+        return velocity_verlet(dt, t, x, v, a, calc_acceleration, compensation=compensation)
+
+    state = (t, x, v, a)
+    if compensation is not None:
+        # Compensated steps are always taken with NumPy, since they are for
+        # low precision states rather than float64 scalars
+        return _take_steps(velocity_verlet, n_steps, stride, dt, state, calc_acceleration, compensation=compensation)
+
+    boxed, unboxed = _unbox_float64(*state)
+
+    if boxed:
+        try:
+            loop = _compiled_loop(_velocity_verlet_loop, stride, calc_acceleration)
+            if loop is not None:
+                state = loop(n_steps, float(dt), *unboxed, *_compiled_args(calc_acceleration))
+                _count_compiled_evaluations(n_steps)
+                return _rebox_float64(boxed, *state)
+            return _take_steps(velocity_verlet, n_steps, stride, dt, unboxed, calc_acceleration, boxed=True)
+        except ArithmeticError:
+            state = _rebox_float64(boxed, *unboxed)
+
+    return (
+        _take_steps_in_place(VelocityVerlet, n_steps, stride, dt, state, calc_acceleration)
+        or _take_steps(velocity_verlet, n_steps, stride, dt, state, calc_acceleration))
+
+def runge_kutta_4th_order_n(n_steps, dt, t, x, v, calc_acceleration, *, stride=None, compensation=None):
+    r'''Take ``n_steps`` steps of :func:`runge_kutta_4th_order` in one call.
+
+    Gives the same result as calling :func:`runge_kutta_4th_order` in a loop.
+    Float64 scalar states are stepped as Python floats, which round the same
+    way as NumPy scalars but are much faster to do arithmetic on. With the
+    ``'numba'`` backend, they are stepped by a compiled loop instead if
+    ``calc_acceleration`` is a :class:`physics_sims.backend.bind`. Large array
+    states are stepped in place by :class:`RK4`, on copies of the arrays, so
+    that the steps don't allocate intermediates.
+
+    Args:
+        n_steps: Number of steps to take
+        dt: Amount of time to integrate over in each step
+        t: Current time
+        x: Current position coordinate
+        v: Current velocity
+        calc_acceleration: Callable of the form ``(t, x, v) -> a``
+        stride: If given, also record the state once every this many steps
+        compensation: If given, step with compensated summation, as
+            described in :func:`runge_kutta_4th_order`
+
+    Returns:
+        (t, x, v), followed by the new compensation tuple if ``compensation``
+        is given, and then the recorded ``(t, x, v)`` arrays if ``stride`` is
+        given
+    '''
+    if n_steps == 1 and stride is None:
+        # Converting to and from Python floats isn't worth it for one step
+        return runge_kutta_4th_order(dt, t, x, v, calc_acceleration, compensation=compensation)
+
+    state = (t, x, v)
+    if compensation is not None:
+        # Compensated steps are always taken with NumPy, since they are for
+        # low precision states rather than float64 scalars
+        return _take_steps(runge_kutta_4th_order, n_steps, stride, dt, state, calc_acceleration, compensation=compensation)
+
+    boxed, unboxed = _unbox_float64(*state)
+
+    if boxed:
+        try:
+            loop = _compiled_loop(_runge_kutta_4th_order_loop, stride, calc_acceleration)
+            if loop is not None:
+                state = loop(n_steps, float(dt), *unboxed, *_compiled_args(calc_acceleration))
+                _count_compiled_evaluations(4 * n_steps)
+                return _rebox_float64(boxed, *state)
+            return _take_steps(runge_kutta_4th_order, n_steps, stride, dt, unboxed, calc_acceleration, boxed=True)
+        except ArithmeticError:
+            state = _rebox_float64(boxed, *unboxed)
+
+    return (
+        _take_steps_in_place(RK4, n_steps, stride, dt, state, calc_acceleration)
+        or _take_steps(runge_kutta_4th_order, n_steps, stride, dt, state, calc_acceleration))
+
+def symplectic_composition_n(n_steps, dt, t, q, p, calc_q_dot, calc_p_dot, scheme, *, stride=None, compensation=None):
+    r'''Take ``n_steps`` steps of :func:`symplectic_composition` in one call.
+
+    Gives the same result as calling :func:`symplectic_composition` in a loop.
+    Float64 scalar states are stepped as Python floats, which round the same
+    way as NumPy scalars but are much faster to do arithmetic on. With the
+    ``'numba'`` backend, they are stepped by a compiled loop instead if
+    ``calc_q_dot`` and ``calc_p_dot`` are each a
+    :class:`physics_sims.backend.bind`. Large array states stepped with the
+    ``VERLET`` scheme are stepped in place by :class:`VerletSymplectic`, on
+    copies of the arrays, so that the steps don't allocate intermediates.
+
+    Args:
+        n_steps: Number of steps to take
+        dt: Amount of time to integrate over in each step
+        t: Current time
+        q: Current position coordinate
+        p: Current momentum coordinate
+        calc_q_dot: Callable of the form ``(p) -> q_dot``
+        calc_p_dot: Callable of the form ``(q) -> p_dot``
+        scheme: Pair of the form ``(drifts, kicks)``
+        stride: If given, also record the state once every this many steps
+        compensation: If given, step with compensated summation, as
+            described in :func:`symplectic_composition`
+
+    Returns:
+        (t, q, p), followed by the new compensation tuple if ``compensation``
+        is given, and then the recorded ``(t, q, p)`` arrays if ``stride`` is
+        given
+    '''
+    if n_steps == 1 and stride is None:
+        # Converting to and from Python floats isn't worth it for one step
+        return symplectic_composition(dt, t, q, p, calc_q_dot, calc_p_dot, scheme, compensation=compensation)
+
+    state = (t, q, p)
+    if compensation is not None:
+        # Compensated steps are always taken with NumPy, since they are for
+        # low precision states rather than float64 scalars
+        return _take_steps(symplectic_composition, n_steps, stride, dt, state, calc_q_dot, calc_p_dot, scheme, compensation=compensation)
+
+    boxed, unboxed = _unbox_float64(*state)
+
+    if boxed:
+        try:
+            loop = _compiled_loop(_symplectic_composition_loop, stride, calc_q_dot, calc_p_dot)
+            if loop is not None:
+                drifts, kicks = scheme
+                state = loop(
+                    n_steps, float(dt), *unboxed,
+                    *_compiled_args(calc_q_dot), *_compiled_args(calc_p_dot),
+                    tuple(map(float, drifts)), tuple(map(float, kicks)))
+                _count_compiled_evaluations((len(drifts) + len(kicks)) * n_steps)
+                return _rebox_float64(boxed, *state)
+            return _take_steps(
+                symplectic_composition, n_steps, stride, dt, unboxed,
+                calc_q_dot, calc_p_dot, scheme, boxed=True)
+        except ArithmeticError:
+            state = _rebox_float64(boxed, *unboxed)
+
+    if scheme == VERLET:
+        result = _take_steps_in_place(VerletSymplectic, n_steps, stride, dt, state, calc_q_dot, calc_p_dot)
+        if result is not None:
+            return result
+
+    return _take_steps(
+        symplectic_composition, n_steps, stride, dt, state,
+        calc_q_dot, calc_p_dot, scheme)
+
+class VelocityVerlet:
+    r'''Allocation free :func:`velocity_verlet` for array states of one shape
+    and dtype.
+
+    The intermediates of each step are kept in buffers that are allocated
+    once, and the state arrays are updated in place, so stepping allocates no
+    memory as long as ``calc_acceleration`` doesn't. Every operation is done
+    in the same order as :func:`velocity_verlet`, so the results are the same
+    bit for bit.
+
+    Args:
+        shape: Shape of the state arrays
+        dtype: Dtype of the state arrays
+    '''
+    def __init__(self, shape, dtype):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._scratch = np.empty(self.shape, dtype=self.dtype)
+        self._a_next = np.empty(self.shape, dtype=self.dtype)
+
+    def step(self, dt, t, x, v, a, calc_acceleration):
+        r'''Take one step, updating ``x``, ``v``, and ``a`` in place.
+
+        Args:
+            dt: Amount of time to integrate over
+            t: Current time
+            x: Current position coordinate
+            v: Current velocity
+            a: Current acceleration
+            calc_acceleration: Callable of the form ``(t, x, v, out) -> out``,
+                which writes the acceleration into ``out``
+
+        Returns:
+            The time after the step
+        '''
+        assert x.shape == v.shape == a.shape == self.shape
+        scratch, a_next = self._scratch, self._a_next
+
+        # x + v * dt + 0.5 * a * dt**2
+        np.multiply(v, dt, out=scratch)
+        np.add(x, scratch, out=x)
+        np.multiply(a, 0.5, out=scratch)
+        np.multiply(scratch, dt**2, out=scratch)
+        np.add(x, scratch, out=x)
+
+        t_next = t + dt
+        calc_acceleration(t_next, x, v, a_next)
+
+        # v + 0.5 * (a + a_next) * dt
+        np.add(a, a_next, out=scratch)
+        np.multiply(scratch, 0.5, out=scratch)
+        np.multiply(scratch, dt, out=scratch)
+        np.add(v, scratch, out=v)
+        np.copyto(a, a_next)
+
+        if _evaluation_counter is not None:
+            _evaluation_counter.count += 1
+
+        return t_next
+
+    def step_n(self, n_steps, dt, t, x, v, a, calc_acceleration):
+        r'''Take ``n_steps`` steps of :meth:`step`.'''
+        for _ in range(n_steps):
+            t = self.step(dt, t, x, v, a, calc_acceleration)
+        return t
+
+class VerletSymplectic:
+    r'''Allocation free :func:`verlet_symplectic` for array states of one
+    shape and dtype. See :class:`VelocityVerlet`.
+
+    Args:
+        shape: Shape of the state arrays
+        dtype: Dtype of the state arrays
+    '''
+    def __init__(self, shape, dtype):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._rate = np.empty(self.shape, dtype=self.dtype)
+
+    def step(self, dt, t, q, p, calc_q_dot, calc_p_dot):
+        r'''Take one step, updating ``q`` and ``p`` in place.
+
+        Args:
+            dt: Amount of time to integrate over
+            t: Current time
+            q: Current position coordinate
+            p: Current momentum coordinate
+            calc_q_dot: Callable of the form ``(p, out) -> out``
+            calc_p_dot: Callable of the form ``(q, out) -> out``
+
+        Returns:
+            The time after the step
+        '''
+        assert q.shape == p.shape == self.shape
+        rate = self._rate
+
+        # q + 0.5 * calc_q_dot(p) * dt
+        calc_q_dot(p, rate)
+        np.multiply(rate, 0.5, out=rate)
+        np.multiply(rate, dt, out=rate)
+        np.add(q, rate, out=q)
+
+        # p + calc_p_dot(q) * dt
+        calc_p_dot(q, rate)
+        np.multiply(rate, dt, out=rate)
+        np.add(p, rate, out=p)
+
+        calc_q_dot(p, rate)
+        np.multiply(rate, 0.5, out=rate)
+        np.multiply(rate, dt, out=rate)
+        np.add(q, rate, out=q)
+
+        if _evaluation_counter is not None:
+            _evaluation_counter.count += 3
+
+        return t + dt
+
+    def step_n(self, n_steps, dt, t, q, p, calc_q_dot, calc_p_dot):
+        r'''Take ``n_steps`` steps of :meth:`step`.'''
+        for _ in range(n_steps):
+            t = self.step(dt, t, q, p, calc_q_dot, calc_p_dot)
+        return t
+
+class RK4:
+    r'''Allocation free :func:`runge_kutta_4th_order` for array states of one
+    shape and dtype. See :class:`VelocityVerlet`.
+
+    Args:
+        shape: Shape of the state arrays
+        dtype: Dtype of the state arrays
+    '''
+    def __init__(self, shape, dtype):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        # The velocity slopes of the four stages, the position slopes, which
+        # are `dt` times the velocity at each stage, and the stage position
+        # and velocity
+        self._kv = np.empty((4,) + self.shape, dtype=self.dtype)
+        self._kx = np.empty((4,) + self.shape, dtype=self.dtype)
+        self._x_stage = np.empty(self.shape, dtype=self.dtype)
+        self._v_stage = np.empty(self.shape, dtype=self.dtype)
+
+    def step(self, dt, t, x, v, calc_acceleration):
+        r'''Take one step, updating ``x`` and ``v`` in place.
+
+        Args:
+            dt: Amount of time to integrate over
+            t: Current time
+            x: Current position coordinate
+            v: Current velocity
+            calc_acceleration: Callable of the form ``(t, x, v, out) -> out``,
+                which writes the acceleration into ``out``
+
+        Returns:
+            The time after the step
+        '''
+        assert x.shape == v.shape == self.shape
+        kv, kx = self._kv, self._kx
+        x_stage, v_stage = self._x_stage, self._v_stage
+
+        calc_acceleration(t, x, v, kv[0])
+        np.multiply(kv[0], dt, out=kv[0])
+        np.multiply(v, dt, out=kx[0])
+
+        # The later stages start from a fraction of the last stage's slopes
+        for stage, fraction, t_stage in [(1, 0.5, t + 0.5 * dt), (2, 0.5, t + 0.5 * dt), (3, 1, t + dt)]:
+            if fraction == 1:
+                np.add(x, kx[stage - 1], out=x_stage)
+                np.add(v, kv[stage - 1], out=v_stage)
+            else:
+                np.multiply(kx[stage - 1], fraction, out=x_stage)
+                np.add(x, x_stage, out=x_stage)
+                np.multiply(kv[stage - 1], fraction, out=v_stage)
+                np.add(v, v_stage, out=v_stage)
+            calc_acceleration(t_stage, x_stage, v_stage, kv[stage])
+            np.multiply(kv[stage], dt, out=kv[stage])
+            np.multiply(v_stage, dt, out=kx[stage])
+
+        # x + (k1x + 2.0 * (k2x + k3x) + k4x) / 6.0, and the same for v
+        for state, k, total in [(x, kx, x_stage), (v, kv, v_stage)]:
+            np.add(k[1], k[2], out=total)
+            np.multiply(total, 2.0, out=total)
+            np.add(k[0], total, out=total)
+            np.add(total, k[3], out=total)
+            np.divide(total, 6.0, out=total)
+            np.add(state, total, out=state)
+
+        if _evaluation_counter is not None:
+            _evaluation_counter.count += 4
+
+        return t + dt
+
+    def step_n(self, n_steps, dt, t, x, v, calc_acceleration):
+        r'''Take ``n_steps`` steps of :meth:`step`.'''
+        for _ in range(n_steps):
+            t = self.step(dt, t, x, v, calc_acceleration)
+        return t
+
+def unbox_float64(*values):
+    r'''Convert float64 scalars to Python floats.
+
+    Parameters that a sim passes into the acceleration function of one of the
+    multi-step integrators can be converted with this, so that the whole step
+    is done in Python float arithmetic. Nothing is converted unless every
+    value is a float64 scalar, since a Python float would not promote a
+    float32 array to float64 the way a float64 scalar does.
+
+    Returns:
+        Tuple of the values
+    '''
+    return _unbox_float64(*values)[1]
+
+# Python ints count as float64 scalars too, since sims often start from
+# something like `t=0`
+_FLOAT64_SCALAR_TYPES = (float, int, np.float64)
+
+def _unbox_float64(*values):
+    # If every value is a float64 scalar, convert them to Python floats.
+    # Returns whether the values were converted, and the values.
+    for value in values:
+        value_type = type(value)
+        if value_type is np.ndarray:
+            if value.ndim != 0 or value.dtype != np.float64:
+                return False, values
+        elif value_type not in _FLOAT64_SCALAR_TYPES:
+            return False, values
+    return True, tuple(map(float, values))
+
+def _rebox_float64(boxed, *values):
+    # Undo `_unbox_float64`, giving the NumPy scalars that the single step
+    # integrators would have returned
+    if boxed:
+        return tuple(map(np.float64, values))
+    return values
+
+def _take_steps(integrator, n_steps, stride, dt, state, *args, boxed=False, compensation=None):
+    # Take `n_steps` steps of a single step `integrator`, whose state starts
+    # with `(t, x, v)`. Python floats raise ArithmeticError on overflow and
+    # division by zero, where NumPy scalars give inf or nan, so callers that
+    # unbox the state redo the steps with NumPy scalars if that happens.
+    # Compensated steps carry the compensation tuple along after the state.
+    record = _StrideRecorder(n_steps, stride, *state[:3])
+
+    for step in range(1, n_steps + 1):
+        if compensation is None:
+            state = integrator(dt, *state, *args)
+        else:
+            *state, compensation = integrator(dt, *state, *args, compensation=compensation)
+        record(step, *state[:3])
+
+    if compensation is not None:
+        return tuple(state) + (compensation,) + record.result()
+    return _rebox_float64(boxed, *state) + record.result()
+
+# Fewest entries in each state array for the multi-step integrators to step
+# it in place. Below this, the extra ufunc calls cost more than the
+# allocations they save.
+_IN_PLACE_MIN_SIZE = 1024
+
+def _take_steps_in_place(integrator_cls, n_steps, stride, dt, state, *functions):
+    # Take `n_steps` steps of a state `(t, *arrays)` with one of the
+    # allocation free integrator classes, on copies of the arrays. Returns
+    # None if the arrays are small or aren't all of one shape and dtype, or
+    # if stepping them in place wouldn't give the same result as the single
+    # step integrator, like when a callback gives an array of another dtype,
+    # which would promote the state.
+    t, *arrays = state
+    shape, dtype = np.shape(arrays[0]), np.result_type(arrays[0])
+    for array in arrays:
+        if type(array) is not np.ndarray or array.shape != shape or array.dtype != dtype:
+            return None
+    if arrays[0].size < _IN_PLACE_MIN_SIZE or dtype.kind not in 'fc' or np.result_type(arrays[0], dt) != dtype:
+        return None
+
+    arrays = [array.copy() for array in arrays]
+    integrator = integrator_cls(shape, dtype)
+    callbacks = [_OutCallback(function) for function in functions]
+    count = evaluation_count()
+    record = _StrideRecorder(n_steps, stride, t, *arrays[:2])
+
+    try:
+        for step in range(1, n_steps + 1):
+            t = integrator.step(dt, t, *arrays, *callbacks)
+            record(step, t, *arrays[:2])
+    except _NotInPlace:
+        if count is not None:
+            _evaluation_counter.count = count
+        return None
+
+    return (t, *arrays) + record.result()
+
+class _NotInPlace(Exception):
+    pass
+
+class _OutCallback:
+    # Adapts a callback of the functional integrators, which returns its
+    # result, to the form `(*args, out) -> out` that the integrator classes
+    # take. Raises `_NotInPlace` if the result doesn't fit in `out` exactly.
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, *args):
+        *args, out = args
+        result = self.function(*args)
+        if np.shape(result) != out.shape or np.result_type(result) != out.dtype:
+            raise _NotInPlace
+        np.copyto(out, result)
+        return out
+
+def _compiled_loop(loop, stride, *functions):
+    # Get the compiled version of the multi-step `loop` if the numba backend
+    # can run it, or None. Compiled loops only handle float64 scalar states and
+    # parameters, where they give the same result as Python float arithmetic.
+    if backend.get_backend() != 'numba' or stride is not None:
+        return None
+
+    for function in functions:
+        if not isinstance(function, backend.bind) or not _unbox_float64(*function.params)[0]:
+            return None
+
+    return backend.compiled(loop)
+
+def _count_compiled_evaluations(count):
+    if _evaluation_counter is not None:
+        _evaluation_counter.count += count
+
+def _compiled_args(function):
+    # Arguments that a compiled loop takes in place of a `backend.bind`
+    return backend.compiled(function.function), _unbox_float64(*function.params)[1]
+
+# The loops below are what the numba backend compiles. Each step has to be
+# written exactly like the single step integrator it replaces, so that the
+# backends give the same results.
+
+@backend.kernel
+def _velocity_verlet_loop(n_steps, dt, t, x, v, a, calc_acceleration, params):
+    for _ in range(n_steps):
+        x_next = x + v * dt + 0.5 * a * dt**2
+        t_next = t + dt
+        a_next = calc_acceleration(t_next, x_next, v, *params)
+        v_next = v + 0.5 * (a + a_next) * dt
+        t, x, v, a = t_next, x_next, v_next, a_next
+    return t, x, v, a
+
+@backend.kernel
+def _runge_kutta_4th_order_loop(n_steps, dt, t, x, v, calc_acceleration, params):
+    for _ in range(n_steps):
+        k1v = dt * calc_acceleration(t, x, v, *params)
+        k1x = dt * v
+
+        k2v = dt * calc_acceleration(
+            t + 0.5 * dt,
+            x + 0.5 * k1x,
+            v + 0.5 * k1v,
+            *params)
+        k2x = dt * (v + 0.5 * k1v)
+
+        k3v = dt * calc_acceleration(
+            t + 0.5 * dt,
+            x + 0.5 * k2x,
+            v + 0.5 * k2v,
+            *params)
+        k3x = dt * (v + 0.5 * k2v)
+
+        k4v = dt * calc_acceleration(
+            t + dt,
+            x + k3x,
+            v + k3v,
+            *params)
+        k4x = dt * (v + k3v)
+
+        t = t + dt
+        x = x + (k1x + 2.0 * (k2x + k3x) + k4x) / 6.0
+        v = v + (k1v + 2.0 * (k2v + k3v) + k4v) / 6.0
+    return t, x, v
+
+@backend.kernel
+def _symplectic_composition_loop(n_steps, dt, t, q, p, calc_q_dot, q_dot_params, calc_p_dot, p_dot_params, drifts, kicks):
+    for _ in range(n_steps):
+        for i in range(len(kicks)):
+            q = q + drifts[i] * calc_q_dot(p, *q_dot_params) * dt
+            p = p + kicks[i] * calc_p_dot(q, *p_dot_params) * dt
+        q = q + drifts[-1] * calc_q_dot(p, *q_dot_params) * dt
+        t = t + dt
+    return t, q, p
+
+class _StrideRecorder:
+    # Records `(t, x, v)` once every `stride` steps for the multi-step
+    # integrators. Does nothing if `stride` is None.
+    def __init__(self, n_steps, stride, t, x, v):
+        self.stride = stride
+        if stride is None:
+            return
+        assert stride >= 1
+        num_records = n_steps // stride
+        self.count = 0
+        self.arrays = tuple(
+            np.empty((num_records,) + np.shape(value), dtype=_record_dtype(value))
+            for value in (t, x, v))
+
+    def __call__(self, step, *values):
+        if self.stride is not None and step % self.stride == 0:
+            for array, value in zip(self.arrays, values):
+                array[self.count] = value
+            self.count += 1
+
+    def result(self):
+        if self.stride is None:
+            return ()
+        return (self.arrays,)
+
+def _record_dtype(value):
+    dtype = np.asarray(value).dtype
+    if dtype.kind in 'biu':
+        return np.dtype(np.float64)
+    return dtype
@@ -1,9 +1,14 @@
 import numpy as np
-from physics_sims import SimRunner, integrators, Sim
+from physics_sims import SimRunner, integrators, Sim, backend, Event
 
+@backend.kernel
 def calc_acceleration(x, k, m):
     return -(k / m) * x
 
+@backend.kernel
+def calc_acceleration_txv(t, x, v, k, m):
+    return calc_acceleration(x, k, m)
+
 class Oscillator1DSim(Sim):
     def __init__(self, t=0, x=2, v=0, m=0.25, k=4, *, dtype=np.float64):
         self.t = np.array(t, dtype=dtype)
@@ -11,24 +16,32 @@ class Oscillator1DSim(Sim):
         self.v = np.array(v, dtype=dtype)
         self.m = np.array(m, dtype=dtype)
         self.k = np.array(k, dtype=dtype)
-        self.a = calc_acceleration(x, k, m)
 
-        self.iters = 0
+        # A batch of parameters doesn't show up in the state until the sim
+        # starts moving, so give the state the batch shape up front
+        self.x, self.v = (np.array(a) for a in np.broadcast_arrays(self.x, self.v, self.m, self.k)[:2])
+        self.a = calc_acceleration(self.x, self.k, self.m)
 
     def update(self, sim_runner, dt):
         self.t, self.x, self.v, self.a = integrators.velocity_verlet(
             dt, self.t, self.x, self.v, self.a,
             lambda _, x, __: calc_acceleration(x, self.k, self.m))
 
-    def draw(self, sim_runner):
-        sim_runner.draw_dot(np.array([self.x, 0]))
+    def advance(self, sim_runner, n, dt):
+        k, m = integrators.unbox_float64(self.k, self.m)
+        self.t, self.x, self.v, self.a = integrators.velocity_verlet_n(
+            n, dt, self.t, self.x, self.v, self.a,
+            backend.bind(calc_acceleration_txv, k, m))
 
-        if self.iters % 1_000 == 0:
-            kinetic = self.calc_kinetic()
-            potential = self.calc_potential()
-            print(f'{self.t}: {kinetic + potential}')
+    def update_adaptive(self, sim_runner, dt, *, rtol, atol):
+        self.t, self.x, self.v, self.a, dt, dt_next = integrators.dormand_prince(
+            dt, self.t, self.x, self.v, self.a,
+            lambda _, x, __: calc_acceleration(x, self.k, self.m),
+            rtol=rtol, atol=atol)
+        return dt, dt_next
 
-        self.iters += 1
+    def draw(self, sim_runner):
+        sim_runner.draw_dot(np.array([self.x, 0]))
     
     def calc_kinetic(self):
         return 0.5 * self.m * self.v**2
@@ -41,5 +54,36 @@ class Oscillator1DSim(Sim):
         potential = self.calc_potential()
         return [self.t, self.x, self.v, kinetic, potential, kinetic + potential]
 
+    def rates(self):
+        return [1, self.v, self.a, None, None, None]
+
+    def solution(self, t):
+        # Simple harmonic motion from the current state
+        x0, v0, m, k = (np.asarray(a, dtype=np.float64) for a in (self.x, self.v, self.m, self.k))
+        tau = np.reshape(t, np.shape(t) + (1,) * x0.ndim) - np.float64(self.t)
+        omega = np.sqrt(k / m)
+        x = x0 * np.cos(omega * tau) + (v0 / omega) * np.sin(omega * tau)
+        v = v0 * np.cos(omega * tau) - x0 * omega * np.sin(omega * tau)
+        kinetic = 0.5 * m * v**2
+        potential = 0.5 * k * x**2
+        return [np.asarray(t, dtype=np.float64), x, v, kinetic, potential, kinetic + potential]
+
+    def events(self):
+        return {
+            # The velocity is zero at each turning point
+            'turning_point': Event(lambda t, x, v, *_: v),
+        }
+
+    def observables(self):
+        return {
+            't': lambda: self.t,
+            'kinetic': self.calc_kinetic,
+            'potential': self.calc_potential,
+            'energy': lambda: self.calc_kinetic() + self.calc_potential(),
+        }
+
+    def interpolated(self):
+        return {'t': None, 'x': None, 'v': None}
+
 if __name__ == '__main__':
     SimRunner().run(sim=Oscillator1DSim(t=-99))
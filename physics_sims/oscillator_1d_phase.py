@@ -1,37 +1,84 @@
 import numpy as np
-from physics_sims import SimRunner, integrators, Sim
+from physics_sims import SimRunner, integrators, Sim, backend, Event
 
+@backend.kernel
 def calc_p_dot(x, k):
     return -k * x
 
+@backend.kernel
 def calc_x_dot(p, m):
     return p / m
 
 class Oscillator1DPhaseSim(Sim):
-    def __init__(self, t0=0, x0=2, v0=0, m=0.25, k=4, *, dtype=np.float32):
+    def __init__(self, t0=0, x0=2, v0=0, m=0.25, k=4, *, scheme=integrators.VERLET, dtype=np.float32):
         self.x = np.array(x0, dtype=dtype)
-        self.p = np.array(m * v0, dtype=dtype)
         self.m = np.array(m, dtype=dtype)
+        self.p = self.m * np.array(v0, dtype=dtype)
         self.k = np.array(k, dtype=dtype)
         self.t = t0
+        self.x, self.p = (np.array(a) for a in np.broadcast_arrays(self.x, self.p, self.k)[:2])
 
-        self.iters = 0
+        self.scheme = scheme
 
     def update(self, sim_runner, dt):
-        self.t, self.x, self.p = integrators.verlet_symplectic(
+        self.t, self.x, self.p = integrators.symplectic_composition(
             dt, self.t, self.x, self.p,
             lambda p: calc_x_dot(p, self.m),
-            lambda q: calc_p_dot(q, self.k))
+            lambda q: calc_p_dot(q, self.k),
+            self.scheme)
+
+    def advance(self, sim_runner, n, dt):
+        m, k = integrators.unbox_float64(self.m, self.k)
+        self.t, self.x, self.p = integrators.symplectic_composition_n(
+            n, dt, self.t, self.x, self.p,
+            backend.bind(calc_x_dot, m),
+            backend.bind(calc_p_dot, k),
+            self.scheme)
 
     def draw(self, sim_runner):
         sim_runner.draw_dot(np.array([self.x, self.p]))
 
-        if self.iters % 1_000 == 0:
-            kinetic = 0.5 * self.p ** 2 / self.m
-            potential = 0.5 * self.k * self.x**2
-            print(f'{self.t}: {kinetic + potential}')
+    def calc_kinetic(self):
+        return 0.5 * self.p**2 / self.m
+
+    def calc_potential(self):
+        return 0.5 * self.k * self.x**2
+
+    def state(self):
+        kinetic = self.calc_kinetic()
+        potential = self.calc_potential()
+        return [self.t, self.x, self.p, kinetic, potential, kinetic + potential]
+
+    def rates(self):
+        return [1, calc_x_dot(self.p, self.m), calc_p_dot(self.x, self.k), None, None, None]
+
+    def solution(self, t):
+        # Simple harmonic motion from the current state
+        x0, p0, m, k = (np.asarray(a, dtype=np.float64) for a in (self.x, self.p, self.m, self.k))
+        tau = np.reshape(t, np.shape(t) + (1,) * x0.ndim) - np.float64(self.t)
+        omega = np.sqrt(k / m)
+        x = x0 * np.cos(omega * tau) + p0 / (m * omega) * np.sin(omega * tau)
+        p = p0 * np.cos(omega * tau) - x0 * m * omega * np.sin(omega * tau)
+        kinetic = 0.5 * p**2 / m
+        potential = 0.5 * k * x**2
+        return [np.asarray(t, dtype=np.float64), x, p, kinetic, potential, kinetic + potential]
+
+    def events(self):
+        return {
+            # The momentum is zero at each turning point
+            'turning_point': Event(lambda t, x, p, *_: p),
+        }
+
+    def observables(self):
+        return {
+            't': lambda: self.t,
+            'kinetic': self.calc_kinetic,
+            'potential': self.calc_potential,
+            'energy': lambda: self.calc_kinetic() + self.calc_potential(),
+        }
 
-        self.iters += 1
+    def interpolated(self):
+        return {'t': None, 'x': None, 'p': None}
 
 if __name__ == '__main__':
     SimRunner().run(sim=Oscillator1DPhaseSim())
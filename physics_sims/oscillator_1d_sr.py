@@ -1,11 +1,16 @@
 import numpy as np
-from physics_sims import Sim, SimRunner, integrators
+from physics_sims import Sim, SimRunner, integrators, backend, Event
 
 c = 1
 
+@backend.kernel
 def calc_acceleration(x, v, k, m):
     return -(k / m) * x * (1 - (v/c)**2)**(1.5)
 
+@backend.kernel
+def calc_acceleration_txv(t, x, v, k, m):
+    return calc_acceleration(x, v, k, m)
+
 class Oscillator1DSRSim(Sim):
     def __init__(self, t=0, x=2, v=0, m=0.25, k=4, *, dtype=np.float32):
         self.t = t
@@ -13,23 +18,33 @@ class Oscillator1DSRSim(Sim):
         self.v = np.array(v, dtype=dtype)
         self.m = np.array(m, dtype=dtype)
         self.k = np.array(k, dtype=dtype)
+        self.x, self.v = (np.array(a) for a in np.broadcast_arrays(self.x, self.v, self.m, self.k)[:2])
 
-        self.iters = 0
+        self.a = None
 
     def update(self, sim_runner, dt):
         self.t, self.x, self.v = integrators.runge_kutta_4th_order(
             dt, self.t, self.x, self.v,
             lambda _, x, v: calc_acceleration(x, v, self.k, self.m))
+        # The acceleration carried between adaptive steps is stale now
+        self.a = None
 
-    def draw(self, sim_runner):
-        sim_runner.draw_dot(np.array([self.x, 0]))
+    def advance(self, sim_runner, n, dt):
+        k, m = integrators.unbox_float64(self.k, self.m)
+        self.t, self.x, self.v = integrators.runge_kutta_4th_order_n(
+            n, dt, self.t, self.x, self.v,
+            backend.bind(calc_acceleration_txv, k, m))
+        self.a = None
 
-        if self.iters % 1_000 == 0:
-            kinetic = self.calc_kinetic()
-            potential = self.calc_potential()
-            print(f'{self.t}: {kinetic} {potential} {kinetic + potential}')
+    def update_adaptive(self, sim_runner, dt, *, rtol, atol):
+        self.t, self.x, self.v, self.a, dt, dt_next = integrators.dormand_prince(
+            dt, self.t, self.x, self.v, self.a,
+            lambda _, x, v: calc_acceleration(x, v, self.k, self.m),
+            rtol=rtol, atol=atol)
+        return dt, dt_next
 
-        self.iters += 1
+    def draw(self, sim_runner):
+        sim_runner.draw_dot(np.array([self.x, 0]))
 
     def calc_kinetic(self):
         return self.m * (1 - self.v**2)**-0.5 - self.m
@@ -42,5 +57,26 @@ class Oscillator1DSRSim(Sim):
         potential = self.calc_potential()
         return [self.t, self.x, self.v, kinetic, potential, kinetic + potential]
 
+    def rates(self):
+        a = calc_acceleration(self.x, self.v, self.k, self.m) if self.a is None else self.a
+        return [1, self.v, a, None, None, None]
+
+    def events(self):
+        return {
+            # The velocity is zero at each turning point
+            'turning_point': Event(lambda t, x, v, *_: v),
+        }
+
+    def observables(self):
+        return {
+            't': lambda: self.t,
+            'kinetic': self.calc_kinetic,
+            'potential': self.calc_potential,
+            'energy': lambda: self.calc_kinetic() + self.calc_potential(),
+        }
+
+    def interpolated(self):
+        return {'t': None, 'x': None, 'v': None}
+
 if __name__ == '__main__':
     SimRunner().run(sim=Oscillator1DSRSim())
@@ -1,8 +1,9 @@
 import numpy as np
-from physics_sims import SimRunner, integrators, Sim
+from physics_sims import SimRunner, integrators, Sim, backend
 
 c = 1
 
+@backend.kernel
 def calc_acceleration(t, x, v, k, m, v_b):
     return -k/m * (1 - v**2)**1.5 * (x + v_b * t) / (1-v_b**2)**0.5
 
@@ -14,22 +15,35 @@ class Oscillator1DSRBoostSim(Sim):
         self.m = np.array(m, dtype=dtype)
         self.k = np.array(k, dtype=dtype)
         self.v_boost = np.array(v_boost, dtype=dtype)
-        self.iters = 0
+
+        # A batch of boosts doesn't show up in the state until the sim starts
+        # moving, so give the state the batch shape up front
+        self.x, self.v = (np.array(a) for a in np.broadcast_arrays(self.x, self.v, self.v_boost)[:2])
+        self.a = None
 
     def update(self, sim_runner, dt):
         self.t, self.x, self.v = integrators.runge_kutta_4th_order(
             dt, self.t, self.x, self.v,
             lambda t, x, v: calc_acceleration(t, x, v, self.k, self.m, self.v_boost))
+        # The acceleration carried between adaptive steps is stale now
+        self.a = None
 
-    def draw(self, sim_runner):
-        sim_runner.draw_dot(np.array([self.x, 0]))
+    def advance(self, sim_runner, n, dt):
+        k, m, v_boost = integrators.unbox_float64(self.k, self.m, self.v_boost)
+        self.t, self.x, self.v = integrators.runge_kutta_4th_order_n(
+            n, dt, self.t, self.x, self.v,
+            backend.bind(calc_acceleration, k, m, v_boost))
+        self.a = None
 
-        if self.iters % 1_000 == 0:
-            kinetic = self.calc_kinetic()
-            potential = self.calc_potential()
-            print(f'{self.t}: {kinetic} {potential} {kinetic + potential}')
+    def update_adaptive(self, sim_runner, dt, *, rtol, atol):
+        self.t, self.x, self.v, self.a, dt, dt_next = integrators.dormand_prince(
+            dt, self.t, self.x, self.v, self.a,
+            lambda t, x, v: calc_acceleration(t, x, v, self.k, self.m, self.v_boost),
+            rtol=rtol, atol=atol)
+        return dt, dt_next
 
-        self.iters += 1
+    def draw(self, sim_runner):
+        sim_runner.draw_dot(np.array([self.x, 0]))
 
     # TODO: Update this with time dependence
     def calc_kinetic(self):
@@ -44,5 +58,20 @@ class Oscillator1DSRBoostSim(Sim):
         potential = self.calc_potential()
         return [self.t, self.x, self.v, kinetic, potential, kinetic + potential]
 
+    def rates(self):
+        a = calc_acceleration(self.t, self.x, self.v, self.k, self.m, self.v_boost) if self.a is None else self.a
+        return [1, self.v, a, None, None, None]
+
+    def observables(self):
+        return {
+            't': lambda: self.t,
+            'kinetic': self.calc_kinetic,
+            'potential': self.calc_potential,
+            'energy': lambda: self.calc_kinetic() + self.calc_potential(),
+        }
+
+    def interpolated(self):
+        return {'t': None, 'x': None, 'v': None}
+
 if __name__ == '__main__':
     SimRunner().run(sim=Oscillator1DSRBoostSim(), time_scale=1)
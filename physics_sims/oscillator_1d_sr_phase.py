@@ -1,42 +1,76 @@
 import numpy as np
-from physics_sims import SimRunner, integrators, Sim
+from physics_sims import SimRunner, integrators, Sim, backend, Event
 
 c = 1
 
+@backend.kernel
 def calc_p_dot(x, k):
     return -k * x
 
+@backend.kernel
 def calc_x_dot(p, m):
     return p * (m**2 + p**2)**(-0.5)
 
 class Oscillator1DSRPhaseSim(Sim):
-    def __init__(self, t=0, x=2, v=0, m=0.25, k=4, *, dtype=np.float32):
+    def __init__(self, t=0, x=2, v=0, m=0.25, k=4, *, scheme=integrators.VERLET, dtype=np.float32):
+        v = np.asarray(v)
         self.x = np.array(x, dtype=dtype)
         self.p = np.array(m * v * (1 - v**2)**(-0.5), dtype=dtype)
         self.m = np.array(m, dtype=dtype)
         self.k = np.array(k, dtype=dtype)
+        self.x, self.p = (np.array(a) for a in np.broadcast_arrays(self.x, self.p, self.k)[:2])
         self.t = t
 
-        self.iters = 0
+        self.scheme = scheme
 
     def update(self, sim_runner, dt):
-        self.t, self.x, self.p = integrators.verlet_symplectic(
+        self.t, self.x, self.p = integrators.symplectic_composition(
             dt, self.t, self.x, self.p,
             lambda p: calc_x_dot(p, self.m),
-            lambda q: calc_p_dot(q, self.k))
+            lambda q: calc_p_dot(q, self.k),
+            self.scheme)
+
+    def advance(self, sim_runner, n, dt):
+        m, k = integrators.unbox_float64(self.m, self.k)
+        self.t, self.x, self.p = integrators.symplectic_composition_n(
+            n, dt, self.t, self.x, self.p,
+            backend.bind(calc_x_dot, m),
+            backend.bind(calc_p_dot, k),
+            self.scheme)
 
     def draw(self, sim_runner):
         sim_runner.draw_dot(np.array([self.x, self.p/5]))
 
-        if self.iters % 1_000 == 0:
-            kinetic = 0.5 * self.p ** 2 / self.m
-            potential = 0.5 * self.k * self.x**2
+    def calc_kinetic(self):
+        return (self.m**2 + self.p**2)**0.5 - self.m
+
+    def calc_potential(self):
+        return 0.5 * self.k * self.x**2
+
+    def state(self):
+        kinetic = self.calc_kinetic()
+        potential = self.calc_potential()
+        return [self.t, self.x, self.p, kinetic, potential, kinetic + potential]
+
+    def rates(self):
+        return [1, calc_x_dot(self.p, self.m), calc_p_dot(self.x, self.k), None, None, None]
+
+    def events(self):
+        return {
+            # The momentum is zero at each turning point
+            'turning_point': Event(lambda t, x, p, *_: p),
+        }
 
-            kinetic = (self.m**2 + self.p**2)**0.5 - self.m
-            potential = 0.5 * self.k * self.x**2
-            print(f'{self.t}: {kinetic + potential}')
+    def observables(self):
+        return {
+            't': lambda: self.t,
+            'kinetic': self.calc_kinetic,
+            'potential': self.calc_potential,
+            'energy': lambda: self.calc_kinetic() + self.calc_potential(),
+        }
 
-        self.iters += 1
+    def interpolated(self):
+        return {'t': None, 'x': None, 'p': None}
 
 if __name__ == '__main__':
     SimRunner().run(sim=Oscillator1DSRPhaseSim())
@@ -1,9 +1,14 @@
 import numpy as np
-from physics_sims import Sim, SimRunner, integrators
+from physics_sims import Sim, SimRunner, integrators, backend, Event
 
+@backend.kernel
 def calc_theta_ddot(theta, g, R):
     return - (g / R) * np.sin(theta)
 
+@backend.kernel
+def calc_theta_ddot_txv(t, theta, theta_dot, g, R):
+    return calc_theta_ddot(theta, g, R)
+
 def calc_xy(theta, R):
         x = -R * np.sin(theta)
         y = -R * np.cos(theta)
@@ -12,31 +17,62 @@ def calc_xy(theta, R):
 class Pendulum2DSim(Sim):
     def __init__(self, t=0, theta=3, theta_dot=0, m=10, g=9.8, R=3, *, dtype=np.float32):
         self.t = t
-        self.theta = theta
-        self.theta_dot = theta_dot
-        self.m = m
-        self.g = g
-        self.R = R
+        self.theta = np.array(theta, dtype=dtype)
+        self.theta_dot = np.array(theta_dot, dtype=dtype)
+        self.m = np.array(m, dtype=dtype)
+        self.g = np.array(g, dtype=dtype)
+        self.R = np.array(R, dtype=dtype)
+        self.theta, self.theta_dot = (
+            np.array(a) for a in np.broadcast_arrays(self.theta, self.theta_dot, self.m, self.g, self.R)[:2])
 
         self.theta_ddot = 0
-        self.iters = 0
 
     def update(self, sim_runner, dt):
         self.t, self.theta, self.theta_dot, self.theta_ddot = integrators.velocity_verlet(
             dt, self.t, self.theta, self.theta_dot, self.theta_ddot,
             lambda _, theta, __: calc_theta_ddot(theta, self.g, self.R))
 
+    def advance(self, sim_runner, n, dt):
+        _, g, R = integrators.unbox_float64(self.theta, self.g, self.R)
+        self.t, self.theta, self.theta_dot, self.theta_ddot = integrators.velocity_verlet_n(
+            n, dt, self.t, self.theta, self.theta_dot, self.theta_ddot,
+            backend.bind(calc_theta_ddot_txv, g, R))
+
     def draw(self, sim_runner):
         sim_runner.draw_dot(calc_xy(self.theta, self.R))
         sim_runner.draw_dot(np.array([0, 0]))
 
-        if self.iters % 1_000 == 0:
-            kinetic = 0.5 * self.m * (self.R * self.theta_dot)**2
-            potential = -self.m * self.g * self.R * np.cos(self.theta)
-            total = kinetic + potential
-            print(f'{self.t} {kinetic} {potential} {total}')
+    def calc_kinetic(self):
+        return 0.5 * self.m * (self.R * self.theta_dot)**2
+
+    def calc_potential(self):
+        return -self.m * self.g * self.R * np.cos(self.theta)
+
+    def state(self):
+        kinetic = self.calc_kinetic()
+        potential = self.calc_potential()
+        return [self.t, self.theta, self.theta_dot, kinetic, potential, kinetic + potential]
+
+    def rates(self):
+        # `theta_ddot` starts out as 0 rather than the initial acceleration,
+        # so it is calculated here
+        return [1, self.theta_dot, calc_theta_ddot(self.theta, self.g, self.R), None, None, None]
+
+    def events(self):
+        return {
+            'theta_zero': Event(lambda t, theta, *_: theta),
+        }
+
+    def observables(self):
+        return {
+            't': lambda: self.t,
+            'kinetic': self.calc_kinetic,
+            'potential': self.calc_potential,
+            'energy': lambda: self.calc_kinetic() + self.calc_potential(),
+        }
 
-        self.iters += 1
+    def interpolated(self):
+        return {'t': None, 'theta': 2 * np.pi, 'theta_dot': None}
 
 if __name__ == '__main__':
     SimRunner().run(sim=Pendulum2DSim())
@@ -1,9 +1,11 @@
 import numpy as np
-from physics_sims import Sim, SimRunner, integrators
+from physics_sims import Sim, SimRunner, integrators, backend, Event
 
+@backend.kernel
 def calc_p_dot(theta, m, g, R):
     return -m * g * R * np.sin(theta)
 
+@backend.kernel
 def calc_theta_dot(p, m, R):
     return p / (m * R**2)
 
@@ -13,33 +15,67 @@ def calc_xy(theta, R):
         return np.array([x, y])
 
 class Pendulum2DPhaseSim(Sim):
-    def __init__(self, t=0, theta0=3, theta_dot0=0, m=10, g=9.8, R=3, *, dtype=np.float32):
+    def __init__(self, t=0, theta0=3, theta_dot0=0, m=10, g=9.8, R=3, *, scheme=integrators.VERLET, dtype=np.float32):
         self.t = t
-        self.theta = theta0
-        self.p = m * (R**2) * theta_dot0
-        self.m = m
-        self.g = g
-        self.R = R
+        self.theta = np.array(theta0, dtype=dtype)
+        self.m = np.array(m, dtype=dtype)
+        self.g = np.array(g, dtype=dtype)
+        self.R = np.array(R, dtype=dtype)
+        self.p = self.m * (self.R**2) * np.array(theta_dot0, dtype=dtype)
+        self.theta, self.p = (np.array(a) for a in np.broadcast_arrays(self.theta, self.p, self.g)[:2])
 
-        self.iters = 0
+        self.scheme = scheme
 
     def update(self, sim_runner, dt):
-        self.t, self.theta, self.p = integrators.verlet_symplectic(
+        self.t, self.theta, self.p = integrators.symplectic_composition(
             dt, self.t, self.theta, self.p,
             lambda p: calc_theta_dot(p, self.m, self.R),
-            lambda theta: calc_p_dot(theta, self.m, self.g, self.R))
+            lambda theta: calc_p_dot(theta, self.m, self.g, self.R),
+            self.scheme)
+
+    def advance(self, sim_runner, n, dt):
+        _, m, g, R = integrators.unbox_float64(self.theta, self.m, self.g, self.R)
+        self.t, self.theta, self.p = integrators.symplectic_composition_n(
+            n, dt, self.t, self.theta, self.p,
+            backend.bind(calc_theta_dot, m, R),
+            backend.bind(calc_p_dot, m, g, R),
+            self.scheme)
 
     def draw(self, sim_runner):
         sim_runner.draw_dot(calc_xy(self.theta, self.R))
         sim_runner.draw_dot(np.array([0, 0]))
 
-        if self.iters % 1_000 == 0:
-            kinetic = self.p**2 / (2 * self.m * self.R**2)
-            potential = -self.m * self.g * self.R * np.cos(self.theta)
-            total = kinetic + potential
-            print(f'{self.t} {kinetic} {potential} {total}')
+    def calc_kinetic(self):
+        return self.p**2 / (2 * self.m * self.R**2)
+
+    def calc_potential(self):
+        return -self.m * self.g * self.R * np.cos(self.theta)
+
+    def state(self):
+        kinetic = self.calc_kinetic()
+        potential = self.calc_potential()
+        return [self.t, self.theta, self.p, kinetic, potential, kinetic + potential]
+
+    def rates(self):
+        return [
+            1, calc_theta_dot(self.p, self.m, self.R), calc_p_dot(self.theta, self.m, self.g, self.R),
+            None, None, None]
+
+    def events(self):
+        return {
+            'theta_zero': Event(lambda t, theta, *_: theta),
+        }
+
+    def observables(self):
+        return {
+            't': lambda: self.t,
+            'kinetic': self.calc_kinetic,
+            'potential': self.calc_potential,
+            'energy': lambda: self.calc_kinetic() + self.calc_potential(),
+        }
 
-        self.iters += 1
+    def interpolated(self):
+        return {'t': None, 'theta': 2 * np.pi, 'p': None}
 
 if __name__ == '__main__':
     SimRunner().run(sim=Pendulum2DPhaseSim())
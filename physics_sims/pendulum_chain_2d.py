@@ -0,0 +1,123 @@
+import numpy as np
+from physics_sims import Sim, SimRunner, integrators
+
+class PendulumChain2DSim(Sim):
+    # A planar pendulum of `N` links, each hanging from the end of the one
+    # before it, with all of its mass at its end. The last axis of `theta`,
+    # `omega`, `m`, and `R` indexes the links, from the one at the pivot
+    # outwards. Any leading axes are batch axes. With two links, this is the
+    # same system as `DoublePendulum2DSim`.
+    def __init__(self, theta=(np.pi/2, np.pi), omega=None, m=1, R=2, g=9.80, *, dtype=np.float32):
+        self.t = 0
+        self.theta = np.array(theta, dtype=dtype)
+        self.omega = np.zeros_like(self.theta) if omega is None else np.array(omega, dtype=dtype)
+        assert self.theta.ndim >= 1
+
+        num_links = self.theta.shape[-1]
+        self.m = np.broadcast_to(np.array(m, dtype=dtype), np.shape(m)[:-1] + (num_links,)).copy()
+        self.R = np.broadcast_to(np.array(R, dtype=dtype), np.shape(R)[:-1] + (num_links,)).copy()
+        self.g = np.array(g, dtype=dtype)
+        self.theta, self.omega = (
+            np.array(a) for a in np.broadcast_arrays(self.theta, self.omega, self.m, self.R, self.g[..., None])[:2])
+
+        # Link `i` carries the masses at the ends of itself and every link
+        # after it, so the mass matrix and the generalized forces only depend
+        # on the configuration through the angles between links:
+        #
+        #   M_ij = mu_max(i,j) R_i R_j cos(theta_i - theta_j)
+        #   f_i = -sum_j mu_max(i,j) R_i R_j sin(theta_i - theta_j) omega_j^2
+        #         - g mu_i R_i sin(theta_i)
+        #
+        # where `mu_i` is the sum of the masses from link `i` outwards. The
+        # parts that don't depend on the configuration are calculated once
+        # here, rather than on every stage of every step.
+        mu = np.cumsum(self.m[..., ::-1], axis=-1)[..., ::-1]
+        outer = np.maximum.outer(np.arange(num_links), np.arange(num_links))
+        self.link_inertia = mu[..., outer] * self.R[..., :, None] * self.R[..., None, :]
+        self.link_weight = self.g[..., None] * mu * self.R
+
+        self.alpha = self.calc_alpha(self.theta, self.omega)
+
+    def calc_alpha(self, theta, omega):
+        # The cosines and sines of the angles between links come from the
+        # ones of each link's angle, which takes `N` trig calls rather than
+        # `N^2`. The products are done in place, since with many links these
+        # `(..., N, N)` arrays are most of the work besides the solve.
+        cos, sin = np.cos(theta), np.sin(theta)
+        mass_matrix = cos[..., :, None] * cos[..., None, :]
+        mass_matrix += sin[..., :, None] * sin[..., None, :]
+        mass_matrix *= self.link_inertia
+
+        coupling = sin[..., :, None] * cos[..., None, :]
+        coupling -= cos[..., :, None] * sin[..., None, :]
+        coupling *= self.link_inertia
+        force = -np.einsum('...ij,...j->...i', coupling, omega**2) - self.link_weight * sin
+
+        return np.linalg.solve(mass_matrix, force[..., None])[..., 0].astype(theta.dtype, copy=False)
+
+    def calc_energy(self):
+        cos_diff = np.cos(self.theta[..., :, None] - self.theta[..., None, :])
+        kinetic = 0.5 * np.einsum(
+            '...i,...ij,...j->...', self.omega, self.link_inertia * cos_diff, self.omega)
+        potential = -(self.link_weight * np.cos(self.theta)).sum(axis=-1)
+        return kinetic, potential
+
+    def update(self, sim_runner, dt):
+        self.t, self.theta, self.omega = integrators.runge_kutta_4th_order(
+            dt, self.t, self.theta, self.omega,
+            lambda _, theta, omega: self.calc_alpha(theta, omega))
+        # The acceleration carried between adaptive steps is stale now
+        self.alpha = None
+
+    def advance(self, sim_runner, n, dt):
+        self.t, self.theta, self.omega = integrators.runge_kutta_4th_order_n(
+            n, dt, self.t, self.theta, self.omega,
+            lambda _, theta, omega: self.calc_alpha(theta, omega))
+        self.alpha = None
+
+    def update_adaptive(self, sim_runner, dt, *, rtol, atol):
+        self.t, self.theta, self.omega, self.alpha, dt, dt_next = integrators.dormand_prince(
+            dt, self.t, self.theta, self.omega, self.alpha,
+            lambda _, theta, omega: self.calc_alpha(theta, omega),
+            rtol=rtol, atol=atol)
+        return dt, dt_next
+
+    # Like `DoublePendulum2DSim`, the angle and angular velocity of each link
+    # are separate fields, so that each field has the batch shape
+    def state(self):
+        kinetic, potential = self.calc_energy()
+        return [
+            self.t,
+            *np.moveaxis(self.theta, -1, 0), *np.moveaxis(self.omega, -1, 0),
+            kinetic, potential, kinetic + potential]
+
+    def draw(self, sim_runner):
+        x = np.cumsum(self.R * np.sin(self.theta), axis=-1)
+        y = -np.cumsum(self.R * np.cos(self.theta), axis=-1)
+
+        sim_runner.draw_dot([0, 0])
+        sim_runner.draw_dots(np.stack([x, y], axis=-1))
+
+    def rates(self):
+        alpha = self.calc_alpha(self.theta, self.omega) if self.alpha is None else self.alpha
+        return [
+            1,
+            *np.moveaxis(self.omega, -1, 0), *np.moveaxis(alpha, -1, 0),
+            None, None, None]
+
+    def observables(self):
+        return {
+            't': lambda: self.t,
+            'kinetic': lambda: self.calc_energy()[0],
+            'potential': lambda: self.calc_energy()[1],
+            'energy': lambda: sum(self.calc_energy()),
+        }
+
+    def interpolated(self):
+        return {'t': None, 'theta': 2 * np.pi, 'omega': None}
+
+if __name__ == '__main__':
+    num_links = 8
+    SimRunner().run(
+        sim=PendulumChain2DSim(theta=np.full(num_links, np.pi / 2), R=8 / num_links),
+        time_delta=0.005, time_scale=20)
@@ -0,0 +1,111 @@
+import time
+
+from physics_sims import integrators
+
+class Profiler:
+    r'''Collects timings of the phases of a :class:`SimRunner` loop.
+
+    The runner only calls into a profiler while profiling is enabled, so it
+    costs nothing otherwise. Evaluations of the functions passed to the
+    integrators are counted with :func:`integrators.count_evaluations` for as
+    long as the profiler is active.
+    '''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        r'''Clear everything collected so far.'''
+        self._phase_seconds = {}
+        self._phase_calls = {}
+        self._frames = 0
+        self._late_frames = 0
+        self._dropped_frames = 0
+        self._steps = 0
+        self._steps_since_frame = 0
+        self._max_steps_per_frame = 0
+        self._slowdown_seconds = 0
+        self._start_time = time.perf_counter()
+        integrators.count_evaluations(True)
+
+    def stop(self):
+        r'''Stop counting evaluations.'''
+        integrators.count_evaluations(False)
+
+    def add_phase(self, phase, start):
+        r'''Add the time from ``start``, a :func:`time.perf_counter` reading,
+        until now to ``phase``.
+        '''
+        elapsed = time.perf_counter() - start
+        self._phase_seconds[phase] = self._phase_seconds.get(phase, 0) + elapsed
+        self._phase_calls[phase] = self._phase_calls.get(phase, 0) + 1
+
+    def add_steps(self, num_steps):
+        r'''Record that the sim took ``num_steps`` steps.'''
+        self._steps += num_steps
+        self._steps_since_frame += num_steps
+
+    def add_slowdown(self, seconds):
+        r'''Record that ``seconds`` of wall time were dropped because the sim
+        fell too far behind the wall clock.
+        '''
+        self._slowdown_seconds += seconds
+
+    def add_frame(self, frame_interval, frame_period):
+        r'''Record that a frame was drawn ``frame_interval`` seconds after the
+        previous one, when frames are meant to be ``frame_period`` apart.
+        '''
+        self._frames += 1
+        self._max_steps_per_frame = max(self._max_steps_per_frame, self._steps_since_frame)
+        self._steps_since_frame = 0
+
+        # The first frame has no previous frame to be late compared to
+        if self._frames > 1 and frame_interval > 1.5 * frame_period:
+            self._late_frames += 1
+            self._dropped_frames += int(frame_interval / frame_period) - 1
+
+    def stats(self):
+        r'''Get everything collected so far.
+
+        Returns:
+            Dict with the total and mean seconds spent in each phase, the
+            number of frames, late frames, and dropped frames, the number of
+            steps and steps per frame, the wall time dropped because the sim
+            fell behind, and the number of evaluations of the functions passed
+            to the integrators
+        '''
+        elapsed = time.perf_counter() - self._start_time
+        evaluations = integrators.evaluation_count()
+        return {
+            'elapsed_seconds': elapsed,
+            'phases': {
+                phase: {
+                    'total_seconds': seconds,
+                    'calls': self._phase_calls[phase],
+                    'mean_seconds': seconds / self._phase_calls[phase],
+                }
+                for phase, seconds in self._phase_seconds.items()
+            },
+            'frames': self._frames,
+            'late_frames': self._late_frames,
+            'dropped_frames': self._dropped_frames,
+            'steps': self._steps,
+            'mean_steps_per_frame': self._steps / self._frames if self._frames else None,
+            'max_steps_per_frame': self._max_steps_per_frame,
+            'slowdown_seconds': self._slowdown_seconds,
+            'evaluations': evaluations,
+            'evaluations_per_second': evaluations / elapsed if evaluations is not None else None,
+        }
+
+    def overlay_lines(self):
+        r'''Get lines of text summarizing the stats, to draw over the sim.'''
+        stats = self.stats()
+        lines = [
+            f'fps {stats["frames"] / stats["elapsed_seconds"]:.0f}  '
+            f'late {stats["late_frames"]}  dropped {stats["dropped_frames"]}',
+            f'steps/frame {stats["mean_steps_per_frame"] or 0:.1f} (max {stats["max_steps_per_frame"]})  '
+            f'slowdown {stats["slowdown_seconds"]:.2f} s',
+            f'evals/s {stats["evaluations_per_second"] or 0:.3g}',
+        ]
+        for phase, phase_stats in stats['phases'].items():
+            lines.append(f'{phase} {1e3 * phase_stats["mean_seconds"]:.3f} ms')
+        return lines
@@ -1,11 +1,16 @@
 import numpy as np
-from physics_sims import Sim, SimRunner, integrators
+from physics_sims import Sim, SimRunner, integrators, backend
 
 c = 1
 
+@backend.kernel
 def calc_acceleration(x, v, k, m):
     return -k * (1 - v**2) / (m + k * x)
 
+@backend.kernel
+def calc_acceleration_txv(t, x, v, k, m):
+    return calc_acceleration(x, v, k, m)
+
 class ScalarFieldSimple1DSim(Sim):
     def __init__(self, t=0, x=0, v=0, m=0.25, k=-0.1, *, dtype=np.float32):
         self.t = t
@@ -13,13 +18,30 @@ class ScalarFieldSimple1DSim(Sim):
         self.v = np.array(v, dtype=dtype)
         self.m = np.array(m, dtype=dtype)
         self.k = np.array(k, dtype=dtype)
+        self.x, self.v = (np.array(a) for a in np.broadcast_arrays(self.x, self.v, self.m, self.k)[:2])
 
-        self.iters = 0
+        self.a = None
 
     def update(self, sim_runner, dt):
         self.t, self.x, self.v = integrators.runge_kutta_4th_order(
             dt, self.t, self.x, self.v,
             lambda _, x, v: calc_acceleration(x, v, self.k, self.m))
+        # The acceleration carried between adaptive steps is stale now
+        self.a = None
+
+    def advance(self, sim_runner, n, dt):
+        k, m = integrators.unbox_float64(self.k, self.m)
+        self.t, self.x, self.v = integrators.runge_kutta_4th_order_n(
+            n, dt, self.t, self.x, self.v,
+            backend.bind(calc_acceleration_txv, k, m))
+        self.a = None
+
+    def update_adaptive(self, sim_runner, dt, *, rtol, atol):
+        self.t, self.x, self.v, self.a, dt, dt_next = integrators.dormand_prince(
+            dt, self.t, self.x, self.v, self.a,
+            lambda _, x, v: calc_acceleration(x, v, self.k, self.m),
+            rtol=rtol, atol=atol)
+        return dt, dt_next
 
     def calc_kinetic(self):
         return -self.m * c**2 * ((1 - (self.v / c)**2)**0.5 - 1)
@@ -30,17 +52,27 @@ class ScalarFieldSimple1DSim(Sim):
         
     def draw(self, sim_runner):
         sim_runner.draw_dot(np.array([self.x, 0]))
-        if self.iters % 1_000 == 0:
-            kinetic = self.calc_kinetic()
-            potential = self.calc_potential()
-            print(f'{self.t}: {kinetic} {potential} {kinetic + potential} {self.v}')
-
-        self.iters += 1
 
     def state(self):
         kinetic = self.calc_kinetic()
         potential = self.calc_potential()
         return [self.t, self.x, self.v, kinetic, potential, kinetic + potential]
 
+    def rates(self):
+        a = calc_acceleration(self.x, self.v, self.k, self.m) if self.a is None else self.a
+        return [1, self.v, a, None, None, None]
+
+    def observables(self):
+        return {
+            't': lambda: self.t,
+            'v': lambda: self.v,
+            'kinetic': self.calc_kinetic,
+            'potential': self.calc_potential,
+            'energy': lambda: self.calc_kinetic() + self.calc_potential(),
+        }
+
+    def interpolated(self):
+        return {'t': None, 'x': None, 'v': None}
+
 if __name__ == '__main__':
     SimRunner().run(ScalarFieldSimple1DSim(), time_delta=0.0001)
@@ -1,5 +1,5 @@
-import pygame
-
+# pygame is only imported by the code that draws, so that sims can be run
+# headless without loading it
 class Sim:
     def __init__(self):
         raise NotImplementedError('method must be defined by subclass')
@@ -7,11 +7,85 @@ class Sim:
     def update(self, sim_runner, dt):
         raise NotImplementedError('method must be defined by subclass')
 
+    # Take `n` steps of size `dt`. Sims can override this to take all the
+    # steps in one call to a multi-step integrator, which avoids the overhead
+    # of calling `update` in a loop.
+    def advance(self, sim_runner, n, dt):
+        for _ in range(n):
+            self.update(sim_runner, dt)
+
+    # Take one step of at most `dt` with an adaptive step size integrator,
+    # keeping the local error within `rtol` and `atol`. Returns the step size
+    # actually taken and the step size to try next.
+    def update_adaptive(self, sim_runner, dt, *, rtol, atol):
+        raise NotImplementedError('adaptive stepping is not supported by this sim')
+
     def state(self):
         raise NotImplementedError('method must be defined by subclass')
-    
+
+    # Copy everything needed to put the sim back in its current state with
+    # `restore`. By default, this is every attribute that holds a number, an
+    # array, or None, which covers the state arrays, the parameters, and
+    # anything the integrators carry over between steps, like the
+    # acceleration `a` of velocity Verlet. Sims with other kinds of state
+    # have to override both methods. Returns a dict mapping each attribute
+    # name to its value.
+    def snapshot(self):
+        import numpy as np
+        return {
+            name: value.copy() if isinstance(value, np.ndarray) else value
+            for name, value in vars(self).items()
+            if value is None or isinstance(value, (int, float, np.generic, np.ndarray))
+        }
+
+    # Put the sim back in the state given by a `snapshot` of it, or of
+    # another sim of the same class constructed with the same non-numeric
+    # arguments, like `scheme` or `dtype`. Stepping it afterwards gives the
+    # same results bit for bit as stepping the sim that the snapshot was
+    # taken from.
+    def restore(self, snapshot):
+        import numpy as np
+        for name, value in snapshot.items():
+            setattr(self, name, value.copy() if isinstance(value, np.ndarray) else value)
+
+    # Rates of change of the fields of `state()`, which the runner records
+    # for dense output. Returns a list with one entry per field, holding None
+    # for fields whose rate isn't known, or None if no rates are known. Fields
+    # without a rate are interpolated with rates estimated from neighboring
+    # records instead.
+    def rates(self):
+        return None
+
+    # Exact state at each of the times `t`, for sims whose motion has a
+    # closed form solution, starting from the current state at `self.t`. The
+    # sim is not changed. Returns a list laid out like `state()`, with each
+    # field given an extra leading axis for the times, or None if there is no
+    # closed form.
+    def solution(self, t):
+        return None
+
+    # Named events that the runner can find in the sim's trajectory, like
+    # turning points. Returns a dict mapping each name to an `Event`.
+    def events(self):
+        return {}
+
+    # Named quantities that the runner's diagnostics can sample, like
+    # energies. Returns a dict mapping each name to a function of no
+    # arguments that gives the current value.
+    def observables(self):
+        return {}
+
+    # Attributes that threaded runs blend between the two newest snapshots
+    # of the sim when drawing a frame, so that the motion looks smooth.
+    # Returns a dict mapping each name to the period of the attribute, for
+    # angles and anything else that wraps around, or None if it doesn't
+    # wrap. Attributes that aren't listed are drawn as they are in the
+    # newest snapshot.
+    def interpolated(self):
+        return {}
+
     def draw(self, sim_runner):
         raise NotImplementedError('method must be defined by subclass')
 
-    def handle_event(self, event: pygame.event.Event):
+    def handle_event(self, event: 'pygame.event.Event'):
         pass
\ No newline at end of file
@@ -1,7 +1,21 @@
+import collections
+import copy
+import itertools
+import multiprocessing
+import multiprocessing.shared_memory
 import numpy as np
+import os
+import queue
+import threading
 import time
+import warnings
 
-from physics_sims import Sim
+from physics_sims import Sim, integrators
+from physics_sims.checkpoint import load_checkpoint, save_checkpoint
+from physics_sims.diagnostics import Diagnostics
+from physics_sims.events import find_events
+from physics_sims.profiling import Profiler
+from physics_sims.trajectory import Trajectory, split_fields
 
 class SimRunner:
     def __init__(self, screen_size=(500, 500), screen_coord_scale=(10, 10)):
@@ -14,60 +28,822 @@ class SimRunner:
         # The simulation coordinate of the center point of the screen
         self._screen_coord_center = np.array([0, 0]) 
 
+        # Profiler of the run loops, or None if profiling is disabled
+        self._profiler = None
+        self._show_overlay = False
+
+        # Diagnostics that the observables of running sims are sampled into,
+        # or None if diagnostics are disabled
+        self._diagnostics = None
+
     def screen_size(self):
         return self._screen_size.tolist()
 
-    def run_headless(self, sim, run_time, *, time_delta=0.001):
+    def enable_profiling(self, enabled=True, *, overlay=False):
+        r'''Turn profiling of :meth:`run` and :meth:`run_headless` on or off.
+
+        Turning it on clears any stats collected before. While profiling,
+        pressing F3 in :meth:`run` toggles an overlay that shows the stats.
+
+        Args:
+            enabled: Whether to profile
+            overlay: Whether to start with the overlay shown
+        '''
+        if self._profiler is not None:
+            self._profiler.stop()
+        self._profiler = Profiler() if enabled else None
+        self._show_overlay = overlay
+
+    def enable_diagnostics(self, enabled=True, *, capacity=4096, every=1000):
+        r'''Turn sampling of the observables of the sims that this runner
+        runs on or off. See :class:`Diagnostics`.
+
+        Args:
+            enabled: Whether to sample
+            capacity: Number of samples to keep
+            every: Number of steps between samples
+        '''
+        self._diagnostics = Diagnostics(capacity, every) if enabled else None
+
+    def diagnostics(self):
+        r'''Get the :class:`Diagnostics` that the observables of running sims
+        are sampled into, or ``None`` if diagnostics are disabled.
+        '''
+        return self._diagnostics
+
+    def _attach_diagnostics(self, sim):
+        diagnostics = self._diagnostics
+        if diagnostics is not None:
+            diagnostics.attach(sim)
+        return diagnostics
+
+    def stats(self):
+        r'''Get the stats collected since profiling was turned on.
+
+        Returns:
+            Dict of stats described in :meth:`Profiler.stats`, or ``None`` if
+            profiling is off
+        '''
+        return None if self._profiler is None else self._profiler.stats()
+
+    def run_headless(self, sim, run_time, *, time_delta=0.001, record_every=1, max_records=None, out=None,
+                     adaptive=False, rtol=1e-6, atol=1e-9, t_eval=None, checkpoint=None, checkpoint_every=None,
+                     dense=False, events=None, analytic=False):
+        r'''Run a simulation without graphics, recording its trajectory.
+
+        The trajectory is written into an array that is allocated up front, so
+        memory use stays flat over the run. ``sim.state()`` is only called on
+        recorded steps, so a sim that ends the run by returning ``None`` stops
+        at the next recorded step.
+
+        Long runs that stream to ``out`` can save checkpoints as they go. If
+        the run is stopped, calling this again with the same arguments and a
+        newly constructed sim resumes it from the last checkpoint, giving the
+        same trajectory bit for bit as a run that was never stopped.
+        Checkpoints are written by a background thread, so stepping only
+        waits for the sim to be copied.
+
+        Args:
+            sim: Sim to run
+            run_time: Amount of simulation time to run for
+            time_delta: Size of each time step. If ``adaptive`` is set, this is
+                the size of the first step to try.
+            record_every: Record the state once every this many steps
+            max_records: If given, stop the run once this many states have
+                been recorded
+            out: If given, path of a ``.npy`` file to stream the trajectory
+                into as the run progresses. The file can be opened later with
+                ``np.load(out, mmap_mode='r')``.
+            adaptive: If True, step with ``sim.update_adaptive``, which picks
+                the step sizes to keep the local error within ``rtol`` and
+                ``atol``. If the step size underflows, as it does when the
+                sim runs into a singularity, a warning is given and the run
+                ends at the last accepted step.
+            rtol: Relative tolerance for adaptive stepping
+            atol: Absolute tolerance for adaptive stepping
+            t_eval: If given, record the state only at these increasing times,
+                measured from the start of the run, rather than on accepted
+                steps. Adaptive steps are shortened to land on each of them.
+            checkpoint: If given, path of a checkpoint file to save the state
+                of the run in, and to resume the run from if it already
+                exists. Requires ``out``, and is not supported for adaptive
+                runs.
+            checkpoint_every: Save a checkpoint once every this many steps.
+                Must be a multiple of ``record_every``.
+            dense: If True, also record ``sim.rates()`` on each recorded step,
+                and return a :class:`Trajectory` that can be evaluated at any
+                time in the run. If ``out`` is given, the rates are stored in
+                the file after the fields of each record.
+            events: If given, dict mapping names to :class:`Event` objects to
+                find in the trajectory, like the ones given by
+                ``sim.events()``. This implies ``dense``, and the times of
+                each event are stored in the ``events`` dict of the returned
+                :class:`Trajectory`, as described in :func:`find_events`. If
+                any of the events are terminal, the run stops at the first
+                record after the terminal event has happened to every member
+                of the ensemble.
+            analytic: If True, evaluate the exact state at every record time
+                with ``sim.solution`` in one vectorized call, rather than
+                stepping the sim. The sim is left unchanged. Record times are
+                the ones a fixed step run would have, or ``t_eval``. Not
+                supported with checkpoints, dense output, or events.
+
+        Returns:
+            Array of shape ``(records, fields)``, where each row holds the
+            flattened entries of ``sim.state()``. If ``out`` is given, this is
+            a memmap of the file. If ``dense`` is set, a :class:`Trajectory` of
+            the records instead.
+        '''
+        if t_eval is not None:
+            num_records = len(t_eval)
+        elif adaptive:
+            # The number of accepted steps isn't known until the run is over
+            num_records = None
+        else:
+            num_records = _num_steps(run_time, time_delta) // record_every + 1
+
+        if max_records is not None:
+            num_records = max_records if num_records is None else min(num_records, max_records)
+
+        if num_records is None and out is not None:
+            raise ValueError(
+                'adaptive runs can only be streamed to a file if t_eval or '
+                'max_records bounds the number of records')
+
+        if analytic:
+            if num_records is None or checkpoint is not None or dense or events is not None:
+                raise ValueError(
+                    'analytic runs need fixed steps or t_eval, and do not support checkpoints, dense output, '
+                    'or events')
+            return self._analytic_states(sim, num_records, record_every * time_delta, t_eval, out)
+
+        if events is not None:
+            dense = True
+            terminal_events = [event for event in events.values() if event.terminal]
+
+        # Number of steps taken and records written before a resumed run
+        start_step = 0
+        count = 0
+        if checkpoint is not None:
+            if out is None or adaptive or t_eval is not None:
+                raise ValueError('checkpoints are only supported for fixed step runs that are streamed to out')
+            if checkpoint_every is None or checkpoint_every < 1 or checkpoint_every % record_every != 0:
+                raise ValueError(
+                    f'expected checkpoint_every to be a positive multiple of record_every, but got {checkpoint_every}')
+            if os.path.exists(checkpoint):
+                snapshot, info = load_checkpoint(checkpoint)
+                _check_resume(info, checkpoint, sim, time_delta, record_every)
+                sim.restore(snapshot)
+                start_step = info['step']
+                count = info['offset']
+
+        rows = self._recorded_states(
+            sim, run_time, time_delta, record_every, adaptive, rtol, atol, t_eval, start_step, dense)
+        state = next(rows, None)
+        if state is None:
+            return np.empty((0, 0))
+        if dense:
+            # The sim is still at the state that was just recorded
+            field_shapes = [np.shape(field) for field in sim.state()]
+            num_fields = state.size // 2
+        shape = (1024 if num_records is None else num_records, state.size)
+        dtype = _record_dtype(state.dtype)
+
+        if out is None:
+            states = np.empty(shape, dtype=dtype)
+        elif count:
+            states = np.load(out, mmap_mode='r+')
+            if states.shape != shape or states.dtype != dtype:
+                raise ValueError(
+                    f'cannot resume from {checkpoint!r}, since {out!r} has shape {states.shape} and dtype '
+                    f'{states.dtype}, but the run records shape {shape} and dtype {dtype}')
+        else:
+            states = np.lib.format.open_memmap(out, mode='w+', dtype=dtype, shape=shape)
+
+        if not count:
+            # A resumed run has already recorded the state it starts from
+            states[0] = state
+            count = 1
+
+        writer = None if checkpoint is None else _CheckpointWriter(checkpoint, states)
+        terminal = None
+        if events is not None and terminal_events:
+            terminal = _TerminalEvents(terminal_events, field_shapes, states[count - 1, :num_fields])
+
+        try:
+            if count != num_records:
+                for state in rows:
+                    if count == len(states):
+                        states = np.concatenate([states, np.empty_like(states)])
+                    states[count] = state
+                    count += 1
+
+                    step = (count - 1) * record_every
+                    if writer is not None and step % checkpoint_every == 0:
+                        self._save_checkpoint(writer, sim, time_delta, record_every, step, count)
+
+                    if count == num_records:
+                        break
+                    if terminal is not None and terminal.update(states[count - 1, :num_fields]):
+                        break
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if out is None:
+            states = states[:count]
+        else:
+            states.flush()
+            if count < num_records:
+                del states
+                _shrink_npy(out, count)
+                states = np.load(out, mmap_mode='r+')
+
+        if dense:
+            trajectory = Trajectory(states[:, :num_fields], states[:, num_fields:], field_shapes)
+            if events is not None:
+                trajectory.events = {name: find_events(trajectory, event) for name, event in events.items()}
+            return trajectory
+        return states
+
+    def iter_headless(self, sim, run_time, *, time_delta=0.001, record_every=1, chunk_size=4096,
+                      adaptive=False, rtol=1e-6, atol=1e-9, t_eval=None):
+        r'''Run a simulation without graphics, yielding its trajectory in
+        chunks as the run progresses.
+
+        Only one chunk is held in memory at a time, so this can be used for
+        runs whose trajectory does not fit in memory. See :meth:`run_headless`
+        for the meaning of the arguments.
+
+        Args:
+            chunk_size: Number of records in each chunk
+
+        Yields:
+            Arrays of shape ``(records, fields)``, where each row holds the
+            flattened entries of ``sim.state()``. Every chunk holds
+            ``chunk_size`` records, except possibly the last one.
+        '''
+        assert chunk_size >= 1
+        rows = self._recorded_states(
+            sim, run_time, time_delta, record_every, adaptive, rtol, atol, t_eval)
+        state = next(rows, None)
+        if state is None:
+            return
+        chunk = np.empty((chunk_size, state.size), dtype=_record_dtype(state.dtype))
+        chunk[0] = state
+        count = 1
+
+        for state in rows:
+            if count == chunk_size:
+                yield chunk
+                chunk = np.empty_like(chunk)
+                count = 0
+            chunk[count] = state
+            count += 1
+
+        yield chunk[:count]
+
+    def _save_checkpoint(self, writer, sim, time_delta, record_every, step, offset):
+        # Hand a copy of the sim to the checkpoint writer. The copy is the
+        # only part of saving a checkpoint that stepping waits for.
+        profiler = self._profiler
+        start = None if profiler is None else time.perf_counter()
+        writer.put(
+            sim.snapshot(), sim=type(sim).__name__, time_delta=time_delta, record_every=record_every,
+            step=step, offset=offset)
+        if profiler is not None:
+            profiler.add_phase('checkpoint', start)
+
+    def _analytic_states(self, sim, num_records, record_delta, t_eval, out):
+        # Evaluate the closed form solution of `sim` at each record time,
+        # flattening each field the same way that stepped records are
+        assert isinstance(sim, Sim)
+        if t_eval is None:
+            times = np.arange(num_records) * record_delta
+        else:
+            times = np.asarray(t_eval, dtype=np.float64)[:num_records]
+        state = sim.solution(np.float64(sim.t) + times)
+        if state is None:
+            raise ValueError(f'{type(sim).__name__} has no closed form solution')
+        fields = [np.reshape(field, (num_records, -1)) for field in state]
+        dtype = _record_dtype(np.result_type(*fields))
+
+        if out is None:
+            states = np.empty((num_records, sum(field.shape[1] for field in fields)), dtype=dtype)
+        else:
+            states = np.lib.format.open_memmap(
+                out, mode='w+', dtype=dtype, shape=(num_records, sum(field.shape[1] for field in fields)))
+        np.concatenate(fields, axis=1, out=states)
+        if out is not None:
+            states.flush()
+        return states
+
+    def _recorded_states(self, sim, run_time, time_delta, record_every, adaptive, rtol, atol, t_eval,
+                         start_step=0, dense=False):
+        # Run `sim`, yielding the state on each recorded step, starting with
+        # the initial state. The initial state is flattened into an array,
+        # and the rest are in a form that can be assigned into a row of an
+        # array. A run resumed from a checkpoint gives `start_step`, the
+        # number of steps that were already taken. If `dense` is set, the
+        # rates of the fields are recorded after them.
+        assert isinstance(sim, Sim)
+        assert record_every >= 1
+        self._attach_diagnostics(sim)
+        read_state = (lambda: _with_rates(sim)) if dense else sim.state
+
+        if adaptive or t_eval is not None:
+            yield from self._adaptive_recorded_states(
+                sim, read_state, run_time, time_delta, record_every, rtol, atol, t_eval)
+            return
+
+        state = read_state()
+        if state is None:
+            return
+        to_row = _row_converter(state)
+        yield _state_row(state)
+
+        profiler = self._profiler
+        diagnostics = self._diagnostics
+
+        for _ in range(_num_steps(run_time, time_delta) // record_every - start_step // record_every):
+            if profiler is None:
+                sim.advance(self, record_every, time_delta)
+                state = read_state()
+            else:
+                start = time.perf_counter()
+                sim.advance(self, record_every, time_delta)
+                profiler.add_phase('physics', start)
+                profiler.add_steps(record_every)
+
+                start = time.perf_counter()
+                state = read_state()
+                profiler.add_phase('state', start)
+
+            if diagnostics is not None:
+                diagnostics.add_steps(record_every)
+
+            if state is None:
+                return
+            yield to_row(state)
+
+    def _adaptive_recorded_states(self, sim, read_state, run_time, time_delta, record_every, rtol, atol, t_eval):
+        if t_eval is None:
+            stop_times = [run_time]
+        else:
+            stop_times = np.asarray(t_eval)
+            assert np.all(np.diff(stop_times) > 0), 't_eval must be increasing'
+            assert stop_times[0] >= 0 and stop_times[-1] <= run_time, (
+                't_eval must be within the run time')
+
+        state = read_state()
+        if state is None:
+            return
+        to_row = _row_converter(state)
+        # The first state yielded has to be flattened into an array
+        started = t_eval is None or stop_times[0] == 0
+        if started:
+            yield _state_row(state)
+
+        elapsed = 0
+        dt = time_delta
+        step = 0
+        profiler = self._profiler
+        diagnostics = self._diagnostics
+
+        for stop_time in stop_times:
+            while elapsed < stop_time:
+                dt_try = min(dt, stop_time - elapsed)
+                try:
+                    if profiler is None:
+                        dt_taken, dt_next = sim.update_adaptive(self, dt_try, rtol=rtol, atol=atol)
+                    else:
+                        start = time.perf_counter()
+                        dt_taken, dt_next = sim.update_adaptive(self, dt_try, rtol=rtol, atol=atol)
+                        profiler.add_phase('physics', start)
+                        profiler.add_steps(1)
+                except integrators.StepSizeUnderflowError as error:
+                    # The sim ran into a singularity, like the one that
+                    # `ScalarFieldSimple1DSim` reaches where `m + k x = 0`.
+                    # The sim is still at the last accepted step, so the run
+                    # ends there, keeping what was recorded.
+                    warnings.warn(f'{error}, so the run ends at the last accepted step')
+                    if t_eval is None and step % record_every != 0:
+                        state = read_state()
+                        if state is not None:
+                            yield to_row(state)
+                    return
+                if diagnostics is not None:
+                    diagnostics.add_steps(1)
+                step += 1
+
+                if dt_taken == dt_try < dt:
+                    # Landed on the stop time. Keep trying the step size from
+                    # before it was shortened.
+                    elapsed = stop_time
+                else:
+                    elapsed += dt_taken
+                    dt = dt_next
+
+                if t_eval is None and step % record_every == 0:
+                    state = read_state()
+                    if state is None:
+                        return
+                    yield to_row(state)
+
+            if t_eval is not None and stop_time > 0:
+                state = read_state()
+                if state is None:
+                    return
+                yield to_row(state) if started else _state_row(state)
+                started = True
+
+    def run_ensemble(self, sim, run_time, *, time_delta=0.001):
+        r'''Run a batch of simulations without graphics.
+
+        The initial conditions and parameters given to ``sim`` carry a leading
+        batch axis, so each call to ``sim.update`` advances every member of the
+        ensemble at once.
+
+        Args:
+            sim: Sim constructed with batched initial conditions
+            run_time: Amount of simulation time to run for
+            time_delta: Size of each time step
+
+        Returns:
+            Array of shape ``(batch, steps, fields)``, where the fields are the
+            entries of ``sim.state()``
+        '''
         assert isinstance(sim, Sim)
-        cur_time = 0
-        states = [sim.state()]
+        num_steps = _num_steps(run_time, time_delta)
+        diagnostics = self._attach_diagnostics(sim)
 
-        while cur_time < run_time:
-            cur_time += time_delta
+        state = _ensemble_state(sim.state())
+        states = np.empty(
+            (state.shape[0], num_steps + 1, state.shape[1]),
+            dtype=_record_dtype(state.dtype))
+        states[:, 0] = state
+
+        for step in range(1, num_steps + 1):
             sim.update(self, time_delta)
+            if diagnostics is not None:
+                diagnostics.add_steps(1)
             state = sim.state()
             if state is None:
-                cur_time = run_time
+                return states[:, :step]
+            states[:, step] = _ensemble_state(state)
+
+        return states
+
+    def sweep(self, sim_cls, param_grid, run_time, *, time_delta=0.001, record_every=1, workers=None,
+              chunk_size=1, reduce=None):
+        r'''Run a headless simulation for every combination of constructor
+        arguments, spread over a pool of worker processes.
+
+        Full trajectories are written by the workers straight into a block of
+        shared memory, so they are never pickled. Runs that end early are
+        padded with NaN.
+
+        Args:
+            sim_cls: Sim class to construct
+            param_grid: Dict that maps each constructor argument to the
+                sequence of values to sweep it over. Every combination of
+                values is run, with the last argument varying fastest.
+            run_time: Amount of simulation time to run each sim for
+            time_delta: Size of each time step
+            record_every: Record the state once every this many steps
+            workers: Number of worker processes. Defaults to the number of
+                CPUs. If 1, the runs are done in this process.
+            chunk_size: Number of runs handed to a worker at a time
+            reduce: If given, a picklable callable of the form
+                ``(trajectory) -> summary`` that each worker applies to its
+                trajectories, so that only the summaries are kept, like
+                :func:`final_state`, :func:`max_energy_drift`, or
+                :func:`period`
+
+        Returns:
+            ``(params, results)``, where ``params`` is the list of constructor
+            argument dicts, in the order that they were run, and ``results``
+            is an array whose first axis indexes ``params``. Without
+            ``reduce``, ``results`` has shape ``(runs, records, fields)``.
+            With it, each entry is a summary.
+        '''
+        assert isinstance(sim_cls, type) and issubclass(sim_cls, Sim)
+        names = list(param_grid)
+        params = [dict(zip(names, values)) for values in itertools.product(*param_grid.values())]
+        tasks = [(sim_cls, p, run_time, time_delta, record_every) for p in params]
+
+        if workers is None:
+            workers = os.cpu_count()
+
+        if reduce is not None:
+            task_fn = _SweepReduceTask(self, reduce)
+            if workers == 1:
+                summaries = list(map(task_fn, tasks))
+            else:
+                with multiprocessing.Pool(workers) as pool:
+                    summaries = pool.map(task_fn, tasks, chunksize=chunk_size)
+            return params, np.array(summaries)
+
+        # Find the shape of a trajectory from the initial state of the first
+        # run, so the shared block can be allocated before any run starts
+        state = _state_row(sim_cls(**params[0]).state())
+        shape = (len(params), _num_steps(run_time, time_delta) // record_every + 1, state.size)
+        dtype = _record_dtype(state.dtype)
+
+        if workers == 1:
+            results = np.empty(shape, dtype=dtype)
+            for index, task in enumerate(tasks):
+                _write_sweep_run(self, results, index, task)
+            return params, results
+
+        shared = multiprocessing.shared_memory.SharedMemory(
+            create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        try:
+            with multiprocessing.Pool(
+                    workers, initializer=_init_sweep_worker,
+                    initargs=(self, shared.name, shape, dtype)) as pool:
+                pool.map(_run_sweep_task, enumerate(tasks), chunksize=chunk_size)
+
+            results = np.ndarray(shape, dtype=dtype, buffer=shared.buf).copy()
+        finally:
+            shared.close()
+            shared.unlink()
+
+        return params, results
+
+    def render_headless(self, sim, run_time, *, fps=60, time_delta=0.001, out=None, queue_size=16):
+        r'''Render a simulation to frames without a display.
+
+        The sim is drawn with its own ``draw`` method onto an offscreen
+        surface, with SDL's dummy video driver standing in for a display if
+        none is open. Frame ``k`` shows the sim at time ``k / fps`` from the
+        start, so the output only depends on the arguments, not on how fast
+        the machine is.
+
+        Args:
+            sim: Sim to render
+            run_time: Amount of simulation time to render
+            fps: Number of frames per unit of simulation time
+            time_delta: Size of each time step
+            out: If given, where to write the frames instead of returning
+                them. A path containing a ``%`` format, like
+                ``'frames/%05d.png'``, gives a sequence of image files, in any
+                format that ``pygame.image.save`` supports. Any other path
+                gives a raw video file of RGB24 frames, which can be encoded
+                with ``ffmpeg -f rawvideo -pix_fmt rgb24 -s WxH -r FPS -i
+                PATH``. The files are written by a background thread, so
+                stepping and drawing only wait if it falls more than
+                ``queue_size`` frames behind.
+            queue_size: Number of frames that can wait to be written
+
+        Returns:
+            If ``out`` is not given, a uint8 array of shape
+            ``(frames, height, width, 3)``. Otherwise, the number of frames
+            written.
+        '''
+        import pygame
+        assert isinstance(sim, Sim)
+        num_frames = _num_steps(run_time, 1 / fps) + 1
+        width, height = self._screen_size.tolist()
+
+        opened_display = not pygame.display.get_init()
+        if opened_display:
+            driver = os.environ.get('SDL_VIDEODRIVER')
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            pygame.display.init()
+            pygame.display.set_mode((1, 1))
+            if driver is None:
+                del os.environ['SDL_VIDEODRIVER']
+            else:
+                os.environ['SDL_VIDEODRIVER'] = driver
+
+        screen = self.__dict__.get('_screen')
+        self._screen = pygame.Surface((width, height))
+        writer = None if out is None else _FrameWriter(out, queue_size)
+        diagnostics = self._attach_diagnostics(sim)
+
+        try:
+            if writer is None:
+                frames = np.empty((num_frames, height, width, 3), dtype=np.uint8)
+
+            steps_taken = 0
+            for frame in range(num_frames):
+                # Count steps from the start rather than per frame, so rounding
+                # doesn't build up over the run
+                steps = _num_steps(frame / fps, time_delta)
+                if steps > steps_taken:
+                    sim.advance(self, steps - steps_taken, time_delta)
+                    if diagnostics is not None:
+                        diagnostics.add_steps(steps - steps_taken)
+                    steps_taken = steps
+
+                self._screen.fill((255, 255, 255))
+                sim.draw(self)
+                pixels = pygame.image.tobytes(self._screen, 'RGB')
+
+                if writer is None:
+                    frames[frame] = np.frombuffer(pixels, dtype=np.uint8).reshape(height, width, 3)
+                else:
+                    writer.put(frame, pixels, (width, height))
+        finally:
+            if writer is not None:
+                writer.close()
+            if screen is None:
+                del self._screen
             else:
-                states.append(sim.state())
+                self._screen = screen
+            if opened_display:
+                pygame.display.quit()
 
-        return np.array(states)
+        return num_frames if writer is not None else frames
 
-    def run(self, sim, *, time_delta=0.001, time_scale=1, draw_freq=120):
+    def run(self, sim, *, time_delta=0.001, time_scale=1, draw_freq=120, threaded=False, max_catch_up_steps=None):
+        r'''Run a simulation in a window, keeping the sim time in step with
+        the wall clock.
+
+        Args:
+            sim: Sim to run
+            time_delta: Size of each time step
+            time_scale: Amount of sim time that passes per second of wall time
+            draw_freq: Number of frames to draw per second
+            threaded: If True, step the sim on a separate thread and draw it
+                from snapshots. Each frame is interpolated between the two
+                newest snapshots, so slow drawing doesn't hold up the physics
+                and slow physics doesn't freeze the window.
+            max_catch_up_steps: If given, the most steps to take at once to
+                catch the sim up to the wall clock. When the sim falls further
+                behind than this, the rest of the lag is dropped, so the sim
+                runs slower than real time. A warning is given the first time
+                this happens, and the dropped time is reported as
+                ``slowdown_seconds`` by :meth:`stats`.
+        '''
         import pygame
         assert isinstance(sim, Sim)
         pygame.init()
         self._screen = pygame.display.set_mode(self._screen_size)
 
+        clock = _CatchUpClock(time_delta, time_scale, max_catch_up_steps)
+        self._attach_diagnostics(sim)
+
+        if threaded:
+            self._run_threaded(sim, clock, 1 / draw_freq)
+        else:
+            self._run_interleaved(sim, clock, 1 / draw_freq)
+
+        pygame.quit()
+
+    def _run_interleaved(self, sim, clock, t_graphics_update_period):
         t = time.time()
-        t_sim = t
+        clock.start(t)
         t_last_graphics_update = -float('inf')
 
-        t_graphics_update_period = 1 / draw_freq
-
         running = True
         while running:
-            if t - t_last_graphics_update >= t_graphics_update_period:
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        running = False
-                    else:
-                        sim.handle_event(event)
-
-                self._screen.fill((255, 255, 255))
+            profiler = self._profiler
 
-                sim.draw(self)
+            if t - t_last_graphics_update >= t_graphics_update_period:
+                if profiler is not None:
+                    profiler.add_frame(t - t_last_graphics_update, t_graphics_update_period)
 
-                pygame.display.flip()
+                running = self._handle_events(sim.handle_event, profiler)
+                self._draw_frame(sim, profiler)
                 t_last_graphics_update = t
     
-            while t_sim < t:
-                sim.update(self, time_delta)
-                t_sim += time_delta / time_scale
+            num_steps = clock.steps_due(t, profiler)
+            if num_steps:
+                if profiler is None:
+                    sim.advance(self, num_steps, clock.time_delta)
+                else:
+                    start = time.perf_counter()
+                    sim.advance(self, num_steps, clock.time_delta)
+                    profiler.add_phase('physics', start)
+                    profiler.add_steps(num_steps)
+
+                diagnostics = self._diagnostics
+                if diagnostics is not None:
+                    diagnostics.add_steps(num_steps)
 
             t = time.time()
 
-        pygame.quit()
+    def _run_threaded(self, sim, clock, t_graphics_update_period):
+        # Only the physics thread touches `sim`. Events are queued up in
+        # `pending_events` and handled by the physics thread between batches
+        # of steps. After each batch, it appends a snapshot of the sim and the
+        # wall time that the snapshot is for to `snapshots`, which keeps the
+        # newest two.
+        pending_events = collections.deque()
+        stop = threading.Event()
+        errors = []
+        t = time.time()
+        clock.start(t)
+        snapshots = collections.deque([(t, _snapshot(sim))] * 2, maxlen=2)
+
+        def step_physics():
+            try:
+                while not stop.is_set():
+                    while pending_events:
+                        sim.handle_event(pending_events.popleft())
+
+                    t = time.time()
+                    num_steps = clock.steps_due(t, self._profiler)
+                    if not num_steps:
+                        time.sleep(max(clock.t_sim - t, 0))
+                        continue
+
+                    profiler = self._profiler
+                    start = time.perf_counter()
+                    sim.advance(self, num_steps, clock.time_delta)
+                    if profiler is not None:
+                        profiler.add_phase('physics', start)
+                        profiler.add_steps(num_steps)
+                    diagnostics = self._diagnostics
+                    if diagnostics is not None:
+                        diagnostics.add_steps(num_steps)
+                    snapshots.append((clock.t_sim, _snapshot(sim)))
+            except BaseException as error:
+                errors.append(error)
+
+        physics_thread = threading.Thread(target=step_physics, name='physics', daemon=True)
+        physics_thread.start()
+
+        renderer = _SnapshotRenderer(sim)
+        t_last_graphics_update = -float('inf')
+
+        running = True
+        try:
+            while running and not errors:
+                profiler = self._profiler
+                t = time.time()
+
+                if profiler is not None:
+                    profiler.add_frame(t - t_last_graphics_update, t_graphics_update_period)
+                t_last_graphics_update = t
+
+                running = self._handle_events(pending_events.append, profiler)
+
+                (t0, snapshot0), (t1, snapshot1) = snapshots
+                alpha = 1 if t1 <= t0 else min(max((t - t0) / (t1 - t0), 0), 1)
+                self._draw_frame(renderer.interpolate(snapshot0, snapshot1, alpha), profiler)
+
+                time.sleep(max(t + t_graphics_update_period - time.time(), 0))
+        finally:
+            stop.set()
+            physics_thread.join()
+
+        if errors:
+            raise errors[0]
+
+    def _handle_events(self, handle_event, profiler):
+        # Pass the pending events to `handle_event`. Returns False if the
+        # window was closed.
+        import pygame
+        if profiler is not None:
+            start = time.perf_counter()
+
+        events = pygame.event.get()
+
+        if profiler is not None:
+            profiler.add_phase('events', start)
+
+        running = True
+        for event in events:
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3 and profiler is not None:
+                self._show_overlay = not self._show_overlay
+            else:
+                handle_event(event)
+        return running
+
+    def _draw_frame(self, sim, profiler):
+        import pygame
+        if profiler is not None:
+            start = time.perf_counter()
+
+        self._screen.fill((255, 255, 255))
+
+        sim.draw(self)
+
+        if profiler is not None:
+            profiler.add_phase('draw', start)
+            if self._show_overlay:
+                self._draw_overlay(profiler.overlay_lines())
+            start = time.perf_counter()
+
+        pygame.display.flip()
+
+        if profiler is not None:
+            profiler.add_phase('flip', start)
+
+    def _draw_overlay(self, lines):
+        import pygame
+        if not hasattr(self, '_overlay_font'):
+            pygame.font.init()
+            self._overlay_font = pygame.font.SysFont(pygame.font.get_default_font(), 20)
+
+        for i, line in enumerate(lines):
+            text = self._overlay_font.render(line, True, (200, 0, 0))
+            self._screen.blit(text, (5, 5 + 18 * i))
 
     # TODO: It would be much better to separate drawing APIs like this into a
     # SimGraphics object that the SimRunner owns. `sim.update` would be given
@@ -86,8 +862,500 @@ class SimRunner:
             draw_position,
             5)
 
+    def draw_dots(self, positions, colors=None, radius=5):
+        r'''Draw a dot at each of an array of positions.
+
+        The dots are rasterized all at once into the pixels of the screen,
+        which is much faster than calling :meth:`draw_dot` in a loop. Where
+        dots overlap, later ones are drawn on top of earlier ones. Dots with a
+        radius under 1 are drawn as single pixels.
+
+        Args:
+            positions: Array of shape ``(N, 2)`` of sim coordinates
+            colors: RGB color of all the dots, or array of shape ``(N, 3)``
+                giving the color of each dot. Defaults to black.
+            radius: Radius of the dots in pixels
+        '''
+        import pygame
+        positions = np.reshape(positions, (-1, 2))
+        colors = np.asarray((0, 0, 0) if colors is None else colors, dtype=int)
+
+        # Convert to screen coordinates like `convert_to_draw_position`, but
+        # with x and y in separate arrays, which are faster to go through
+        scale = self._screen_size / self._screen_coord_scale
+        offset = self._screen_size // 2 - self._screen_coord_center * scale
+        x = np.rint(positions[:, 0] * scale[0] + offset[0]).astype(np.intp)
+        y = np.rint(positions[:, 1] * scale[1] + offset[1]).astype(np.intp)
+
+        # Skip dots that are entirely off the screen
+        margin = int(np.ceil(radius)) if radius >= 1 else 0
+        width, height = self._screen_size.tolist()
+        visible = (x >= -margin) & (x < width + margin) & (y >= -margin) & (y < height + margin)
+        if not visible.all():
+            x, y = x[visible], y[visible]
+            if colors.ndim == 2:
+                colors = colors[visible]
+        if len(x) == 0:
+            return
+
+        # Each dot is drawn with the index of its color in `mapped`. With one
+        # color for all of them, overlaps don't matter and every index is 0.
+        if colors.ndim == 2:
+            mapped = pygame.surfarray.map_array(self._screen, colors)
+            dots = np.arange(len(x), dtype=np.int32)
+        else:
+            mapped = pygame.surfarray.map_array(self._screen, colors[None])
+            dots = np.zeros(len(x), dtype=np.int32)
+
+        # Pixels covered by a dot, as the half width of the dot along one
+        # axis for each offset along the other
+        offsets = np.arange(-margin, margin + 1)
+        half_widths = np.floor(np.sqrt(np.maximum(max(radius, 0) ** 2 - offsets ** 2, 0))).astype(int)
+
+        # Only the pixels in the bounding box of the dots are touched. The
+        # pixel array is indexed by x and then y, so it is transposed to put
+        # it in memory order.
+        x0, x1 = max(x.min() - margin, 0), min(x.max() + margin + 1, width)
+        y0, y1 = max(y.min() - margin, 0), min(y.max() + margin + 1, height)
+        pixels = pygame.surfarray.pixels2d(self._screen)
+        region = pixels[x0:x1, y0:y1].T
+        mapped = mapped.astype(region.dtype)
+
+        if len(x) * (2 * half_widths + 1).sum() <= region.size:
+            self._stamp_dots(region, y - y0, x - x0, dots, mapped, offsets, half_widths, colors.ndim == 2)
+        else:
+            self._dilate_dots(region, y - y0, x - x0, dots, mapped, offsets, half_widths, colors.ndim == 2)
+        del region, pixels
+
+    def _stamp_dots(self, region, rows, cols, dots, mapped, offsets, half_widths, overlapping):
+        # Rasterize sparse dots for `draw_dots` by writing every pixel of
+        # every dot
+        col_offsets = np.concatenate([np.arange(-w, w + 1) for w in half_widths])
+        row_offsets = np.repeat(offsets, 2 * half_widths + 1)
+        rows = (rows[:, None] + row_offsets).ravel()
+        cols = (cols[:, None] + col_offsets).ravel()
+        dots = np.repeat(dots, len(row_offsets))
+        inside = (rows >= 0) & (rows < region.shape[0]) & (cols >= 0) & (cols < region.shape[1])
+        rows, cols, dots = rows[inside], cols[inside], dots[inside]
+
+        if overlapping:
+            # Where dots of different colors overlap, keep the last one, since
+            # the order of repeated writes to one pixel isn't defined
+            cover = np.full(region.shape, -1, dtype=np.int32)
+            _put_last(cover, (rows, cols), dots)
+            on_top = cover[rows, cols] == dots
+            rows, cols, dots = rows[on_top], cols[on_top], dots[on_top]
+
+        region[rows, cols] = mapped[dots]
+
+    def _dilate_dots(self, region, rows, cols, dots, mapped, offsets, half_widths, overlapping):
+        # Rasterize dense dots for `draw_dots`, with a cost that depends on
+        # the size of the region rather than the number of dots. The index of
+        # each dot is put at its center, and then spread over the disk of the
+        # dot with a maximum filter, so the last dot covering a pixel wins.
+        margin = len(offsets) // 2
+        cover = np.full((region.shape[0] + 2 * margin, region.shape[1] + 2 * margin), -1, dtype=np.int32)
+        if overlapping:
+            _put_last(cover, (rows + margin, cols + margin), dots)
+        else:
+            cover[rows + margin, cols + margin] = dots
+
+        # Maximum over runs of `2 w + 1` pixels along the columns, for each
+        # half width `w`
+        runs = [cover]
+        for _ in range(half_widths.max()):
+            previous = runs[-1]
+            run = np.empty_like(previous)
+            run[:, [0, -1]] = previous[:, [0, -1]]
+            np.maximum(previous[:, :-2], previous[:, 2:], out=run[:, 1:-1])
+            np.maximum(run[:, 1:-1], previous[:, 1:-1], out=run[:, 1:-1])
+            runs.append(run)
+
+        # The disk is the union of the runs at each offset along the rows
+        height, width = region.shape
+        covered = runs[half_widths[0]][:height, margin:margin + width].copy()
+        for offset, w in zip(offsets[1:], half_widths[1:]):
+            np.maximum(covered, runs[w][margin + offset:margin + offset + height, margin:margin + width], out=covered)
+
+        np.copyto(region, mapped[covered] if overlapping else mapped[0], where=covered >= 0)
+
+    def draw_polyline(self, points, color=(0, 0, 0), width=1, closed=False):
+        r'''Draw connected line segments through an array of points.
+
+        Args:
+            points: Array of shape ``(N, 2)`` of sim coordinates
+            color: RGB color of the line
+            width: Width of the line in pixels
+            closed: If True, also connect the last point to the first
+        '''
+        import pygame
+        if len(points) < 2:
+            return
+        draw_points = self.convert_to_draw_position(np.reshape(points, (-1, 2)))
+        pygame.draw.lines(self._screen, color, closed, draw_points.tolist(), width)
+
     def convert_to_draw_position(self, position):
         return self._screen_size // 2 + (position - self._screen_coord_center) * (self._screen_size / self._screen_coord_scale)
 
     def get_screen_coord_range(self):
         return np.abs(self._screen_coord_scale)
+
+def _put_last(cover, index, dots):
+    # Set `cover[index] = dots`, keeping the last of the increasing `dots`
+    # that land on the same element. Plain assignment does that in practice,
+    # but NumPy doesn't promise an order for repeated indices, so elements
+    # that didn't get it are fixed up with the much slower `np.maximum.at`.
+    cover[index] = dots
+    behind = cover[index] < dots
+    if behind.any():
+        np.maximum.at(cover, tuple(i[behind] for i in index), dots[behind])
+
+def final_state(trajectory):
+    r'''Sweep reduction that keeps the last recorded state of a run.'''
+    return trajectory[-1]
+
+def max_energy_drift(trajectory):
+    r'''Sweep reduction that gives the largest deviation of the total energy
+    from its initial value. The total energy is the last field of the state.
+    '''
+    return np.max(np.abs(trajectory[:, -1] - trajectory[0, -1]))
+
+def max_error(trajectory, reference):
+    r'''Get the largest absolute error of each field of a trajectory, against
+    a reference trajectory with records at the same times, like the exact one
+    given by ``run_headless(..., analytic=True)``.
+
+    Args:
+        trajectory: Array of shape ``(records, fields)``
+        reference: Array of the same shape
+
+    Returns:
+        Array of shape ``(fields,)``
+    '''
+    trajectory = np.asarray(trajectory, dtype=np.float64)
+    reference = np.asarray(reference, dtype=np.float64)
+    if trajectory.shape != reference.shape:
+        raise ValueError(
+            f'expected a reference of shape {trajectory.shape}, but got {reference.shape}')
+    return np.max(np.abs(trajectory - reference), axis=0, initial=0)
+
+def period(trajectory, field=1):
+    r'''Sweep reduction that estimates the period of an oscillation.
+
+    The period is the mean time between upward crossings of the mean value of
+    a field, with the crossing times found by linear interpolation. The time
+    is the first field of the state.
+
+    Args:
+        trajectory: Array of shape ``(records, fields)``
+        field: Index of the oscillating field
+
+    Returns:
+        The period, or NaN if there are fewer than two crossings
+    '''
+    t = trajectory[:, 0]
+    y = trajectory[:, field] - np.mean(trajectory[:, field])
+    crossings = np.nonzero((y[:-1] < 0) & (y[1:] >= 0))[0]
+    if len(crossings) < 2:
+        return np.nan
+    fraction = -y[crossings] / (y[crossings + 1] - y[crossings])
+    times = t[crossings] + fraction * (t[crossings + 1] - t[crossings])
+    return np.mean(np.diff(times))
+
+class _SweepReduceTask:
+    # Picklable callable that does one run of a sweep and reduces it
+    def __init__(self, sim_runner, reduce):
+        self.sim_runner = sim_runner
+        self.reduce = reduce
+
+    def __call__(self, task):
+        sim_cls, params, run_time, time_delta, record_every = task
+        return self.reduce(self.sim_runner.run_headless(
+            sim_cls(**params), run_time, time_delta=time_delta, record_every=record_every))
+
+# Worker process state for sweeps that keep full trajectories
+_sweep_worker = None
+
+def _init_sweep_worker(sim_runner, name, shape, dtype):
+    global _sweep_worker
+    shared = multiprocessing.shared_memory.SharedMemory(name=name)
+    # Keep `shared` alive for as long as the array that views its buffer
+    _sweep_worker = (sim_runner, shared, np.ndarray(shape, dtype=dtype, buffer=shared.buf))
+
+def _run_sweep_task(indexed_task):
+    sim_runner, _, results = _sweep_worker
+    _write_sweep_run(sim_runner, results, *indexed_task)
+
+def _write_sweep_run(sim_runner, results, index, task):
+    sim_cls, params, run_time, time_delta, record_every = task
+    states = sim_runner.run_headless(
+        sim_cls(**params), run_time, time_delta=time_delta, record_every=record_every)
+    results[index, :len(states)] = states
+    results[index, len(states):] = np.nan
+
+class _FrameWriter:
+    # Background thread that writes the frames of `SimRunner.render_headless`
+    def __init__(self, out, queue_size):
+        self._out = out
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._errors = []
+        self._raw_file = None if '%' in out else open(out, 'wb')
+        self._thread = threading.Thread(target=self._write_frames, name='frame writer', daemon=True)
+        self._thread.start()
+
+    def put(self, frame, pixels, size):
+        if self._errors:
+            raise self._errors[0]
+        self._queue.put((frame, pixels, size))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self._raw_file is not None:
+            self._raw_file.close()
+        if self._errors:
+            raise self._errors[0]
+
+    def _write_frames(self):
+        import pygame
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._errors:
+                continue
+
+            frame, pixels, size = item
+            try:
+                if self._raw_file is None:
+                    pygame.image.save(pygame.image.frombytes(pixels, size, 'RGB'), self._out % frame)
+                else:
+                    self._raw_file.write(pixels)
+            except BaseException as error:
+                # Keep draining the queue so that `put` doesn't block
+                self._errors.append(error)
+
+class _CheckpointWriter:
+    # Background thread that writes the checkpoints of
+    # `SimRunner.run_headless`. Only the newest checkpoint waiting to be
+    # written is kept, so `put` never blocks. Before each checkpoint is
+    # written, the trajectory file is flushed, so that the records the
+    # checkpoint counts are on disk by the time it is.
+    def __init__(self, path, states):
+        self._path = path
+        self._states = states
+        self._condition = threading.Condition()
+        self._pending = None
+        self._closed = False
+        self._errors = []
+        self._thread = threading.Thread(target=self._write_checkpoints, name='checkpoint writer', daemon=True)
+        self._thread.start()
+
+    def put(self, snapshot, **info):
+        if self._errors:
+            raise self._errors[0]
+        with self._condition:
+            self._pending = (snapshot, info)
+            self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def _write_checkpoints(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                snapshot, info = self._pending
+                self._pending = None
+
+            try:
+                self._states.flush()
+                save_checkpoint(self._path, snapshot, **info)
+            except BaseException as error:
+                self._errors.append(error)
+                return
+
+class _TerminalEvents:
+    # Keeps track of which members of the ensemble in
+    # `SimRunner.run_headless` have had a terminal event, from the values of
+    # the events' functions at each new record
+    def __init__(self, events, field_shapes, row):
+        self._events = events
+        self._field_shapes = field_shapes
+        self._values = [self._value(event, row) for event in events]
+        self._happened = False
+
+    def _value(self, event, row):
+        return event(split_fields(np.asarray(row, dtype=np.float64)[None], self._field_shapes))[0]
+
+    def update(self, row):
+        # Returns whether every member has had a terminal event
+        for i, event in enumerate(self._events):
+            value = self._value(event, row)
+            self._happened = self._happened | event.crossed(self._values[i], value)
+            self._values[i] = value
+        return bool(np.all(self._happened))
+
+class _CatchUpClock:
+    # Keeps track of how far the sim time is behind the wall clock in
+    # `SimRunner.run`. `t_sim` is the wall time that the sim has been stepped
+    # up to.
+    def __init__(self, time_delta, time_scale, max_catch_up_steps):
+        self.time_delta = time_delta
+        self.time_scale = time_scale
+        self.max_catch_up_steps = max_catch_up_steps
+        self.warned = False
+
+    def start(self, t):
+        self.t_sim = t
+
+    def steps_due(self, t, profiler):
+        # Get the number of steps needed to catch up to wall time `t`, and
+        # count them as taken
+        if self.t_sim >= t:
+            return 0
+
+        num_steps = int(np.ceil((t - self.t_sim) * self.time_scale / self.time_delta))
+
+        if self.max_catch_up_steps is not None and num_steps > self.max_catch_up_steps:
+            dropped = (num_steps - self.max_catch_up_steps) * self.time_delta / self.time_scale
+            self.t_sim += dropped
+            num_steps = self.max_catch_up_steps
+            if profiler is not None:
+                profiler.add_slowdown(dropped)
+            if not self.warned:
+                warnings.warn(
+                    'the sim is falling behind the wall clock, so it is running '
+                    'slower than real time')
+                self.warned = True
+
+        self.t_sim += num_steps * self.time_delta / self.time_scale
+        return num_steps
+
+def _snapshot(sim):
+    # Copy of `sim` that later steps don't change. Some sims, like
+    # `SpringLatticeSim`, step their arrays in place, so every array
+    # attribute is copied rather than shared with the sim.
+    snapshot = copy.copy(sim)
+    for name, value in vars(sim).items():
+        if isinstance(value, np.ndarray):
+            setattr(snapshot, name, value.copy())
+    return snapshot
+
+class _SnapshotRenderer:
+    # Copy of a sim that is drawn in place of it while it is stepped on
+    # another thread. It is only ever given the attributes of snapshots made
+    # with `_snapshot`, so it never shares arrays that the physics thread is
+    # writing to.
+    def __init__(self, sim):
+        self.sim = _snapshot(sim)
+        self._seen = dict(vars(sim))
+        self._interpolated = sim.interpolated()
+
+    def interpolate(self, snapshot0, snapshot1, alpha):
+        # Give the copy the state between two snapshots. Only attributes that
+        # were changed by the physics since the last frame are copied, so
+        # attributes that only `draw` changes, like frame counters, are kept.
+        for name, value in vars(snapshot1).items():
+            if self._seen.get(name) is not value:
+                self._seen[name] = value
+                setattr(self.sim, name, value)
+
+        # The attributes that the sim lists as interpolated are blended on
+        # every frame, since `alpha` moves on even when the snapshots don't
+        attrs0, attrs1 = vars(snapshot0), vars(snapshot1)
+        for name, period in self._interpolated.items():
+            value0, value1 = attrs0.get(name), attrs1.get(name)
+            if (value0 is None or value1 is None or value0 is value1
+                    or np.asarray(value1).dtype.kind != 'f'
+                    or np.shape(value0) != np.shape(value1)):
+                continue
+            difference = value1 - value0
+            if period is not None:
+                # Go the short way around, so an angle that wraps from pi to
+                # -pi isn't drawn sweeping back through 0
+                difference = (difference + period / 2) % period - period / 2
+            setattr(self.sim, name, value0 + alpha * difference)
+
+        return self.sim
+
+def _check_resume(info, checkpoint, sim, time_delta, record_every):
+    # Make sure that a run being resumed from a checkpoint is the same run
+    # that saved it
+    expected = {'sim': type(sim).__name__, 'time_delta': time_delta, 'record_every': record_every}
+    for name, value in expected.items():
+        if info.get(name) != value:
+            raise ValueError(
+                f'cannot resume from {checkpoint!r}, since it was saved by a run with '
+                f'{name}={info.get(name)!r}, but this run has {name}={value!r}')
+
+def _with_rates(sim):
+    # Get the state of `sim` followed by the rates of its fields, with NaN
+    # for the rates that aren't known
+    state = sim.state()
+    if state is None:
+        return None
+    rates = sim.rates() or [None] * len(state)
+    assert len(rates) == len(state), 'sim.rates() must have one entry per field of sim.state()'
+    return list(state) + [
+        np.full(np.shape(field), np.nan, dtype=np.result_type(field, 1.0)) if rate is None else np.broadcast_to(rate, np.shape(field))
+        for field, rate in zip(state, rates)]
+
+def _num_steps(run_time, time_delta):
+    # Round away floating point noise in the ratio, so that e.g. a run time of
+    # 0.3 with a time delta of 0.1 takes 3 steps rather than 4
+    return max(int(np.ceil(round(run_time / time_delta, 9))), 0)
+
+def _record_dtype(dtype):
+    # Initial states often hold Python ints, like `t=0`, so integer and boolean
+    # fields are widened to make room for the values produced later on
+    if dtype.kind in 'biu':
+        return np.dtype(np.float64)
+    return dtype
+
+def _state_row(state):
+    # Flatten the fields of `state` into one row of a trajectory
+    return np.concatenate([np.ravel(field) for field in state])
+
+def _row_converter(state):
+    # Rows of scalar fields can be assigned into a trajectory as they are,
+    # which is much faster than flattening them first
+    if all(np.ndim(field) == 0 for field in state):
+        return lambda state: state
+    return _state_row
+
+def _ensemble_state(state):
+    # Broadcast each field of `state` over the batch, giving a
+    # `(batch, fields)` array. Unbatched fields, like a shared `t`, are
+    # repeated across the batch.
+    fields = np.broadcast_arrays(*[np.asarray(field) for field in state])
+    return np.stack([field.reshape(-1) for field in fields], axis=-1)
+
+def _shrink_npy(path, num_rows):
+    # Rewrite the header of a 2D `.npy` file in place to hold only its first
+    # `num_rows` rows, and drop the data after them. The new header is never
+    # longer than the old one, so it is padded out to the same length.
+    array = np.load(path, mmap_mode='r')
+    offset = array.offset
+    row_nbytes = array.dtype.itemsize * array.shape[1]
+    header = {
+        'descr': np.lib.format.dtype_to_descr(array.dtype),
+        'fortran_order': False,
+        'shape': (num_rows, array.shape[1]),
+    }
+    del array
+
+    with open(path, 'r+b') as f:
+        major, _ = np.lib.format.read_magic(f)
+        header_len_size = 2 if major == 1 else 4
+        header_len = int.from_bytes(f.read(header_len_size), 'little')
+        f.write(repr(header).encode('latin1').ljust(header_len - 1) + b'\n')
+        f.truncate(offset + num_rows * row_nbytes)
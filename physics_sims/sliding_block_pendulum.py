@@ -1,28 +1,43 @@
 import physics_sims
 import numpy as np
+from physics_sims import backend
+
+@backend.kernel
+def calc_xdd(th, thd, m1, m2, R, g):
+    return np.sin(th) * (R * thd**2 + g * np.cos(th)) / ((m1 + m2) / m2 - np.cos(th)**2)
+
+@backend.kernel
+def calc_thdd(th, thd, m1, m2, R, g):
+    return (m2 * thd**2 * np.cos(th) + g * (m1 + m2) / R) * np.sin(th) / (m2 * np.cos(th)**2 - m1 - m2)
 
 class SlidingBlockPendulum(physics_sims.Sim):
-    def __init__(self):
-        self.t = 0
+    def __init__(self, t=0, x=-1.5, xd=0, th=np.pi / 2, thd=-0.8 * np.pi, m1=1, m2=1, R=3, g=9.8, *, dtype=np.float64):
+        self.t = t
 
-        self.x = -1.5
-        self.xd = 0
+        self.x = np.array(x, dtype=dtype)
+        self.xd = np.array(xd, dtype=dtype)
         self.xdd = 0
 
-        self.th = np.pi / 2
-        self.thd = -0.8 * np.pi
+        self.th = np.array(th, dtype=dtype)
+        self.thd = np.array(thd, dtype=dtype)
         self.thdd = 0
 
-        self.m1 = 1
-        self.m2 = 1
-        self.R = 3
-        self.g = 9.8
+        self.m1 = np.array(m1, dtype=dtype)
+        self.m2 = np.array(m2, dtype=dtype)
+        self.R = np.array(R, dtype=dtype)
+        self.g = np.array(g, dtype=dtype)
 
     def calc_xdd(self, th, thd):
-        return np.sin(th) * (self.R * thd**2 + self.g * np.cos(th)) / ((self.m1 + self.m2) / self.m2 - np.cos(th)**2)
+        return calc_xdd(th, thd, self.m1, self.m2, self.R, self.g)
 
     def calc_thdd(self, th, thd):
-        return (self.m2 * thd**2 * np.cos(th) + self.g * (self.m1 + self.m2) / self.R) * np.sin(th) / (self.m2 * np.cos(th)**2 - self.m1 - self.m2)
+        return calc_thdd(th, thd, self.m1, self.m2, self.R, self.g)
+
+    def calc_qdd(self, q, qd):
+        return np.array([
+            self.calc_xdd(q[1], qd[1]),
+            self.calc_thdd(q[1], qd[1]),
+        ])
     
     def update(self, sim_runner, dt):
         self.t, (self.x, self.th), (self.xd, self.thd) = physics_sims.integrators.runge_kutta_4th_order(
@@ -30,10 +45,19 @@ class SlidingBlockPendulum(physics_sims.Sim):
             self.t,
             np.array([self.x, self.th]),
             np.array([self.xd, self.thd]),
-            lambda _, q, qd: np.array([
-                self.calc_xdd(q[1], qd[1]),
-                self.calc_thdd(q[1], qd[1]),
-            ])
+            lambda _, q, qd: self.calc_qdd(q, qd)
+        )
+
+    # `x` and `th` are stepped together as one array, so the steps are always
+    # taken with NumPy, since the compiled loops only step scalar states
+    def advance(self, sim_runner, n, dt):
+        self.t, (self.x, self.th), (self.xd, self.thd) = physics_sims.integrators.runge_kutta_4th_order_n(
+            n,
+            dt,
+            self.t,
+            np.array([self.x, self.th]),
+            np.array([self.xd, self.thd]),
+            lambda _, q, qd: self.calc_qdd(q, qd)
         )
 
     def state(self):
@@ -55,11 +79,18 @@ class SlidingBlockPendulum(physics_sims.Sim):
 
         sim_runner.draw_dot([x_block, y_block])
         sim_runner.draw_dot([x_pendulum, y_pendulum])
-        print(self.state())
 
-trajectory = physics_sims.SimRunner().run(
-    SlidingBlockPendulum(),
-    time_delta=0.01,
-    time_scale=1)
+    def observables(self):
+        return {
+            't': lambda: self.t,
+            'energy': lambda: self.state()[3],
+        }
 
+    def interpolated(self):
+        return {'t': None, 'x': None, 'xd': None, 'th': 2 * np.pi, 'thd': None}
 
+if __name__ == '__main__':
+    physics_sims.SimRunner().run(
+        SlidingBlockPendulum(),
+        time_delta=0.01,
+        time_scale=1)
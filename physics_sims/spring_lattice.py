@@ -0,0 +1,287 @@
+import numpy as np
+from physics_sims import Sim, SimRunner, integrators
+
+# Particles connected by springs, like a chain, a periodic ring, or a 2D mesh.
+#
+# `x` and `v` have shape `(..., N, D)`, one row per particle in `D`
+# dimensions. Any leading axes are batch axes. `m` has shape `(N,)`.
+#
+# Springs are given by a neighbor table rather than a list of bonds, so
+# forces can be calculated with a gather instead of a scatter. Row `i` of
+# `neighbors`, of shape `(N, S)`, holds the indices of the particles that
+# particle `i` is connected to. Particles with fewer than `S` neighbors fill
+# the rest of their row with their own index and a stiffness of zero.
+# `offsets`, of shape `(N, S, D)`, is added to the separation of each pair,
+# which gives the wrap around distance for springs that cross the boundary of
+# a periodic lattice.
+class SpringLatticeSim(Sim):
+    def __init__(self, x, v, neighbors, *, m=1, k=1, R=1, offsets=None, scheme=None, compensated=False,
+                 dtype=np.float32):
+        self.t = 0
+        # Batch axes of either `x` or `v` apply to both
+        self.x, self.v = (np.array(a, dtype=dtype) for a in np.broadcast_arrays(x, v))
+        assert self.x.ndim >= 2
+
+        num_particles, dim = self.x.shape[-2:]
+        self.neighbors = np.asarray(neighbors, dtype=np.intp)
+        assert self.neighbors.ndim == 2 and self.neighbors.shape[0] == num_particles
+        slots_shape = self.neighbors.shape
+
+        self.m = np.broadcast_to(np.asarray(m, dtype=dtype), (num_particles,)).copy()
+        self.k = np.broadcast_to(np.asarray(k, dtype=dtype), slots_shape).copy()
+        self.R = np.broadcast_to(np.asarray(R, dtype=dtype), slots_shape).copy()
+        if offsets is None:
+            offsets = np.zeros(slots_shape + (dim,), dtype=dtype)
+        self.offsets = np.broadcast_to(np.asarray(offsets, dtype=dtype), slots_shape + (dim,)).copy()
+
+        # Empty slots point a particle at itself. Giving them an offset of the
+        # rest length means they are never stretched, so they give no force
+        # and never divide by a zero length.
+        empty = self.neighbors == np.arange(num_particles)[:, None]
+        self.k[empty] = 0
+        self.offsets[empty] = 0
+        self.offsets[empty, 0] = self.R[empty]
+        assert np.all(self.R[empty] > 0), 'empty slots need a positive rest length'
+
+        # Without a scheme, the sim steps with velocity Verlet. With one, it
+        # steps with `symplectic_composition`, where `v` plays the part of the
+        # momentum per unit mass.
+        self.scheme = scheme
+
+        # If compensated, steps add their increments to `t`, `x`, and `v`
+        # with compensated summation, which keeps long float32 runs about as
+        # accurate as float64 ones. These hold the rounding errors carried
+        # between steps.
+        self.compensated = compensated
+        self.t_error, self.x_error, self.v_error = (0, 0, 0) if compensated else (None, None, None)
+
+        # The neighbor table, stiffnesses, rest lengths, and offsets laid out
+        # the way `calc_a` works through them
+        self._tables = (
+            self.neighbors.T.copy(), self.k.T.copy(), self.R.T.copy(),
+            np.moveaxis(self.offsets, -1, 0).transpose(0, 2, 1).copy())
+
+        # Scratch arrays for `calc_a`, allocated on first use
+        self._buffers = None
+        self._a_buffers = None
+        # Stepper for velocity Verlet, made for the shape and dtype of the
+        # state on first use
+        self._stepper = None
+        self.a = self.calc_a(self.x).copy()
+
+    @classmethod
+    def chain(cls, num_particles, *, spacing=1, periodic=False, m=1, k=1, dim=1, **kwargs):
+        r'''Make a straight chain of particles, each joined to the next by a
+        spring at rest, along the first axis.
+
+        Args:
+            num_particles: Number of particles
+            spacing: Rest length of each spring
+            periodic: If True, join the ends of the chain into a ring, with
+                the last particle joined to the first one across the boundary
+            m: Mass of each particle
+            k: Stiffness of each spring
+            dim: Number of dimensions that the particles move in
+            **kwargs: Passed on to the constructor, like ``v`` or ``dtype``
+        '''
+        index = np.arange(num_particles)
+        neighbors = np.stack([index - 1, index + 1], axis=-1)
+        offsets = np.zeros((num_particles, 2, dim))
+
+        if periodic:
+            length = num_particles * spacing
+            offsets[0, 0, 0] = -length
+            offsets[-1, 1, 0] = length
+            neighbors %= num_particles
+        else:
+            neighbors[0, 0] = 0
+            neighbors[-1, 1] = num_particles - 1
+
+        x = np.zeros((num_particles, dim))
+        x[:, 0] = index * spacing
+        kwargs.setdefault('v', np.zeros_like(x))
+        return cls(x, neighbors=neighbors, m=m, k=k, R=spacing, offsets=offsets, **kwargs)
+
+    @classmethod
+    def mesh(cls, shape, *, spacing=1, periodic=False, m=1, k=1, **kwargs):
+        r'''Make a 2D square mesh of particles, each joined to its four
+        nearest neighbors by springs at rest.
+
+        Args:
+            shape: Number of particles along each axis, ``(rows, columns)``
+            spacing: Rest length of each spring
+            periodic: If True, wrap the mesh around both axes
+            m: Mass of each particle
+            k: Stiffness of each spring
+            **kwargs: Passed on to the constructor, like ``v`` or ``dtype``
+        '''
+        rows, cols = shape
+        row, col = np.meshgrid(np.arange(rows), np.arange(cols), indexing='ij')
+        steps = np.array([[-1, 0], [1, 0], [0, -1], [0, 1]])
+
+        neighbor_row = row[..., None] + steps[:, 0]
+        neighbor_col = col[..., None] + steps[:, 1]
+        offsets = np.zeros((rows, cols, 4, 2))
+
+        if periodic:
+            # Neighbors across the boundary are a whole mesh length away
+            offsets[..., 1] = spacing * rows * np.floor_divide(neighbor_row, rows)
+            offsets[..., 0] = spacing * cols * np.floor_divide(neighbor_col, cols)
+            neighbor_row %= rows
+            neighbor_col %= cols
+        else:
+            outside = (neighbor_row < 0) | (neighbor_row >= rows) | (neighbor_col < 0) | (neighbor_col >= cols)
+            neighbor_row = np.where(outside, row[..., None], neighbor_row)
+            neighbor_col = np.where(outside, col[..., None], neighbor_col)
+
+        neighbors = (neighbor_row * cols + neighbor_col).reshape(rows * cols, 4)
+        x = np.stack([col * spacing, row * spacing], axis=-1).reshape(rows * cols, 2)
+        kwargs.setdefault('v', np.zeros_like(x))
+        return cls(
+            x, neighbors=neighbors, m=m, k=k, R=spacing, offsets=offsets.reshape(rows * cols, 4, 2), **kwargs)
+
+    def calc_a(self, x, out=None):
+        # Gather the position of each particle's neighbors, and add up the
+        # spring forces along each separation. The work is done one dimension
+        # and one slot at a time on arrays laid out as `(..., S, N)`, which
+        # keeps every operation on contiguous rows of particles, and it is
+        # all done in scratch arrays, so no memory is allocated once they
+        # exist. The result is written into `out` if it is given. Otherwise,
+        # two arrays are kept for it, since velocity Verlet needs the
+        # acceleration from before the step while calculating the next one.
+        neighbors = self._tables[0]
+        slots_shape = x.shape[:-2] + neighbors.shape
+        if self._buffers is None or self._buffers[1].shape != slots_shape or self._buffers[1].dtype != x.dtype:
+            self._buffers = (
+                np.empty((x.shape[-1],) + slots_shape, dtype=x.dtype),
+                np.empty(slots_shape, dtype=x.dtype),
+                np.empty(slots_shape, dtype=x.dtype),
+                np.empty(x.shape[:-1], dtype=x.dtype))
+            self._a_buffers = [np.empty_like(x), np.empty_like(x)]
+        separation, length, scratch, x_d = self._buffers
+        neighbors, k, R, offsets = self._tables
+        if out is None:
+            a = self._a_buffers[0]
+            self._a_buffers.reverse()
+        else:
+            a = out
+
+        for d in range(x.shape[-1]):
+            # Taking from a strided component of `x` would allocate a copy
+            x_d[...] = x[..., d]
+            np.take(x_d, neighbors, axis=-1, out=separation[d], mode='clip')
+            np.subtract(separation[d], x_d[..., None, :], out=separation[d])
+            np.add(separation[d], offsets[d], out=separation[d])
+            if d == 0:
+                np.multiply(separation[d], separation[d], out=length)
+            else:
+                np.multiply(separation[d], separation[d], out=scratch)
+                np.add(length, scratch, out=length)
+        np.sqrt(length, out=length)
+
+        # Force per unit separation, `k (L - R) / L`
+        np.subtract(length, R, out=scratch)
+        np.multiply(scratch, k, out=scratch)
+        np.divide(scratch, length, out=scratch)
+
+        # The lengths aren't needed anymore, so their first slot holds each
+        # component of the force, since summing straight into the strided
+        # components of `a` would allocate
+        force = length[..., 0, :]
+        for d in range(x.shape[-1]):
+            np.multiply(separation[d], scratch, out=separation[d])
+            np.sum(separation[d], axis=-2, out=force)
+            a[..., d] = force
+        np.divide(a, self.m[:, None], out=a)
+        return a
+
+    def update(self, sim_runner, dt):
+        if self.scheme is None and not self.compensated:
+            self.t = self._velocity_verlet().step(dt, self.t, self.x, self.v, self.a, self._calc_a_txv)
+        elif self.scheme is None:
+            self._set_state(integrators.velocity_verlet(
+                dt, self.t, self.x, self.v, self.a,
+                lambda _, x, __: self.calc_a(x),
+                compensation=self._compensation()))
+        else:
+            self._set_state(integrators.symplectic_composition(
+                dt, self.t, self.x, self.v,
+                lambda v: v,
+                self.calc_a,
+                self.scheme,
+                compensation=self._compensation()))
+
+    def advance(self, sim_runner, n, dt):
+        if self.scheme is None and not self.compensated:
+            self.t = self._velocity_verlet().step_n(n, dt, self.t, self.x, self.v, self.a, self._calc_a_txv)
+        elif self.scheme is None:
+            self._set_state(integrators.velocity_verlet_n(
+                n, dt, self.t, self.x, self.v, self.a,
+                lambda _, x, __: self.calc_a(x),
+                compensation=self._compensation()))
+        else:
+            self._set_state(integrators.symplectic_composition_n(
+                n, dt, self.t, self.x, self.v,
+                lambda v: v,
+                self.calc_a,
+                self.scheme,
+                compensation=self._compensation()))
+
+    def _velocity_verlet(self):
+        # Velocity Verlet steps update the state in place, so nothing is
+        # allocated per step
+        if self._stepper is None or self._stepper.shape != self.x.shape or self._stepper.dtype != self.x.dtype:
+            self._stepper = integrators.VelocityVerlet(self.x.shape, self.x.dtype)
+        return self._stepper
+
+    def _calc_a_txv(self, t, x, v, out):
+        return self.calc_a(x, out)
+
+    def _compensation(self):
+        return (self.t_error, self.x_error, self.v_error) if self.compensated else None
+
+    def _set_state(self, result):
+        # Unpack the result of an integrator, which ends with the new
+        # rounding errors if the sim is compensated
+        if self.compensated:
+            *result, (self.t_error, self.x_error, self.v_error) = result
+        if self.scheme is None:
+            self.t, self.x, self.v, self.a = result
+        else:
+            self.t, self.x, self.v = result
+
+    def calc_kinetic(self):
+        return 0.5 * (self.m[:, None] * self.v**2).sum(axis=(-2, -1))
+
+    def calc_potential(self):
+        separation = np.take(self.x, self.neighbors, axis=-2) - self.x[..., None, :] + self.offsets
+        stretch = np.sqrt((separation**2).sum(axis=-1)) - self.R
+        # Each spring is in the neighbor table twice, once for each end
+        return 0.25 * (self.k * stretch**2).sum(axis=(-2, -1))
+
+    def draw(self, sim_runner):
+        positions = self.x if self.x.shape[-1] > 1 else np.concatenate([self.x, np.zeros_like(self.x)], axis=-1)
+        sim_runner.draw_dots(positions[..., :2].reshape(-1, 2))
+
+    def state(self):
+        kinetic = self.calc_kinetic()
+        potential = self.calc_potential()
+        return [self.t, kinetic, potential, kinetic + potential]
+
+    def observables(self):
+        return {
+            't': lambda: self.t,
+            'kinetic': self.calc_kinetic,
+            'potential': self.calc_potential,
+            'energy': lambda: self.calc_kinetic() + self.calc_potential(),
+        }
+
+    def interpolated(self):
+        return {'t': None, 'x': None, 'v': None}
+
+if __name__ == '__main__':
+    shape = (12, 12)
+    sim = SpringLatticeSim.mesh(shape, spacing=0.6, k=20, dtype=np.float64)
+    sim.x -= sim.x.mean(axis=0)
+    sim.v[0] = (3, 3)
+    SimRunner().run(sim=sim)
@@ -0,0 +1,151 @@
+import numpy as np
+
+# Fraction of a step that a trajectory can be evaluated at outside the span of
+# its records, to allow for rounding error in the recorded times
+END_TOLERANCE = 1e-3
+
+class Trajectory:
+    r'''A recorded trajectory that can be evaluated at any time within it.
+
+    Between each pair of records, every field is interpolated with the cubic
+    Hermite polynomial that matches its value and its rate of change at both
+    records. The rates are the ones given by :meth:`Sim.rates` when the
+    trajectory was recorded. Fields that the sim gives no rate for, like
+    energies, have their rates estimated from the neighboring records
+    instead.
+
+    This means a sim can be integrated at the largest stable step size, and
+    still be sampled as finely as needed::
+
+        trajectory = SimRunner().run_headless(sim, 10, time_delta=0.01, dense=True)
+        states = trajectory(np.linspace(0, 10, 100_000))
+
+    Args:
+        states: Array of shape ``(records, fields)``, like the ones given by
+            :meth:`SimRunner.run_headless`. The first field must be the time,
+            and the records must be in order of increasing time.
+        rates: Array of the same shape holding the rate of change of each
+            field, with NaN where it is not known. If not given, every rate is
+            estimated.
+        field_shapes: Shape of each entry of ``sim.state()`` that the
+            records were flattened from. If not given, each column is taken
+            to be a scalar field.
+    '''
+    def __init__(self, states, rates=None, field_shapes=None):
+        assert np.ndim(states) == 2
+        self.states = states
+        self.rates = np.full(np.shape(states), np.nan) if rates is None else rates
+        assert np.shape(self.rates) == np.shape(states)
+        self.field_shapes = [()] * np.shape(states)[1] if field_shapes is None else list(field_shapes)
+        assert sum(int(np.prod(shape)) for shape in self.field_shapes) == np.shape(states)[1]
+        self._slopes = None
+
+        # Times of the events found by `SimRunner.run_headless`, keyed by
+        # event name. See :func:`find_events`.
+        self.events = {}
+
+    @property
+    def t(self):
+        r'''The time of each record.'''
+        return self.states[:, 0]
+
+    def __len__(self):
+        return len(self.states)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.states, dtype=dtype)
+
+    def __call__(self, t):
+        r'''Evaluate the trajectory at the given times.
+
+        The recorded times are sums of step sizes, so they carry some
+        rounding error, and the last one often falls just short of the run
+        time. Times up to :data:`END_TOLERANCE` of a step outside the span of
+        the records are allowed, and are evaluated with the polynomial of
+        the step at that end.
+
+        Args:
+            t: Time or array of times, each within the span of the records
+
+        Returns:
+            Array of shape ``t.shape + (fields,)``
+        '''
+        t = np.asarray(t, dtype=np.float64)
+        times = np.asarray(self.t, dtype=np.float64)
+        query = t.reshape(-1)
+
+        if len(times) == 1:
+            lower, upper = times[0], times[0]
+        else:
+            lower = times[0] - END_TOLERANCE * (times[1] - times[0])
+            upper = times[-1] + END_TOLERANCE * (times[-1] - times[-2])
+        if np.any(query < lower) or np.any(query > upper):
+            raise ValueError(
+                f'expected times within [{times[0]}, {times[-1]}], but got some in '
+                f'[{query.min()}, {query.max()}]')
+
+        states = np.asarray(self.states, dtype=np.float64)
+        if len(times) == 1:
+            result = np.broadcast_to(states[0], (len(query), states.shape[1])).copy()
+        else:
+            slopes = self.slopes
+            i = np.clip(np.searchsorted(times, query, side='right') - 1, 0, len(times) - 2)
+            h = (times[i + 1] - times[i])[:, None]
+            s = (query - times[i])[:, None] / h
+            result = hermite(states[i], slopes[i], states[i + 1], slopes[i + 1], h, s)
+
+        # The time field is exact, rather than interpolated
+        result[:, 0] = query
+        return result.reshape(t.shape + (states.shape[1],))
+
+    def split_fields(self, rows):
+        r'''Split records back into the fields of ``sim.state()`` that they
+        were flattened from.
+
+        Args:
+            rows: Array of shape ``(..., fields)``
+
+        Returns:
+            List of arrays, one per field, of shape
+            ``rows.shape[:-1] + field_shape``
+        '''
+        return split_fields(rows, self.field_shapes)
+
+    @property
+    def slopes(self):
+        r'''The rate of change of each field at each record, with the ones
+        that are not known estimated from the neighboring records.
+        '''
+        if self._slopes is None:
+            states = np.asarray(self.states, dtype=np.float64)
+            rates = np.asarray(self.rates, dtype=np.float64)
+            unknown = np.isnan(rates)
+            if np.any(unknown):
+                estimates = np.gradient(states, states[:, 0], axis=0)
+                rates = np.where(unknown, estimates, rates)
+            self._slopes = rates
+        return self._slopes
+
+def split_fields(rows, field_shapes):
+    r'''Split records of shape ``(..., fields)`` into arrays of the given
+    field shapes. See :meth:`Trajectory.split_fields`.
+    '''
+    fields = []
+    start = 0
+    for shape in field_shapes:
+        size = int(np.prod(shape))
+        fields.append(rows[..., start:start + size].reshape(rows.shape[:-1] + tuple(shape)))
+        start += size
+    return fields
+
+def hermite(y0, m0, y1, m1, h, s):
+    r'''Evaluate the cubic Hermite polynomial that goes from ``y0`` with slope
+    ``m0`` to ``y1`` with slope ``m1`` over an interval of length ``h``, at
+    the fraction ``s`` of the way through the interval.
+    '''
+    s2 = s * s
+    h00 = (1 + 2 * s) * (1 - s)**2
+    h10 = s * (1 - s)**2
+    h01 = s2 * (3 - 2 * s)
+    h11 = s2 * (s - 1)
+    return h00 * y0 + h10 * h * m0 + h01 * y1 + h11 * h * m1
@@ -1,39 +1,79 @@
 import numpy as np
 from physics_sims import Sim, SimRunner, integrators
 
+# `x`, `v`, and `m` have shape `(..., 2, 1)`, one row per particle. `R` and
+# `k` have shape `(...)`. Any leading axes are batch axes.
 class TwoParticleSpring1DSim(Sim):
     def calc_a(self, x):
-        return self.k * (x[0] - x[1] + self.R) * np.array([[-1], [1]]) / self.m
+        stretch = x[..., 0:1, :] - x[..., 1:2, :] + self.R[..., None, None]
+        return self.k[..., None, None] * stretch * np.array([[-1], [1]]) / self.m
 
-    def __init__(self, *, dtype=np.float32):
+    def __init__(self, x=((-5,), (-2,)), v=((0.1,), (0,)), m=((0.5,), (0.5,)), R=1.5, k=20, *, dtype=np.float32):
         self.t = 0
-        self.x = np.array([[-5], [-2]], dtype=dtype)
-        self.v = np.array([[0.1], [0]], dtype=dtype)
-        self.m = np.array([[0.5], [0.5]], dtype=dtype)
-        self.R = np.array(1.5, dtype=dtype)
-        self.k = np.array(20, dtype=dtype)
+        self.x = np.array(x, dtype=dtype)
+        self.v = np.array(v, dtype=dtype)
+        self.m = np.array(m, dtype=dtype)
+        self.R = np.array(R, dtype=dtype)
+        self.k = np.array(k, dtype=dtype)
+        self.x, self.v = (
+            np.array(a) for a in np.broadcast_arrays(self.x, self.v, self.m, self.R[..., None, None], self.k[..., None, None])[:2])
 
         self.a = self.calc_a(self.x)
 
-        self.iters = 0
-
     def update(self, sim_runner, dt):
         self.t, self.x, self.v, self.a = integrators.velocity_verlet(
             dt, self.t, self.x, self.v, self.a,
             lambda _, x, __: self.calc_a(x))
 
+    def advance(self, sim_runner, n, dt):
+        self.t, self.x, self.v, self.a = integrators.velocity_verlet_n(
+            n, dt, self.t, self.x, self.v, self.a,
+            lambda _, x, __: self.calc_a(x))
+
+    def update_adaptive(self, sim_runner, dt, *, rtol, atol):
+        self.t, self.x, self.v, self.a, dt, dt_next = integrators.dormand_prince(
+            dt, self.t, self.x, self.v, self.a,
+            lambda _, x, __: self.calc_a(x),
+            rtol=rtol, atol=atol)
+        return dt, dt_next
+
     def draw(self, sim_runner):
-        sim_runner.draw_dot(np.array([self.x[0][0], 0]))
-        sim_runner.draw_dot(np.array([self.x[1][0], 0]))
+        # Every member of an ensemble is drawn on the same line
+        x = self.x[..., 0].reshape(-1)
+        sim_runner.draw_dots(np.stack([x, np.zeros_like(x)], axis=-1))
+
+    def calc_kinetic(self):
+        return (0.5 * self.m * self.v**2).sum(axis=(-2, -1))
+
+    def calc_potential(self):
+        return 0.5 * self.k * (self.x[..., 1, 0] - self.x[..., 0, 0] - self.R)**2
+
+    def state(self):
+        kinetic = self.calc_kinetic()
+        potential = self.calc_potential()
+        return [
+            self.t,
+            self.x[..., 0, 0], self.x[..., 1, 0],
+            self.v[..., 0, 0], self.v[..., 1, 0],
+            kinetic, potential, kinetic + potential]
 
-        kinetic = (0.5 * self.m * self.v**2).sum()
-        potential = 0.5 * self.k * ((self.x[1] - self.x[0] - self.R)**2).sum()
-        total = kinetic + potential
+    def rates(self):
+        return [
+            1,
+            self.v[..., 0, 0], self.v[..., 1, 0],
+            self.a[..., 0, 0], self.a[..., 1, 0],
+            None, None, None]
 
-        if self.iters % 1_000 == 0:
-            print(f'{self.t} {kinetic} {potential} {total}')
+    def observables(self):
+        return {
+            't': lambda: self.t,
+            'kinetic': self.calc_kinetic,
+            'potential': self.calc_potential,
+            'energy': lambda: self.calc_kinetic() + self.calc_potential(),
+        }
 
-        self.iters += 1
+    def interpolated(self):
+        return {'t': None, 'x': None, 'v': None}
 
 if __name__ == '__main__':
     SimRunner().run(sim=TwoParticleSpring1DSim())
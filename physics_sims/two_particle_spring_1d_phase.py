@@ -5,39 +5,82 @@ def calc_x_dot(p, m):
     return p / m
 
 def calc_p_dot(x, k, R):
-    return k * (x[0] - x[1] + R) * np.array([[-1], [1]])
+    stretch = x[..., 0:1, :] - x[..., 1:2, :] + R[..., None, None]
+    return k[..., None, None] * stretch * np.array([[-1], [1]])
 
+# `x`, `p`, and `m` have shape `(..., 2, 1)`, one row per particle. `R` and
+# `k` have shape `(...)`. Any leading axes are batch axes.
 class TwoParticleSpring1DPhaseSim(Sim):
-    def __init__(self, *, dtype=np.float32):
+    def __init__(self, x=((-5,), (-2,)), v=((0.1,), (0,)), m=((0.5,), (0.5,)), R=1.5, k=20, *, scheme=integrators.VERLET, dtype=np.float32):
         self.t = 0
-        self.x = np.array([[-5], [-2]], dtype=dtype)
-        v = np.array([[0.1], [0]], dtype=dtype)
-        self.m = np.array([[0.5], [0.5]], dtype=dtype)
+        self.x = np.array(x, dtype=dtype)
+        v = np.array(v, dtype=dtype)
+        self.m = np.array(m, dtype=dtype)
         self.p = self.m * v
-        self.R = np.array(1.5, dtype=dtype)
-        self.k = np.array(20, dtype=dtype)
+        self.R = np.array(R, dtype=dtype)
+        self.k = np.array(k, dtype=dtype)
+        self.x, self.p = (
+            np.array(a) for a in np.broadcast_arrays(self.x, self.p, self.R[..., None, None], self.k[..., None, None])[:2])
 
-        self.iters = 0
+        self.scheme = scheme
 
     def update(self, sim_runner, dt):
-        self.t, self.x, self.p = integrators.verlet_symplectic(
+        self.t, self.x, self.p = integrators.symplectic_composition(
             dt, self.t, self.x, self.p,
             lambda p: calc_x_dot(p, self.m),
-            lambda x: calc_p_dot(x, self.k, self.R))
+            lambda x: calc_p_dot(x, self.k, self.R),
+            self.scheme)
+
+    def advance(self, sim_runner, n, dt):
+        self.t, self.x, self.p = integrators.symplectic_composition_n(
+            n, dt, self.t, self.x, self.p,
+            lambda p: calc_x_dot(p, self.m),
+            lambda x: calc_p_dot(x, self.k, self.R),
+            self.scheme)
 
     def draw(self, sim_runner):
-        sim_runner.draw_dot(np.array([self.x[0][0], 0]))
-        sim_runner.draw_dot(np.array([self.x[1][0], 0]))
-        sim_runner.draw_dot([self.x[0][0], self.p[0][0]])
-        sim_runner.draw_dot([self.x[1][0], self.p[1][0]])
-
-        if self.iters % 1_000 == 0:
-            kinetic = (self.p**2 / (2 * self.m)).sum()
-            potential = 0.5 * self.k * ((self.x[1] - self.x[0] - self.R)**2).sum()
-            total = kinetic + potential
-            print(f'{self.t} {kinetic} {potential} {total}')
-
-        self.iters += 1
+        # Each particle is drawn on the line, and at its point in phase
+        # space, for every member of an ensemble
+        x = self.x[..., 0].reshape(-1)
+        p = self.p[..., 0].reshape(-1)
+        sim_runner.draw_dots(np.concatenate([
+            np.stack([x, np.zeros_like(x)], axis=-1),
+            np.stack([x, p], axis=-1)]))
+
+    def calc_kinetic(self):
+        return (self.p**2 / (2 * self.m)).sum(axis=(-2, -1))
+
+    def calc_potential(self):
+        return 0.5 * self.k * (self.x[..., 1, 0] - self.x[..., 0, 0] - self.R)**2
+
+    def state(self):
+        kinetic = self.calc_kinetic()
+        potential = self.calc_potential()
+        return [
+            self.t,
+            self.x[..., 0, 0], self.x[..., 1, 0],
+            self.p[..., 0, 0], self.p[..., 1, 0],
+            kinetic, potential, kinetic + potential]
+
+    def rates(self):
+        x_dot = calc_x_dot(self.p, self.m)
+        p_dot = calc_p_dot(self.x, self.k, self.R)
+        return [
+            1,
+            x_dot[..., 0, 0], x_dot[..., 1, 0],
+            p_dot[..., 0, 0], p_dot[..., 1, 0],
+            None, None, None]
+
+    def observables(self):
+        return {
+            't': lambda: self.t,
+            'kinetic': self.calc_kinetic,
+            'potential': self.calc_potential,
+            'energy': lambda: self.calc_kinetic() + self.calc_potential(),
+        }
+
+    def interpolated(self):
+        return {'t': None, 'x': None, 'p': None}
 
 if __name__ == '__main__':
     SimRunner().run(sim=TwoParticleSpring1DPhaseSim())
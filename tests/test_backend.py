@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+import physics_sims
+from physics_sims import SimRunner, get_sim
+
+pytest.importorskip('numba')
+
+# Sims that need more than their default arguments, mapped to functions that
+# make a small example of them
+FACTORIES = {
+    'SpringLatticeSim': lambda **kwargs: physics_sims.SpringLatticeSim.chain(
+        16, v=np.sin(np.arange(16))[:, None], **kwargs),
+}
+
+def make_sims():
+    # Yields `(name, sim factory)` for every registered sim in float64, which
+    # is the dtype that the compiled loops step
+    for name in sorted(physics_sims.SIMS):
+        make = FACTORIES.get(name, get_sim(name))
+        yield name, lambda make=make: make(dtype=np.float64)
+
+@pytest.fixture
+def restore_backend():
+    backend = physics_sims.get_backend()
+    yield
+    physics_sims.set_backend(backend)
+
+@pytest.mark.parametrize('name, make_sim', list(make_sims()))
+def test_backends_match(name, make_sim, restore_backend):
+    # Records are taken every few steps, so the multi-step integrators step
+    # between them
+    states = {}
+    for backend in ('numpy', 'numba'):
+        physics_sims.set_backend(backend)
+        states[backend] = SimRunner().run_headless(make_sim(), 1, time_delta=0.01, record_every=5)
+    np.testing.assert_array_equal(states['numba'], states['numpy'])
+
+# Sims that the compiled loops step, which are the ones with float64 scalar
+# states. Sims with array states fall back to NumPy.
+COMPILED = {
+    'ConstantForce1DSim', 'ConstantForceSR1DSim', 'Oscillator1DPhaseSim', 'Oscillator1DSRBoostSim',
+    'Oscillator1DSRPhaseSim', 'Oscillator1DSRSim', 'Oscillator1DSim', 'Pendulum2DPhaseSim', 'Pendulum2DSim',
+    'ScalarFieldSimple1DSim',
+}
+
+@pytest.mark.parametrize('name, make_sim', list(make_sims()))
+def test_compiled(name, make_sim, restore_backend, monkeypatch):
+    calls = []
+    monkeypatch.setattr(physics_sims.integrators, '_count_compiled_evaluations', calls.append)
+    physics_sims.set_backend('numba')
+    make_sim().advance(SimRunner(), 10, 0.01)
+    assert bool(calls) == (name in COMPILED)
@@ -0,0 +1,19 @@
+import numpy as np
+
+from physics_sims.chaos_maps import double_pendulum_chaos_map
+
+def test_workers_match():
+    # Tiles are independent, so spreading them over worker processes doesn't
+    # change the map, even when the grid doesn't divide into whole tiles
+    theta0 = np.linspace(-3, 3, 7)
+    theta1 = np.linspace(-3, 3, 5)
+    maps = [
+        double_pendulum_chaos_map(theta0, theta1, 2, time_delta=0.01, tile_size=8, workers=workers)
+        for workers in (1, 2)]
+    assert maps[0].shape == (7, 5)
+    for field in ('flip_time', 'lyapunov'):
+        assert np.array_equal(maps[0][field], maps[1][field], equal_nan=True)
+
+    # Released from near the top, some of the cells flip within the run
+    assert np.any(np.isfinite(maps[0]['flip_time']))
+    assert np.all(np.isfinite(maps[0]['lyapunov']))
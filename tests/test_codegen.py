@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+import physics_sims
+
+sympy = pytest.importorskip('sympy')
+from physics_sims import codegen
+
+def double_pendulum_lagrangian():
+    theta0, theta1, omega0, omega1 = sympy.symbols('theta0 theta1 omega0 omega1')
+    m0, m1, R0, R1, g = sympy.symbols('m0 m1 R0 R1 g')
+    x0, y0 = R0 * sympy.sin(theta0), -R0 * sympy.cos(theta0)
+    x1, y1 = x0 + R1 * sympy.sin(theta1), y0 - R1 * sympy.cos(theta1)
+    T = sum(
+        m / 2 * ((sympy.diff(x, theta0) * omega0 + sympy.diff(x, theta1) * omega1)**2
+                 + (sympy.diff(y, theta0) * omega0 + sympy.diff(y, theta1) * omega1)**2)
+        for m, x, y in [(m0, x0, y0), (m1, x1, y1)])
+    V = g * (m0 * y0 + m1 * y1)
+    return T - V, [theta0, theta1], [omega0, omega1], [m0, m1, R0, R1, g]
+
+@pytest.mark.parametrize('solve', ['symbolic', 'numeric'])
+def test_double_pendulum_matches_calc_alpha(solve, tmp_path):
+    rng = np.random.default_rng(0)
+    q = rng.uniform(-np.pi, np.pi, (1000, 2))
+    q_dot = rng.uniform(-2, 2, (1000, 2))
+    sim = physics_sims.DoublePendulum2DSim(theta=q, omega=q_dot, m=(1, 1.5), R=(2, 1), dtype=np.float64)
+
+    calc_alpha = codegen.lagrangian_acceleration(*double_pendulum_lagrangian(), solve=solve, cache_dir=tmp_path)
+    np.testing.assert_allclose(
+        calc_alpha(0, q, q_dot, 1.0, 1.5, 2.0, 1.0, sim.g), sim.calc_alpha(q, q_dot), rtol=0, atol=1e-9)
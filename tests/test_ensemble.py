@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from physics_sims import SimRunner, get_sim
+
+# Sims constructed with a batch of three in one argument, and every other
+# argument left unbatched
+BATCHED = [
+    ('ConstantForce1DSim', {'x': [0., 1., 2.]}),
+    ('ConstantForceSR1DSim', {'x': [0., 1., 2.]}),
+    ('Oscillator1DSim', {'x': [1., 2., 3.]}),
+    ('Oscillator1DSim', {'k': [1., 2., 3.]}),
+    ('Oscillator1DPhaseSim', {'x0': [1., 2., 3.]}),
+    ('Oscillator1DPhaseSim', {'k': [1., 2., 3.]}),
+    ('Oscillator1DSRSim', {'x': [1., 2., 3.]}),
+    ('Oscillator1DSRPhaseSim', {'m': [0.25, 0.5, 1.]}),
+    ('Oscillator1DSRBoostSim', {'v_boost': [-0.5, 0., 0.5]}),
+    ('Pendulum2DSim', {'theta': [1., 2., 3.]}),
+    ('Pendulum2DSim', {'R': [1., 2., 3.]}),
+    ('Pendulum2DPhaseSim', {'theta0': [1., 2., 3.]}),
+    ('Pendulum2DPhaseSim', {'g': [1., 2., 3.]}),
+    ('DoublePendulum2DSim', {'theta': [[1., 2.], [2., 3.], [3., 1.]]}),
+    ('DoublePendulum2DSim', {'g': [1., 2., 3.]}),
+    ('PendulumChain2DSim', {'theta': [[1., 2.], [2., 3.], [3., 1.]]}),
+    ('PendulumChain2DSim', {'g': [1., 2., 3.]}),
+    ('TwoParticleSpring1DSim', {'k': [10., 20., 30.]}),
+    ('TwoParticleSpring1DPhaseSim', {'k': [10., 20., 30.]}),
+]
+
+@pytest.mark.parametrize('name, kwargs', BATCHED)
+def test_batched_state_shape(name, kwargs):
+    # Every field that varies over the batch has the batch shape from the
+    # start, so every record has the same size
+    sim = get_sim(name)(**kwargs, dtype=np.float64)
+    sizes = [np.size(field) for field in sim.state()]
+    sim.update(None, 0.01)
+    assert [np.size(field) for field in sim.state()] == sizes
+
+@pytest.mark.parametrize('name, kwargs', BATCHED)
+def test_batched_run_headless(name, kwargs):
+    sim_cls = get_sim(name)
+    states = SimRunner().run_headless(sim_cls(**kwargs, dtype=np.float64), 0.1, time_delta=0.01)
+    assert states.shape[0] == 11
+
+    trajectory = SimRunner().run_headless(sim_cls(**kwargs, dtype=np.float64), 0.1, time_delta=0.01, dense=True)
+    np.testing.assert_array_equal(trajectory.states, states)
+
+@pytest.mark.parametrize('name, kwargs', BATCHED)
+def test_batched_matches_members(name, kwargs):
+    # Each member of a batch steps the same as a sim constructed with only
+    # that member's arguments
+    sim_cls = get_sim(name)
+    (arg, values), = kwargs.items()
+    batched = SimRunner().run_ensemble(sim_cls(**kwargs, dtype=np.float64), 0.1, time_delta=0.01)
+    for i, value in enumerate(values):
+        member = SimRunner().run_ensemble(sim_cls(**{arg: value}, dtype=np.float64), 0.1, time_delta=0.01)
+        np.testing.assert_allclose(batched[i], member[0], rtol=1e-12, atol=1e-12)
+
+@pytest.mark.parametrize('name', ['Pendulum2DSim', 'Pendulum2DPhaseSim'])
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_pendulum_dtype(name, dtype):
+    sim = get_sim(name)(dtype=dtype)
+    sim.update(None, 0.01)
+    for field in sim.state()[1:]:
+        assert np.asarray(field).dtype == dtype
+
+@pytest.mark.parametrize('name, kwargs', [
+    ('DoublePendulum2DSim', {'theta': [[1., 2.], [-1., -2.]]}),
+    ('TwoParticleSpring1DSim', {'x': [[[-5.], [-2.]], [[1.], [4.]]]}),
+    ('TwoParticleSpring1DPhaseSim', {'x': [[[-5.], [-2.]], [[1.], [4.]]]}),
+])
+def test_batched_draw(name, kwargs):
+    # Every member of the ensemble is drawn, not only the first
+    pytest.importorskip('pygame')
+    sim_cls = get_sim(name)
+    (arg, values), = kwargs.items()
+    batched = SimRunner().render_headless(sim_cls(**kwargs), 0, time_delta=0.01)[0]
+    for value in values:
+        member = SimRunner().render_headless(sim_cls(**{arg: value}), 0, time_delta=0.01)[0]
+        # Pixels drawn for this member are drawn for the ensemble too
+        drawn = np.any(member != member[0, 0], axis=-1)
+        assert drawn.any()
+        np.testing.assert_array_equal(batched[drawn], member[drawn])
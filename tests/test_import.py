@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+import time
+
+# Most milliseconds that `import physics_sims` can add to interpreter start up
+CAP_MS = 50
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run(code):
+    return subprocess.run(
+        [sys.executable, '-c', code], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+
+def best_time(code, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(code)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def test_import_is_light():
+    loaded = run('import sys, physics_sims; print(*sorted({"pygame", "numpy"} & set(sys.modules)))').split()
+    assert loaded == []
+
+def test_import_time():
+    import_ms = 1e3 * (best_time('import physics_sims') - best_time('pass'))
+    assert import_ms < CAP_MS
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from physics_sims import integrators
+
+def calc_acceleration(t, x, v):
+    return -4 * x - 0.1 * v
+
+def loop(integrator, n_steps, dt, state, *args):
+    for _ in range(n_steps):
+        state = integrator(dt, *state, *args)
+    return state
+
+def cases(x, v):
+    # `(multi-step integrator, single step integrator, state, arguments)`
+    a = calc_acceleration(0.0, x, v)
+    return [
+        (integrators.velocity_verlet_n, integrators.velocity_verlet, (0.0, x, v, a), (calc_acceleration,)),
+        (integrators.runge_kutta_4th_order_n, integrators.runge_kutta_4th_order, (0.0, x, v), (calc_acceleration,)),
+        (integrators.symplectic_composition_n, integrators.symplectic_composition, (0.0, x, v),
+         (lambda p: p, lambda q: -4 * q, integrators.VERLET)),
+    ]
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+@pytest.mark.parametrize('size', [3, 4096])
+def test_multi_step_matches_loop(dtype, size):
+    # Large array states are stepped in place by the integrator classes, which
+    # have to give the same results as the single step integrators
+    x = np.linspace(-1, 1, size, dtype=dtype)
+    v = np.zeros(size, dtype=dtype)
+    for multi_step, single_step, state, args in cases(x, v):
+        integrators.count_evaluations()
+        result = multi_step(25, 0.01, *state, *args, stride=5)
+        count = integrators.evaluation_count()
+        integrators.count_evaluations()
+        expected = loop(single_step, 25, 0.01, state, *args)
+        assert count == integrators.evaluation_count()
+        integrators.count_evaluations(False)
+
+        for value, expected_value in zip(result, expected):
+            assert np.result_type(value) == np.result_type(expected_value)
+            assert np.array_equal(value, expected_value)
+        t, x_records, v_records = result[-1]
+        assert np.array_equal(x_records[-1], expected[1])
+        # The arrays passed in aren't changed
+        assert np.array_equal(state[1], x)
+
+def test_promoted_state():
+    # An acceleration of a higher precision promotes a float32 state, which
+    # stepping in place can't do
+    x = np.linspace(-1, 1, 4096, dtype=np.float32)
+    v = np.zeros_like(x)
+    calc = lambda t, x, v: -4.0 * x.astype(np.float64)
+    result = integrators.runge_kutta_4th_order_n(10, 0.01, 0.0, x, v, calc)
+    expected = loop(integrators.runge_kutta_4th_order, 10, 0.01, (0.0, x, v), calc)
+    assert result[1].dtype == np.float64
+    assert np.array_equal(result[1], expected[1])
@@ -0,0 +1,32 @@
+import numpy as np
+
+from physics_sims import DoublePendulum2DSim, PendulumChain2DSim, SimRunner
+
+def random_kwargs(ensemble, seed=0):
+    rng = np.random.default_rng(seed)
+    return dict(
+        theta=rng.uniform(-np.pi, np.pi, (ensemble, 2)),
+        omega=rng.uniform(-2, 2, (ensemble, 2)),
+        m=rng.uniform(0.5, 2, (ensemble, 2)),
+        R=rng.uniform(0.5, 2, (ensemble, 2)),
+        dtype=np.float64)
+
+def test_two_links_match_double_pendulum():
+    # The run is short enough that the chaos of the double pendulum doesn't
+    # blow rounding differences up past the tolerance
+    kwargs = random_kwargs(100)
+    chain = PendulumChain2DSim(**kwargs)
+    double = DoublePendulum2DSim(**kwargs)
+    np.testing.assert_allclose(chain.alpha, double.alpha, rtol=0, atol=1e-12)
+
+    chain_states = SimRunner().run_ensemble(chain, 1, time_delta=1e-3)
+    double_states = SimRunner().run_ensemble(double, 1, time_delta=1e-3)
+    np.testing.assert_allclose(chain_states, double_states, rtol=0, atol=1e-9)
+
+def test_run_headless():
+    sim = PendulumChain2DSim(theta=np.full((4, 5), 1.0), dtype=np.float64)
+    trajectory = SimRunner().run_headless(sim, 0.1, time_delta=0.01, dense=True)
+    # t, 5 angles, 5 angular velocities, and 3 energies for each chain
+    assert trajectory.states.shape == (11, 1 + 4 * 13)
+    energy = trajectory.split_fields(trajectory.states)[-1]
+    np.testing.assert_allclose(energy, np.broadcast_to(energy[0], energy.shape), rtol=1e-6)
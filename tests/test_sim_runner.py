@@ -0,0 +1,190 @@
+import numpy as np
+import pytest
+
+from physics_sims import Event, Oscillator1DSim, Sim, SimRunner, final_state, max_energy_drift, period
+
+class Stopped(Sim):
+    # A sim whose run is over before it starts
+    def __init__(self):
+        self.t = 0
+
+    def update(self, sim_runner, dt):
+        self.t += dt
+
+    def update_adaptive(self, sim_runner, dt, *, rtol, atol):
+        self.t += dt
+        return dt, dt
+
+    def state(self):
+        return None
+
+def test_run_headless_stopped():
+    assert SimRunner().run_headless(Stopped(), 1, time_delta=0.1).shape == (0, 0)
+    assert SimRunner().run_headless(Stopped(), 1, time_delta=0.1, adaptive=True).shape == (0, 0)
+    assert SimRunner().run_headless(Stopped(), 1, time_delta=0.1, dense=True).shape == (0, 0)
+
+def test_iter_headless_stopped():
+    assert list(SimRunner().iter_headless(Stopped(), 1, time_delta=0.1)) == []
+
+def test_snapshot_unchanged_by_update():
+    # `SpringLatticeSim` steps its arrays in place, so the snapshots drawn by
+    # threaded runs have to hold copies of them
+    from physics_sims import SpringLatticeSim
+    from physics_sims.sim_runner import _snapshot
+
+    sim = SpringLatticeSim.chain(8, v=np.sin(np.arange(8))[:, None])
+    snapshot = _snapshot(sim)
+    before = {name: value.copy() for name, value in vars(snapshot).items() if isinstance(value, np.ndarray)}
+    sim.update(None, 0.01)
+    sim.advance(None, 3, 0.01)
+    for name, value in before.items():
+        np.testing.assert_array_equal(getattr(snapshot, name), value)
+    assert not np.array_equal(snapshot.x, sim.x)
+
+def test_adaptive_singularity():
+    # `ScalarFieldSimple1DSim` reaches the singularity at `m + k x = 0` a bit
+    # before t = 4.8, where the step size underflows. The run ends there,
+    # keeping its records.
+    from physics_sims import ScalarFieldSimple1DSim
+
+    with pytest.warns(UserWarning, match='underflowed'), np.errstate(all='ignore'):
+        states = SimRunner().run_headless(ScalarFieldSimple1DSim(), 6, time_delta=0.01, adaptive=True, record_every=7)
+    assert 4 < states[-1, 0] < 6
+    assert np.all(np.diff(states[:, 0]) > 0)
+
+class Spinner(Sim):
+    # A sim with an angle that wraps around, and a counter that shouldn't be
+    # blended
+    def __init__(self, theta):
+        self.theta = theta
+        self.count = 0.0
+
+    def interpolated(self):
+        return {'theta': 2 * np.pi}
+
+def test_interpolate_wraps_angles():
+    from physics_sims.sim_runner import _snapshot, _SnapshotRenderer
+
+    snapshot0 = _snapshot(Spinner(np.array([3.1, 1.0])))
+    snapshot1 = _snapshot(Spinner(np.array([-3.1, 2.0])))
+    snapshot1.count = 5.0
+    renderer = _SnapshotRenderer(snapshot0)
+
+    sim = renderer.interpolate(snapshot0, snapshot1, 0.5)
+    # Halfway along the short way from 3.1 to -3.1 is pi, not 0
+    np.testing.assert_allclose(np.abs(sim.theta), [np.pi, 1.5])
+    assert sim.count == 5.0
+
+    # The blend moves on with `alpha` even when the snapshots don't
+    sim = renderer.interpolate(snapshot0, snapshot1, 0.25)
+    np.testing.assert_allclose(sim.theta, [3.1 + 0.25 * (2 * np.pi - 6.2), 1.25])
+
+@pytest.mark.parametrize('radius', [0.5, 2, 5.5])
+def test_dot_rasterizers_agree(radius):
+    # `draw_dots` writes each pixel of sparse dots, and spreads dense ones
+    # with a maximum filter. Both have to draw later dots on top.
+    rng = np.random.default_rng(0)
+    num_dots = 500
+    margin = int(np.ceil(radius)) if radius >= 1 else 0
+    # Dots overlapping the edges, but none entirely outside the region,
+    # which `draw_dots` skips
+    rows = rng.integers(-margin, 40 + margin, num_dots)
+    cols = rng.integers(-margin, 60 + margin, num_dots)
+    dots = np.arange(num_dots, dtype=np.int32)
+    mapped = rng.integers(1, 2 ** 24, num_dots).astype(np.uint32)
+    offsets = np.arange(-margin, margin + 1)
+    half_widths = np.floor(np.sqrt(np.maximum(radius ** 2 - offsets ** 2, 0))).astype(int)
+
+    regions = []
+    for rasterize in [SimRunner._stamp_dots, SimRunner._dilate_dots]:
+        region = np.zeros((40, 60), dtype=np.uint32)
+        rasterize(SimRunner(), region, rows, cols, dots, mapped, offsets, half_widths, True)
+        regions.append(region)
+    np.testing.assert_array_equal(regions[0], regions[1])
+
+    # The pixel at the center of the last dot inside the region has its color
+    inside = np.flatnonzero((rows >= 0) & (rows < 40) & (cols >= 0) & (cols < 60))[-1]
+    assert regions[0][rows[inside], cols[inside]] == mapped[inside]
+    assert np.count_nonzero(regions[0]) > 0.1 * regions[0].size
+
+class Interrupted(Oscillator1DSim):
+    # An oscillator whose run is stopped part way through, like one that is
+    # killed, after its state has been recorded a number of times
+    def __init__(self, records=None):
+        super().__init__()
+        # Held in a list, which isn't part of the snapshot in a checkpoint
+        self.records_left = [records]
+
+    def state(self):
+        if self.records_left[0] is not None:
+            if self.records_left[0] == 0:
+                raise KeyboardInterrupt
+            self.records_left[0] -= 1
+        return super().state()
+
+def test_checkpoint_resume(tmp_path):
+    kwargs = dict(time_delta=0.01, record_every=5, checkpoint_every=50)
+    expected = SimRunner().run_headless(
+        Interrupted(), 10, out=tmp_path / 'expected.npy', checkpoint=tmp_path / 'expected.ckpt', **kwargs)
+
+    with pytest.raises(KeyboardInterrupt):
+        SimRunner().run_headless(
+            Interrupted(records=137), 10, out=tmp_path / 'states.npy', checkpoint=tmp_path / 'states.ckpt', **kwargs)
+    states = SimRunner().run_headless(
+        Interrupted(), 10, out=tmp_path / 'states.npy', checkpoint=tmp_path / 'states.ckpt', **kwargs)
+    assert np.array_equal(states, expected)
+
+def test_adaptive_t_eval():
+    # Steps are shortened to land on each time exactly
+    t_eval = np.linspace(0, 5, 21)
+    states = SimRunner().run_headless(
+        Oscillator1DSim(), 5, time_delta=0.1, adaptive=True, rtol=1e-9, atol=1e-12, t_eval=t_eval)
+    assert states.shape[0] == len(t_eval)
+    np.testing.assert_allclose(states[:, 0], t_eval, rtol=0, atol=1e-12)
+    exact = np.stack(Oscillator1DSim().solution(t_eval), axis=-1)
+    np.testing.assert_allclose(states, exact, atol=1e-7)
+
+def test_sweep_reductions():
+    grid = {'m': [0.25, 1.0], 'k': [1.0, 4.0]}
+    params, periods = SimRunner().sweep(Oscillator1DSim, grid, 15, time_delta=0.001, workers=1, reduce=period)
+    expected = [2 * np.pi * np.sqrt(p['m'] / p['k']) for p in params]
+    np.testing.assert_allclose(periods, expected, rtol=1e-3)
+
+    _, trajectories = SimRunner().sweep(Oscillator1DSim, grid, 1, time_delta=0.01, workers=1)
+    _, final = SimRunner().sweep(Oscillator1DSim, grid, 1, time_delta=0.01, workers=2, reduce=final_state)
+    assert np.array_equal(final, trajectories[:, -1])
+
+    _, drift = SimRunner().sweep(Oscillator1DSim, grid, 1, time_delta=0.01, workers=1, reduce=max_energy_drift)
+    np.testing.assert_allclose(drift, np.max(np.abs(trajectories[..., -1] - trajectories[:, :1, -1]), axis=1))
+    assert np.all(drift < 1e-3 * trajectories[:, 0, -1])
+
+def test_event_times():
+    # The turning points of `x = 2 cos(4 t)` are at multiples of pi / 4
+    trajectory = SimRunner().run_headless(
+        Oscillator1DSim(), 3, time_delta=0.001, events=Oscillator1DSim().events())
+    np.testing.assert_allclose(trajectory.events['turning_point'], np.pi / 4 * np.arange(1, 4), atol=1e-5)
+
+def test_terminal_event():
+    # The run stops at the first record after the oscillator first passes
+    # through 0, at t = pi / 8
+    crossing = Event(lambda t, x, *_: x, direction=-1, terminal=True)
+    trajectory = SimRunner().run_headless(
+        Oscillator1DSim(), 3, time_delta=0.001, record_every=20, events={'crossing': crossing})
+    np.testing.assert_allclose(trajectory.events['crossing'], [np.pi / 8], atol=1e-5)
+    assert np.pi / 8 < trajectory.t[-1] <= np.pi / 8 + 0.02 + 1e-9
+
+def test_analytic():
+    sim = Oscillator1DSim()
+    exact = SimRunner().run_headless(sim, 2, time_delta=0.001, record_every=100, analytic=True)
+    assert sim.t == 0
+    stepped = SimRunner().run_headless(sim, 2, time_delta=0.001, record_every=100)
+    assert exact.shape == stepped.shape
+    np.testing.assert_allclose(exact[:, 0], stepped[:, 0], atol=1e-12)
+    np.testing.assert_allclose(exact, stepped, atol=1e-3)
+
+    t_eval = np.array([0.0, 0.3, 1.7])
+    exact = SimRunner().run_headless(Oscillator1DSim(), 2, t_eval=t_eval, analytic=True)
+    np.testing.assert_allclose(exact[:, 1], 2 * np.cos(4 * t_eval))
+
+    with pytest.raises(ValueError):
+        SimRunner().run_headless(sim, 2, analytic=True, dense=True)
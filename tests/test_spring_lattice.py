@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from physics_sims import SpringLatticeSim
+
+def mode_frequency(num_particles, mode, k, m, time_delta, periods):
+    # Measure the angular frequency of one normal mode of a periodic chain,
+    # and give the one expected from the dispersion relation of a monatomic
+    # chain, `omega(q) = 2 sqrt(k / m) |sin(q a / 2)|`
+    q = 2 * np.pi * mode / num_particles
+    expected = 2 * np.sqrt(k / m) * abs(np.sin(q / 2))
+
+    sim = SpringLatticeSim.chain(num_particles, periodic=True, k=k, m=m, dtype=np.float64)
+    rest = sim.x.copy()
+    # A standing wave, so the displacement of particle 0 goes as cos(omega t)
+    sim.x = rest + 1e-3 * np.cos(q * np.arange(num_particles))[:, None]
+    sim.a = sim.calc_a(sim.x).copy()
+
+    num_steps = int(periods * 2 * np.pi / expected / time_delta)
+    t = np.arange(num_steps + 1) * time_delta
+    displacement = np.empty(num_steps + 1)
+    displacement[0] = sim.x[0, 0] - rest[0, 0]
+    for step in range(1, num_steps + 1):
+        sim.update(None, time_delta)
+        displacement[step] = sim.x[0, 0] - rest[0, 0]
+
+    # Interpolate the zero crossings, which are half a period apart
+    crossing = np.flatnonzero(np.sign(displacement[:-1]) != np.sign(displacement[1:]))
+    t0 = t[crossing] - displacement[crossing] * time_delta / (displacement[crossing + 1] - displacement[crossing])
+    measured = np.pi / np.mean(np.diff(t0))
+    return expected, measured
+
+@pytest.mark.parametrize('mode', [1, 2, 4, 7, 8])
+def test_phonon_dispersion(mode):
+    expected, measured = mode_frequency(16, mode, k=2.0, m=0.5, time_delta=1e-2, periods=5)
+    np.testing.assert_allclose(measured, expected, rtol=2e-4)
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from physics_sims import Oscillator1DSim, SimRunner
+
+def test_run_time_end():
+    # The recorded times fall short of the run time by rounding error, but
+    # the whole run time can still be sampled
+    sim = Oscillator1DSim()
+    trajectory = SimRunner().run_headless(sim, 10, time_delta=0.001, dense=True)
+    assert trajectory.t[-1] < 10
+
+    states = trajectory(np.linspace(0, 10, 100_000))
+    assert states[-1, 0] == 10
+    exact = np.stack(Oscillator1DSim().solution(np.array([10.])), axis=-1)[0]
+    np.testing.assert_allclose(states[-1], exact, atol=1e-3)
+    np.testing.assert_allclose(trajectory(10), trajectory(trajectory.t[-1]), atol=1e-10)
+
+def test_outside_span():
+    trajectory = SimRunner().run_headless(Oscillator1DSim(), 1, time_delta=0.01, dense=True)
+    with pytest.raises(ValueError):
+        trajectory(1.01)
+    with pytest.raises(ValueError):
+        trajectory(-0.001)